@@ -1,44 +1,57 @@
-import sqlite3
-import pandas as pd
 import gc
-from flask import Flask, render_template, request, redirect, url_for, jsonify
-from stock_predictor import predict_next_close
-from database import init_db, get_stock_data, get_company_info, popular_companies, get_portfolio_summary, simulate_trade, update_portfolio_value
-import yfinance as yf
+import os
+import gzip
+import json
+import time
+import hashlib
+from datetime import datetime, timezone
+from flask import Flask, render_template, request, redirect, url_for, jsonify, Response, stream_with_context, g
+import jobs
+import metrics
+import memory
+import model_cache
+import company_search
+import scheduler
+from model_config import current_version
+try:
+    import brotli  # Optional: smaller payloads for clients that accept br
+except ImportError:
+    brotli = None
+from database import init_db, get_stock_data, get_company_info, popular_companies, list_companies, get_search_rows, get_portfolio_summary, simulate_trade, store_predictions, get_latest_prediction, trade_predictions
 
 # Create Flask app with memory optimizations
 app = Flask(__name__)
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max request size
+MAX_BATCH_TICKERS = 500  # Full-universe runs go through the CLI: python stock_predictor.py --all
+API_MAX_AGE = 60             # Seconds clients may reuse /api/predict responses before revalidating
+STATIC_MAX_AGE = 31536000    # Fingerprinted static assets (?v=<mtime>) never change under the same URL
+COMPRESS_MIN_BYTES = 500     # Smaller bodies aren't worth the encoding overhead
+COMPRESSIBLE_TYPES = ('application/json', 'application/javascript', 'application/x-ndjson', 'text/')
 
 @app.route('/api/companies')
 def get_companies():
-    """API endpoint to get all companies for autocomplete with memory optimization"""
-    conn = sqlite3.connect('stocks.db')
+    """Search companies by ticker prefix or (fuzzy) name, ranked by market cap"""
+    query = request.args.get('q', '')
     try:
-        # Limit results to reduce memory usage
-        companies = pd.read_sql_query("""
-            SELECT ticker, company_name as name
-            FROM companies
-            LIMIT 100
-        """, conn)
-        result = companies.to_dict('records')
-    except Exception as e:
-        print(f"Error in get_companies: {e}")
-        result = []
-    finally:
-        conn.close()
-    return jsonify(result)
+        limit = int(request.args.get('limit', company_search.DEFAULT_LIMIT if query else company_search.MAX_LIMIT))
+    except ValueError:
+        return jsonify({'error': 'limit must be an integer'}), 400
+    if not company_search.is_loaded():
+        # Index failed to build at startup; fall back to the plain listing
+        return jsonify(list_companies(limit=min(limit, company_search.MAX_LIMIT)))
+    return jsonify(company_search.search(query, limit=limit))
 
 # Initialize database on startup
+metrics.start_memory_tracing()
 init_db()
+company_search.load_index(get_search_rows())
+# Startup objects (modules, search index) live forever; keep them out of every later collection
+gc.freeze()
 
 @app.route('/', methods=['GET', 'POST'])
 def index():
     """Render the home page or handle ticker submission."""
     companies = popular_companies()
-    # Rename company_name to name to match the template
-    for company in companies:
-        company['name'] = company.pop('company_name')
     
     # Get portfolio summary for display
     portfolio = get_portfolio_summary()
@@ -46,51 +59,216 @@ def index():
     return render_template('index.html', companies=companies, portfolio=portfolio)
 
 
+def _page_result(prediction, last_close, confidence, feature_importance, graph_data, trade_message):
+    """Shape a prediction (fresh or stored) the way main.html expects it."""
+    # Sort feature importance for display
+    feature_importance = dict(sorted(((name, float(value)) for name, value in feature_importance.items()),
+                                     key=lambda x: abs(x[1]), reverse=True))
+    return {
+        'prediction': float(prediction),
+        'last_close': float(last_close),
+        'direction': "rise" if prediction > last_close else "fall or stay the same",
+        'confidence': round(float(confidence) * 100, 2),
+        'feature_importance': feature_importance,
+        'graph_data': graph_data,
+        'trade_message': trade_message,
+    }
+
+def run_prediction(ticker, profile=False, trade=True):
+    """Background job: predict, store, simulate the trade (unless `trade` is off) and return everything the page needs."""
+    if profile:
+        with metrics.profiled(f"predict-{ticker}") as report:
+            result = run_prediction(ticker)
+        return dict(result, profile=report['path']) if result else None
+
+    # The ML stack (pandas, sklearn) loads on the first prediction, not at startup
+    from stock_predictor import predict_next_close
+    with metrics.span('prediction'):
+        result = predict_next_close(ticker)
+    if not result:
+        return None
+    prediction_data, last_close, confidence_score, feature_importance, graph_data = result
+
+    # Keep the result so later visitors are served from the predictions table
+    feature_importance = {name: float(value) for name, value in feature_importance.items()}
+    versions = store_predictions([{'ticker': ticker, 'prediction': prediction_data, 'last_close': last_close,
+                                   'confidence': confidence_score, 'feature_importance': feature_importance,
+                                   'graph_data': graph_data, 'model_version': current_version(ticker),
+                                   'bar_date': graph_data['historical']['dates'][-1] if graph_data['historical']['dates'] else None}])
+
+    # Simulate trade based on prediction; the stored row records it, so a later visit won't trade it again
+    if not trade:
+        trade_message = None  # Stored untraded: the first visit to /main trades it
+    elif versions:
+        trade_message = trade_predictions([(ticker, versions[0])])[0]
+    else:
+        trade_message = simulate_trade(ticker, prediction_data, confidence_score, last_close)
+
+    # Model fitting is the big allocator; collect here only if it pushed us over budget
+    memory.maybe_collect()
+
+    return _page_result(prediction_data, last_close, confidence_score, feature_importance, graph_data, trade_message)
+
 @app.route('/main', methods=['GET'])
 def main():
-    """Render the main page with stock prediction."""
+    """Render the main page with stock prediction; training runs in the background."""
     ticker = request.args.get('ticker')
-    print(ticker)
     if not ticker:
         return redirect(url_for('index'))
 
-    prediction = None
-    direction = None
-    error_message = None
     company_info = get_company_info(ticker)
-    print(company_info)
-    
-    if company_info:
-        result = predict_next_close(ticker)
-        if result:
-            prediction_data, last_close, confidence_score, feature_importance, graph_data = result
-            direction = "rise" if prediction_data > last_close else "fall or stay the same"
-            confidence_pct = round(confidence_score * 100, 2)
-            
-            # Sort feature importance for display
-            feature_importance = dict(sorted(feature_importance.items(), key=lambda x: abs(x[1]), reverse=True))
-            
-            # Simulate trade based on prediction
-            trade_message = simulate_trade(ticker, prediction_data, confidence_score, last_close)
-            update_portfolio_value()
-            
-            # Clean up memory after processing
-            gc.collect()
-        else:
-            error_message = f"Could not get prediction for {ticker}. Data might be unavailable."
-    else:
-        error_message = f"Invalid ticker symbol: {ticker}"
-    
-    return render_template('main.html', 
-                         prediction=prediction_data if not error_message else None,
-                         direction=direction, 
+    if not company_info:
+        return render_template('main.html', ticker=ticker, company=None, error=f"Invalid ticker symbol: {ticker}")
+
+    # Serve the precomputed prediction (one indexed lookup); only a miss falls back to a live job
+    key = ticker.upper()
+    stored = get_latest_prediction(key, model_version=current_version(key))
+    if stored is not None:
+        # Each stored prediction is traded at most once: the first visit trades one stored untraded
+        # (by the API or an untrading precompute run), later visits show that trade's message
+        trade_message = stored['trade_message']
+        if trade_message is None:
+            trade_message = trade_predictions([(key, stored['version'])])[0]
+        result = _page_result(stored['prediction'], stored['last_close'], stored['confidence'],
+                              stored['feature_importance'], stored['graph_data'], trade_message)
+        return _render_prediction(ticker, company_info, result)
+
+    # Otherwise serve a fresh finished result, or join (or start) the job for this ticker
+    job = jobs.latest(key)
+    if job is None:
+        try:
+            job = jobs.submit(key, run_prediction, key)
+        except jobs.QueueFullError:
+            response = app.make_response((render_template('main.html', ticker=ticker, company=company_info,
+                                                          error="The server is busy with other predictions. Please try again shortly."), 503))
+            response.headers['Retry-After'] = '10'
+            return response
+
+    if job['status'] in ('queued', 'running'):
+        return render_template('main.html', ticker=ticker, company=company_info, pending=True, job_id=job['id'])
+    if job['status'] == 'failed':
+        return render_template('main.html', ticker=ticker, company=company_info,
+                               error=f"Could not get prediction for {ticker}. Data might be unavailable.")
+
+    return _render_prediction(ticker, company_info, job['result'])
+
+def _render_prediction(ticker, company_info, result):
+    with metrics.span('render'):
+        return render_template('main.html', 
+                         prediction=result['prediction'],
+                         direction=result['direction'], 
                          ticker=ticker,
                          company=company_info,
-                         confidence=confidence_pct if not error_message else None,
-                         feature_importance=feature_importance if not error_message else None,
-                         graph_data=graph_data if not error_message else None,
-                         trade_message=trade_message if not error_message else None,
-                         error=error_message)
+                         confidence=result['confidence'],
+                         feature_importance=result['feature_importance'],
+                         graph_data=result['graph_data'],
+                         trade_message=result['trade_message'],
+                         error=None)
+
+@app.route('/api/jobs', methods=['POST'])
+def create_job():
+    """Queue a prediction job and return its ID for polling."""
+    payload = request.get_json(silent=True) or {}
+    ticker = (payload.get('ticker') or request.args.get('ticker') or '').strip().upper()
+    if not ticker or not get_company_info(ticker):
+        return jsonify({'error': f'Invalid ticker symbol: {ticker}'}), 400
+    try:
+        if payload.get('profile') and metrics.PROFILE_ENABLED:
+            # Profiled runs get their own key so they never hand back a cached, unprofiled result
+            job = jobs.submit(f"{ticker}:profile", run_prediction, ticker, True)
+        else:
+            job = jobs.submit(ticker, run_prediction, ticker)
+    except jobs.QueueFullError as e:
+        response = jsonify({'error': str(e)})
+        response.status_code = 503
+        response.headers['Retry-After'] = '10'
+        return response
+    return jsonify(job), 202, {'Location': url_for('job_status', job_id=job['id'])}
+
+@app.route('/api/jobs/<job_id>')
+def job_status(job_id):
+    """Poll a prediction job."""
+    job = jobs.get_job(job_id)
+    if job is None:
+        return jsonify({'error': 'Unknown or expired job'}), 404
+    return jsonify(job)
+
+def _prediction_etag(ticker, bar_date, model_version):
+    """Weak validator: the same bars and model always produce the same prediction (in any encoding)."""
+    return hashlib.sha1(f"{ticker}|{bar_date}|{model_version}".encode()).hexdigest()[:20]
+
+@app.route('/api/predict/<ticker>')
+def api_predict(ticker):
+    """Latest stored prediction as JSON, revalidated with ETag/Last-Modified; a miss queues a live job."""
+    key = ticker.strip().upper()
+    stored = get_latest_prediction(key, model_version=current_version(key))
+    if stored is None:
+        if not get_company_info(key):
+            return jsonify({'error': f'Invalid ticker symbol: {ticker}'}), 404
+        job = jobs.latest(key)
+        if job is not None and job['status'] == 'failed':
+            return jsonify({'error': f'Could not get prediction for {key}. Data might be unavailable.'}), 404
+        try:
+            # Reading a prediction never trades; /main and POST /api/jobs are the paths that do
+            job = jobs.submit(key, run_prediction, key, False, False)
+        except jobs.QueueFullError as e:
+            response = jsonify({'error': str(e)})
+            response.status_code = 503
+            response.headers['Retry-After'] = '10'
+            return response
+        # Poll the job, then ask again: its result lands in the predictions table
+        return jsonify({'status': job['status'], 'job': job}), 202, {
+            'Location': url_for('job_status', job_id=job['id']), 'Retry-After': '2'}
+
+    etag = _prediction_etag(key, stored['bar_date'], stored['model_version'])
+    last_modified = datetime.fromtimestamp(int(stored['computed_at']), timezone.utc)
+    # If-None-Match wins over If-Modified-Since; either way nothing is serialized for a 304
+    if request.if_none_match:
+        not_modified = request.if_none_match.contains_weak(etag)
+    else:
+        not_modified = request.if_modified_since is not None and request.if_modified_since >= last_modified
+    if not_modified:
+        response = Response(status=304)
+    else:
+        response = jsonify({
+            'ticker': key,
+            'prediction': stored['prediction'],
+            'last_close': stored['last_close'],
+            'direction': 'rise' if stored['prediction'] > stored['last_close'] else 'fall or stay the same',
+            'confidence': stored['confidence'],
+            'last_bar_date': stored['bar_date'],
+            'model_version': stored['model_version'],
+            'computed_at': last_modified.isoformat(),
+            'feature_importance': stored['feature_importance'],
+            'graph_data': stored['graph_data'],
+        })
+    response.set_etag(etag, weak=True)
+    response.last_modified = last_modified
+    response.cache_control.public = True
+    response.cache_control.max_age = API_MAX_AGE
+    return response
+
+@app.route('/api/predict/batch', methods=['GET', 'POST'])
+def predict_batch():
+    """Score many tickers and stream results back as NDJSON while they finish."""
+    if request.method == 'POST':
+        payload = request.get_json(silent=True) or {}
+        tickers = payload.get('tickers') or []
+    else:
+        tickers = request.args.get('tickers', '').split(',')
+    tickers = [t.strip().upper() for t in tickers if isinstance(t, str) and t.strip()]
+
+    if not tickers:
+        return jsonify({'error': 'No tickers supplied'}), 400
+    if len(tickers) > MAX_BATCH_TICKERS:
+        return jsonify({'error': f'At most {MAX_BATCH_TICKERS} tickers per request'}), 400
+
+    def generate():
+        from stock_predictor import predict_many
+        for result in predict_many(tickers):
+            yield json.dumps(result) + '\n'
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
 
 @app.route('/portfolio')
 def portfolio():
@@ -105,18 +283,133 @@ def get_logo(ticker):
     logo_url = f"https://logo.clearbit.com/{ticker.lower()}.com"
     return jsonify({'logo_url': logo_url})
 
+@app.route('/metrics')
+def prometheus_metrics():
+    """Prometheus scrape endpoint: stage and request latency histograms plus queue/cache state."""
+    queue = jobs.stats()
+    cache = model_cache.stats()
+    gauges = {
+        'stock_predictor_jobs_queued': queue['queued'],
+        'stock_predictor_jobs_workers': queue['workers'],
+        'stock_predictor_model_cache_models': cache['models'],
+        'stock_predictor_model_cache_bytes': cache['memory_bytes'],
+    }
+    counters = {f'stock_predictor_model_cache_{name}_total': cache[name]
+                for name in ('hits', 'disk_hits', 'misses', 'evictions')}
+    budget = memory.stats()
+    gauges['stock_predictor_rss_budget_bytes'] = budget['budget_bytes']
+    counters['stock_predictor_gc_budget_collections_total'] = budget['collections']
+    counters['stock_predictor_gc_budget_freed_bytes_total'] = budget['freed_bytes']
+    return Response(metrics.render(gauges, counters), mimetype='text/plain; version=0.0.4')
+
+@app.before_request
+def start_timer():
+    g.request_started = time.perf_counter()
+    scheduler.ensure_started()
+    # Opt-in profile of this one request (PROFILE_REQUESTS=1 and ?profile=1)
+    if metrics.PROFILE_ENABLED and request.args.get('profile') == '1':
+        g.profile = metrics.profiled(request.endpoint or 'request')
+        g.profile.__enter__()
+
+@app.teardown_request
+def stop_timer(error):
+    profile = g.pop('profile', None)
+    if profile is not None:
+        profile.__exit__(None, None, None)
+    started = g.pop('request_started', None)
+    if started is not None and request.endpoint != 'static':
+        metrics.observe('http_request_seconds', request.endpoint or 'unmatched', time.perf_counter() - started)
+
+_static_versions = {}
+
+@app.url_defaults
+def static_version(endpoint, values):
+    """Fingerprint url_for('static', ...) with the file's mtime so the URL changes on every deploy."""
+    if endpoint != 'static' or 'v' in values or 'filename' not in values:
+        return
+    filename = values['filename']
+    if filename not in _static_versions:
+        try:
+            _static_versions[filename] = int(os.path.getmtime(os.path.join(app.static_folder, filename)))
+        except OSError:
+            _static_versions[filename] = None
+    if _static_versions[filename] is not None:
+        values['v'] = _static_versions[filename]
+
+_static_encoded = {}  # (filename, encoding) -> (mtime, encoded bytes)
+
+def _encode(data, encoding, best=False):
+    if encoding == 'br':
+        return brotli.compress(data, quality=11 if best else 5)
+    return gzip.compress(data, compresslevel=9 if best else 6)
+
+def _encoded_static(filename, encoding):
+    """A static file's encoded bytes, compressed (at the highest level) once per file version."""
+    path = os.path.join(app.static_folder, filename)
+    mtime = os.path.getmtime(path)
+    cached = _static_encoded.get((filename, encoding))
+    if cached is None or cached[0] != mtime:
+        with open(path, 'rb') as f:
+            cached = (mtime, _encode(f.read(), encoding, best=True))
+        _static_encoded[(filename, encoding)] = cached
+    return cached[1]
+
+def _compress(response):
+    """gzip (or brotli, when installed) text and JSON bodies the client accepts; streams pass through.
+
+    Dynamic bodies are encoded per response. Static files are encoded once per mtime and then
+    served from memory; partial (206) and conditional (304) responses are left alone.
+    """
+    static = request.endpoint == 'static'
+    if (response.status_code != 200 or 'Content-Encoding' in response.headers
+            or not (response.mimetype or '').startswith(COMPRESSIBLE_TYPES)
+            or (response.is_streamed and not static)):
+        return response
+    response.vary.add('Accept-Encoding')
+    accepted = request.accept_encodings
+    encoding = 'br' if brotli is not None and accepted['br'] else 'gzip' if accepted['gzip'] else None
+    if encoding is None:
+        return response
+    if static:
+        if (response.content_length or 0) < COMPRESS_MIN_BYTES:
+            return response
+        try:
+            body = _encoded_static(request.view_args['filename'], encoding)
+        except OSError:
+            return response
+        response.close()  # Release send_file's open file; the encoded copy replaces it
+        response.direct_passthrough = False
+        response.set_data(body)
+    else:
+        data = response.get_data()
+        if len(data) < COMPRESS_MIN_BYTES:
+            return response
+        response.set_data(_encode(data, encoding))
+    response.headers['Content-Encoding'] = encoding
+    response.headers.pop('Accept-Ranges', None)  # Byte ranges would refer to the encoded body
+    # A strong ETag names exact bytes; the encoded body is only semantically the same
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+    return response
+
 @app.after_request
 def add_header(response):
-    # Cache static assets for 1 year
-    if 'static' in response.headers.get('Content-Type', ''):
-        response.cache_control.max_age = 31536000
+    if request.endpoint == 'static':
+        response.cache_control.no_cache = None  # send_file's default; the max-age below replaces it
         response.cache_control.public = True
-    return response
+        if request.args.get('v'):
+            # Fingerprinted URL: cache for a year and skip revalidation entirely
+            response.cache_control.max_age = STATIC_MAX_AGE
+            response.cache_control.immutable = True
+        else:
+            response.cache_control.max_age = 3600
+    return _compress(response)
 
 @app.teardown_appcontext
 def cleanup(error):
-    """Clean up memory after each request"""
-    gc.collect()
+    """Collect garbage only when the process is over its RSS budget (a cheap /proc read otherwise)"""
+    memory.maybe_collect()
 
 if __name__ == '__main__':
     app.run(debug=True)
\ No newline at end of file
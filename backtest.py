@@ -0,0 +1,236 @@
+import os
+import csv
+import sys
+import time
+import logging
+import argparse
+import multiprocessing
+from datetime import date, timedelta
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+from sklearn.ensemble import RandomForestRegressor
+
+import price_store
+from stock_predictor import MODEL_PARAMS, build_features_many
+
+logger = logging.getLogger(__name__)
+
+# Walk-forward replay of the live predictor plus the simulate_trade rule over history
+WINDOW_BARS = 240        # Feature rows the live predictor trains on (1 calendar year minus indicator warm-up)
+RETRAIN_EVERY = 21       # Refit monthly; days in between reuse the last fitted model
+INITIAL_CASH = 10000.0
+CONFIDENCE_THRESHOLD = 0.6
+MAX_TRADE = 1000.0       # Buy min($1000, 10% of cash)
+TRADE_FRACTION = 0.1
+SELL_FRACTION = 0.5      # Sell half the position on a down signal
+TRADING_DAYS = 252
+
+
+def walk_forward(X, y, window=WINDOW_BARS, retrain_every=RETRAIN_EVERY, params=None):
+    """Predictions and confidence scores for every bar, refitting on a rolling window like the live predictor.
+
+    At each refit day r the forest is trained exactly as predict_next_close would on day r
+    (first n_train rows of the window, the rest held out). The model then serves days
+    r..r+retrain_every-1, and each day's confidence is 1 - MAE/mean over its last 20
+    out-of-sample predictions, as in the live confidence score.
+    """
+    params = params or MODEL_PARAMS
+    n = len(y)
+    predictions = np.full(n, np.nan)
+    confidence = np.full(n, np.nan)
+    n_test = int(np.ceil(min(0.2, 50 / window) * window))
+    n_train = window - n_test
+    recent = min(20, n_test)
+
+    for r in range(window - 1, n, retrain_every):
+        start = r - window + 1
+        model = RandomForestRegressor(**params)
+        model.fit(X[start:start + n_train], y[start:start + n_train])
+
+        stop = min(r + retrain_every, n)
+        scored = slice(r - recent + 1, stop)  # Held-out tail of the window plus the days this model serves
+        predicted = model.predict(X[scored])
+        predictions[r:stop] = predicted[recent - 1:]
+        mae = sliding_window_view(np.abs(predicted - y[scored]), recent).mean(axis=1)
+        level = sliding_window_view(y[scored], recent).mean(axis=1)
+        confidence[r:stop] = np.maximum(0.1, 1.0 - mae / level)
+    return predictions, confidence
+
+
+def _walk_forward_task(ticker, X, y, dates, window, retrain_every, params):
+    predictions, confidence = walk_forward(X, y, window, retrain_every, params)
+    return ticker, dates, y, predictions, confidence
+
+
+def _buy_amounts(cash, count):
+    """Cash spent by `count` consecutive buys of min($1000, 10% of cash), in closed form."""
+    j = np.arange(count)
+    # Buys capped at $1000 while cash stays >= $10,000, then each spends 10% of what's left
+    capped = int((cash - MAX_TRADE / TRADE_FRACTION) // MAX_TRADE) + 1 if cash >= MAX_TRADE / TRADE_FRACTION else 0
+    remaining = cash - MAX_TRADE * min(capped, count)
+    return np.where(j < capped, MAX_TRADE,
+                    TRADE_FRACTION * remaining * (1 - TRADE_FRACTION) ** np.maximum(j - capped, 0))
+
+
+def _forward_fill(values):
+    """Carry the last finite value forward along each row."""
+    idx = np.where(np.isfinite(values), np.arange(values.shape[1]), 0)
+    np.maximum.accumulate(idx, axis=1, out=idx)
+    return values[np.arange(values.shape[0])[:, None], idx]
+
+
+def simulate(close, predictions, confidence, initial_cash=INITIAL_CASH):
+    """Apply the simulate_trade rule to a tickers x days panel with one shared cash balance.
+
+    Positions, cash and P&L are updated with array operations across tickers for each day.
+    Sells settle before buys within a day, and buys are filled in ticker order.
+    """
+    tickers, days = close.shape
+    marks = _forward_fill(close)
+    shares = np.zeros(tickers)
+    cashflow = np.zeros(tickers)
+    equity = np.empty(days)
+    traded = np.zeros(days)
+    buys = sells = 0
+    cash = float(initial_cash)
+
+    with np.errstate(invalid='ignore'):
+        signal = np.isfinite(close) & np.isfinite(predictions) & (confidence > CONFIDENCE_THRESHOLD)
+        up = signal & (predictions > close)
+        down = signal & (predictions < close)
+
+    for d in range(days):
+        price = close[:, d]
+
+        sell = np.flatnonzero(down[:, d] & (shares > 0))
+        if sell.size:
+            proceeds = shares[sell] * SELL_FRACTION * price[sell]
+            shares[sell] *= 1 - SELL_FRACTION
+            cashflow[sell] += proceeds
+            cash += proceeds.sum()
+            traded[d] += proceeds.sum()
+            sells += sell.size
+
+        buy = np.flatnonzero(up[:, d])
+        if buy.size:
+            amounts = _buy_amounts(cash, buy.size)
+            shares[buy] += amounts / price[buy]
+            cashflow[buy] -= amounts
+            cash -= amounts.sum()
+            traded[d] += amounts.sum()
+            buys += buy.size
+
+        equity[d] = cash + np.dot(shares, np.nan_to_num(marks[:, d]))
+
+    running_max = np.maximum.accumulate(equity)
+    drawdown = equity / running_max - 1
+    years = max(days / TRADING_DAYS, 1 / TRADING_DAYS)
+    return {
+        'equity': equity,
+        'drawdown': drawdown,
+        'max_drawdown': float(drawdown.min()) if days else 0.0,
+        'total_return': float(equity[-1] / initial_cash - 1) if days else 0.0,
+        'turnover': float(traded.sum() / equity.mean() / years) if days else 0.0,  # Annualized
+        'traded': traded,
+        'buys': buys,
+        'sells': sells,
+        'cash': cash,
+        'pnl': cashflow + shares * np.nan_to_num(marks[:, -1]) if days else cashflow,
+    }
+
+
+def align(series):
+    """Stack per-ticker (dates, close, predictions, confidence) onto one shared calendar."""
+    calendar = np.unique(np.concatenate([dates for _, dates, *_ in series]))
+    shape = (len(series), len(calendar))
+    close, predictions, confidence = np.full(shape, np.nan), np.full(shape, np.nan), np.full(shape, np.nan)
+    for row, (_, dates, y, predicted, conf) in enumerate(series):
+        cols = np.searchsorted(calendar, dates)
+        close[row, cols] = y
+        predictions[row, cols] = predicted
+        confidence[row, cols] = conf
+    return calendar, close, predictions, confidence
+
+
+def run_backtest(tickers, years=5, window=WINDOW_BARS, retrain_every=RETRAIN_EVERY, params=None,
+                 max_workers=None, initial_cash=INITIAL_CASH):
+    """Backtest the predictor-driven strategy over `years` of daily bars for many tickers."""
+    tickers = list(dict.fromkeys(t.strip().upper() for t in tickers if t and t.strip()))
+    max_workers = max_workers or os.cpu_count() or 1
+    # Extra history so the first trading day already has a full training window
+    days = int(years * 365 + window * 365 / TRADING_DAYS) + 30
+    price_store.backfill(tickers, date.today() - timedelta(days=days))
+    features = build_features_many(price_store.load_columns_many(tickers, days=days))
+
+    series = []
+    pool = ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context('spawn'))
+    try:
+        futures = [pool.submit(_walk_forward_task, ticker, X, y, dates, window, retrain_every, params)
+                   for ticker, (X, y, dates) in features.items() if len(y) > window]
+        for future in as_completed(futures):
+            series.append(future.result())
+    finally:
+        pool.shutdown(wait=True, cancel_futures=True)
+
+    if not series:
+        return None
+    series.sort(key=lambda item: tickers.index(item[0]))  # Fill buys in the caller's ticker order
+    calendar, close, predictions, confidence = align(series)
+    # Trade only over the requested span; earlier bars exist just to train the first models
+    first = max(0, len(calendar) - int(years * TRADING_DAYS))
+    result = simulate(close[:, first:], predictions[:, first:], confidence[:, first:], initial_cash)
+    result['dates'] = calendar[first:]
+    result['tickers'] = [ticker for ticker, *_ in series]
+    return result
+
+
+def top_tickers(count, path='static/companies.csv'):
+    """The `count` largest companies by market cap."""
+    with open(path, newline='', encoding='utf-8') as f:
+        rows = [(float(row['market_cap'] or 0), row['ticker']) for row in csv.DictReader(f) if row.get('ticker')]
+    return [ticker for _, ticker in sorted(rows, reverse=True)[:count]]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Walk-forward backtest of the prediction-driven trading rule.')
+    parser.add_argument('tickers', nargs='*', help='Ticker symbols (default: --top 50)')
+    parser.add_argument('--top', type=int, default=None, help='Use the N largest companies by market cap')
+    parser.add_argument('--years', type=float, default=5)
+    parser.add_argument('--retrain-every', type=int, default=RETRAIN_EVERY)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--out', help='Write date,equity,drawdown,traded rows to this CSV')
+    args = parser.parse_args(argv)
+
+    tickers = list(args.tickers) or top_tickers(args.top or 50)
+    if args.top and args.tickers:
+        tickers += top_tickers(args.top)
+
+    started = time.perf_counter()
+    result = run_backtest(tickers, years=args.years, retrain_every=args.retrain_every, max_workers=args.workers)
+    if result is None:
+        print("No ticker had enough history to backtest.")
+        return 1
+
+    print(f"Tickers: {len(result['tickers'])}, days: {len(result['dates'])}, "
+          f"elapsed: {time.perf_counter() - started:.1f}s")
+    print(f"Final equity: ${result['equity'][-1]:,.2f} ({result['total_return']:+.2%})")
+    print(f"Max drawdown: {result['max_drawdown']:.2%}")
+    print(f"Annual turnover: {result['turnover']:.2f}x, buys: {result['buys']}, sells: {result['sells']}")
+    best = np.argsort(result['pnl'])[::-1][:5]
+    print("Top P&L: " + ", ".join(f"{result['tickers'][i]} ${result['pnl'][i]:,.0f}" for i in best))
+
+    if args.out:
+        with open(args.out, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(['date', 'equity', 'drawdown', 'traded'])
+            for row in zip(np.datetime_as_string(result['dates'], unit='D'), result['equity'],
+                           result['drawdown'], result['traded']):
+                writer.writerow(row)
+    return 0
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.WARNING)
+    sys.exit(main())
@@ -0,0 +1,82 @@
+"""Benchmark: SQLite rows -> DataFrame vs memory-mapped column files for the training read path.
+
+Usage: python benchmarks/bench_columns.py [--tickers 200] [--years 10] [--days 365] [--repeat 20]
+
+Stores synthetic daily bars in a scratch price store, then times loading `--days` of
+features for a single ticker and for the whole universe both ways, and reports peak
+traced allocations (tracemalloc; page-cache-backed memmap pages are not allocations).
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import price_store  # noqa: E402
+from fixtures import synthetic_frames, timed  # noqa: E402
+from stock_predictor import build_features, build_features_many  # noqa: E402
+
+
+def populate(tickers, years):
+    symbols = [f"T{i:04d}" for i in range(tickers)]
+    for symbol, frame in synthetic_frames(symbols, days=int(years * 252)).items():
+        price_store.store_bars(symbol, frame)
+    return symbols
+
+
+def measure(func, repeat):
+    func()  # Warm: builds column files / fills the page cache
+    elapsed = timed(func, repeat)
+    tracemalloc.start()
+    func()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return elapsed, peak / 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--tickers', type=int, default=200)
+    parser.add_argument('--years', type=float, default=10)
+    parser.add_argument('--days', type=int, default=price_store.HISTORY_DAYS, help='Calendar days to load')
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        price_store.PRICE_DB = os.path.join(tmp, 'prices.db')
+        price_store.COLUMNS_DIR = os.path.join(tmp, 'columns')
+        started = time.perf_counter()
+        symbols = populate(args.tickers, args.years)
+        print(f"Stored {args.tickers} tickers x {args.years:g} years in {time.perf_counter() - started:.1f}s")
+
+        one = symbols[0]
+        cases = [
+            ('1 ticker, sqlite', lambda: build_features(price_store.load_prices(one, args.days, refresh_first=False))),
+            ('1 ticker, columns', lambda: build_features(price_store.load_columns(one, args.days, refresh_first=False))),
+            (f'{len(symbols)} tickers, sqlite',
+             lambda: build_features_many(price_store.load_many(symbols, args.days, refresh_first=False))),
+            (f'{len(symbols)} tickers, columns',
+             lambda: build_features_many(price_store.load_columns_many(symbols, args.days, refresh_first=False))),
+        ]
+        results = {}
+        for label, func in cases:
+            results[label] = func()
+            elapsed, peak = measure(func, args.repeat if 'ticker,' in label else max(3, args.repeat // 4))
+            print(f"  {label:<22} {elapsed:9.2f} ms   peak alloc {peak:8.2f} MB")
+
+        single = [results['1 ticker, sqlite'], results['1 ticker, columns']]
+        many = [results[f'{len(symbols)} tickers, sqlite'], results[f'{len(symbols)} tickers, columns']]
+        same = all(np.array_equal(a, b) for a, b in zip(*single)) and all(
+            all(np.array_equal(a, b) for a, b in zip(many[0][t], many[1][t])) for t in symbols)
+        print(f"  identical features: {'yes' if same else 'NO'}")
+    sys.exit(0 if same else 1)
+
+
+if __name__ == '__main__':
+    main()
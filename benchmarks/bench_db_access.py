@@ -0,0 +1,107 @@
+"""Microbenchmark: connect-per-call + pandas lookups vs the pooled data-access layer.
+
+Usage: python benchmarks/bench_db_access.py [--repeat 500]
+
+Runs against a scratch copy of the database built from static/ in a temp directory.
+"""
+import argparse
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+# --- The previous implementations: a new connection and a DataFrame per lookup ---
+
+def legacy_get_company_info(ticker):
+    conn = sqlite3.connect('stocks.db')
+    try:
+        df = pd.read_sql_query("SELECT ticker, company_name, industry, sector FROM companies WHERE ticker = ? COLLATE NOCASE",
+                               conn, params=(ticker,))
+        return df.to_dict('records')[0] if not df.empty else None
+    finally:
+        conn.close()
+
+
+def legacy_popular_companies():
+    conn = sqlite3.connect('stocks.db')
+    try:
+        df = pd.read_sql_query("SELECT ticker, company_name, market_cap FROM companies ORDER BY market_cap DESC LIMIT 10", conn)
+        result = df.to_dict('records')
+    finally:
+        conn.close()
+    for company in result:
+        company['name'] = company.pop('company_name')
+    return result
+
+
+def legacy_get_portfolio_summary():
+    conn = sqlite3.connect('stocks.db')
+    try:
+        return {
+            'current': pd.read_sql_query("SELECT * FROM portfolio ORDER BY date DESC LIMIT 1", conn).to_dict('records')[0],
+            'holdings': pd.read_sql_query("SELECT * FROM holdings WHERE shares > 0 ORDER BY current_value DESC", conn).to_dict('records'),
+            'recent_trades': pd.read_sql_query("SELECT * FROM trades ORDER BY trade_date DESC LIMIT 10", conn).to_dict('records'),
+            'performance': pd.read_sql_query("SELECT date, total_value, daily_return FROM portfolio ORDER BY date DESC LIMIT 30", conn).to_dict('records'),
+        }
+    finally:
+        conn.close()
+
+
+def timed(func, repeat):
+    func()  # warm-up
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - start)
+    return np.median(samples) * 1e6, np.percentile(samples, 99) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=500)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp()
+    shutil.copytree(os.path.join(ROOT, 'static'), os.path.join(workdir, 'static'))
+    os.chdir(workdir)
+    try:
+        import database
+        import app as app_module
+        client = app_module.app.test_client()
+        new_funcs = (app_module.popular_companies, app_module.get_portfolio_summary)
+
+        def index_with(popular, summary):
+            app_module.popular_companies, app_module.get_portfolio_summary = popular, summary
+            return lambda: client.get('/')
+
+        cases = [
+            ('get_company_info', lambda: legacy_get_company_info('AAPL'), lambda: database.get_company_info('AAPL')),
+            ('popular_companies', legacy_popular_companies, database.popular_companies),
+            ('get_portfolio_summary', legacy_get_portfolio_summary, database.get_portfolio_summary),
+        ]
+        print(f"{'lookup':<24} {'before us':>10} {'after us':>10} {'speedup':>8}   (median, p99 in brackets)")
+        for name, before, after in cases:
+            b, bp = timed(before, args.repeat)
+            a, ap = timed(after, args.repeat)
+            print(f"{name:<24} {b:>10.1f} {a:>10.1f} {b / a:>7.1f}x   [{bp:.0f} -> {ap:.0f}]")
+
+        b, bp = timed(index_with(legacy_popular_companies, legacy_get_portfolio_summary), args.repeat // 5)
+        a, ap = timed(index_with(*new_funcs), args.repeat // 5)
+        print(f"{'GET / (test client)':<24} {b:>10.1f} {a:>10.1f} {b / a:>7.1f}x   [{bp:.0f} -> {ap:.0f}]")
+    finally:
+        os.chdir(ROOT)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
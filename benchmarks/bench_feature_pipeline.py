@@ -0,0 +1,100 @@
+"""Benchmark the feature pipeline: legacy `{ticker}_temp` SQLite round-trip vs in-memory arrays.
+
+Usage: python benchmarks/bench_feature_pipeline.py [--rows 252] [--repeat 200]
+
+Each mode runs in its own subprocess so peak RSS (ru_maxrss) is measured in isolation.
+"""
+import argparse
+import json
+import os
+import resource
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fixtures import synthetic_frames  # noqa: E402
+from stock_predictor import build_features, calculate_rsi  # noqa: E402
+
+
+def synthetic_frame(rows, seed=0):
+    """One ticker's worth of daily bars shaped like price_store.load_prices output."""
+    return synthetic_frames(['BENCH'], days=rows, seed=seed)['BENCH'].rename_axis('Date').reset_index()
+
+
+def legacy_pipeline(data, db_path, ticker='BENCH'):
+    """The pre-change path: write to a temp table, read it back, drop it, then build features in pandas."""
+    with sqlite3.connect(db_path) as conn:
+        data[['Date', 'Open', 'High', 'Low', 'Close', 'Volume']].to_sql(f"{ticker}_temp", conn, if_exists='replace', index=False)
+        loaded = pd.read_sql_query(f"SELECT * FROM {ticker}_temp", conn)
+        conn.execute(f"DROP TABLE IF EXISTS {ticker}_temp")
+    for col in ['Open', 'High', 'Low', 'Close', 'Volume']:
+        loaded[col] = pd.to_numeric(loaded[col], errors='coerce')
+    loaded['SMA_5'] = loaded['Close'].rolling(window=5).mean()
+    loaded['RSI'] = calculate_rsi(loaded['Close'], period=14)
+    loaded = loaded.dropna()
+    X = loaded[['Open', 'High', 'Low', 'Volume', 'SMA_5', 'RSI']].copy()
+    y = loaded['Close'].copy()
+    return X, y
+
+
+def run_mode(mode, rows, repeat):
+    data = synthetic_frame(rows)
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'stocks.db')
+        step = (lambda: legacy_pipeline(data, db_path)) if mode == 'legacy' else (lambda: build_features(data))
+        step()  # warm-up
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            step()
+            timings.append(time.perf_counter() - start)
+        tracemalloc.start()
+        step()
+        _, traced_peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    return {
+        'mode': mode,
+        'median_ms': float(np.median(timings) * 1000),
+        'p99_ms': float(np.percentile(timings, 99) * 1000),
+        'traced_peak_kb': traced_peak / 1024,
+        'max_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=252)
+    parser.add_argument('--repeat', type=int, default=200)
+    parser.add_argument('--mode', choices=['legacy', 'arrays'])
+    args = parser.parse_args()
+
+    if args.mode:
+        print(json.dumps(run_mode(args.mode, args.rows, args.repeat)))
+        return
+
+    results = {}
+    for mode in ('legacy', 'arrays'):
+        out = subprocess.run([sys.executable, __file__, '--mode', mode, '--rows', str(args.rows), '--repeat', str(args.repeat)],
+                             check=True, capture_output=True, text=True).stdout
+        results[mode] = json.loads(out.strip().splitlines()[-1])
+
+    print(f"{'mode':<8} {'median ms':>10} {'p99 ms':>10} {'traced KB':>10} {'max RSS MB':>11}")
+    for r in results.values():
+        print(f"{r['mode']:<8} {r['median_ms']:>10.3f} {r['p99_ms']:>10.3f} {r['traced_peak_kb']:>10.1f} {r['max_rss_mb']:>11.1f}")
+    legacy, arrays = results['legacy'], results['arrays']
+    print(f"\nSaved per request: {legacy['median_ms'] - arrays['median_ms']:.3f} ms median "
+          f"({legacy['median_ms'] / arrays['median_ms']:.1f}x), "
+          f"{legacy['traced_peak_kb'] - arrays['traced_peak_kb']:.1f} KB traced peak, "
+          f"{legacy['max_rss_mb'] - arrays['max_rss_mb']:.1f} MB process RSS")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+"""Benchmark: one shared feature matrix and parallel multi-output fits vs fitting each model/horizon on its own.
+
+Usage: python benchmarks/bench_forecast.py [--days 750] [--repeat 3] [--jobs N]
+
+"separate" rebuilds the features and fits one single-output model per (model, horizon)
+sequentially; "shared" builds the lagged features once and runs forecasting.fit_models
+(multi-output ridge and forest, parallel tasks). Models are never served from the cache.
+"""
+import argparse
+import os
+import sys
+import tempfile
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import model_cache  # noqa: E402
+import forecasting  # noqa: E402
+from fixtures import random_walk, timed  # noqa: E402
+
+
+def prepare(data):
+    X, log_close = forecasting.lagged_features(data)
+    Y = forecasting.targets(log_close)
+    first = int(np.argmax(np.isfinite(X).all(axis=1)))
+    return np.nan_to_num(X[first:]), Y[first:]
+
+
+def separate(data):
+    for name, params in forecasting.MODELS.items():
+        for column, _ in enumerate(forecasting.HORIZONS):
+            X, Y = prepare(data)
+            train, _ = forecasting.split(len(X))
+            inputs = forecasting._standardize(X, train) if name == 'ridge' else X
+            forecasting._make_model(name, params, 1).fit(inputs[train], Y[train, column])
+
+
+def shared(data, jobs):
+    X, Y = prepare(data)
+    train, _ = forecasting.split(len(X))
+    forecasting.fit_models('BENCH', X, Y, train, '2024-01-01', n_jobs=jobs)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--days', type=int, default=750, help='Trading days of synthetic history')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--jobs', type=int, default=forecasting.N_JOBS)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        model_cache.MODEL_CACHE_DIR = tmp
+        data = random_walk(args.days)
+        clear = lambda: model_cache.clear(disk=True)  # noqa: E731
+        before = timed(lambda: separate(data), args.repeat, setup=clear)
+        after = timed(lambda: shared(data, args.jobs), args.repeat, setup=clear)
+    fits = len(forecasting.MODELS) * len(forecasting.HORIZONS)
+    print(f"{fits} model/horizon pairs, {args.days} days, {args.jobs} job(s)")
+    print(f"  separate  {before:9.1f} ms")
+    print(f"  shared    {after:9.1f} ms   ({before / after:.1f}x)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+"""Request latency: blanket gc.collect() on every teardown vs RSS-budgeted collection.
+
+Usage: python benchmarks/bench_gc.py [--requests 300]
+
+Drives the main routes through the Flask test client in a scratch directory with a copy of
+static/. Each mode runs in its own interpreter; "legacy" unfreezes the startup objects and
+re-registers the old teardown that called gc.collect() after every request. Prints p50/p99
+per route and overall.
+"""
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PATHS = ['/', '/portfolio', '/api/companies?q=app', '/api/jobs/unknown', '/static/js/script.js', '/metrics']
+
+
+def run_mode(mode, requests):
+    """Child process: time every request and print the samples per path as JSON."""
+    sys.path.insert(0, ROOT)
+    import gc
+    import app
+
+    if mode == 'legacy':
+        # The old app neither froze its startup objects nor skipped the per-request collection
+        gc.unfreeze()
+        app.app.teardown_appcontext(lambda error: gc.collect())
+    client = app.app.test_client()
+    for path in PATHS:
+        client.get(path)  # Warm-up
+    samples = {path: [] for path in PATHS}
+    for i in range(requests):
+        path = PATHS[i % len(PATHS)]
+        started = time.perf_counter()
+        client.get(path)
+        samples[path].append(time.perf_counter() - started)
+    print(json.dumps(samples))
+
+
+def spawn(mode, requests):
+    with tempfile.TemporaryDirectory() as tmp:
+        shutil.copytree(os.path.join(ROOT, 'static'), os.path.join(tmp, 'static'))
+        shutil.copytree(os.path.join(ROOT, 'templates'), os.path.join(tmp, 'templates'))
+        env = dict(os.environ, DATABASE_PATH=os.path.join(tmp, 'stocks.db'))
+        proc = subprocess.run([sys.executable, os.path.abspath(__file__), '--mode', mode, '--requests', str(requests)],
+                              cwd=tmp, env=env, capture_output=True, text=True)
+    if proc.returncode != 0:
+        raise RuntimeError(proc.stderr[-2000:])
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--requests', type=int, default=300)
+    parser.add_argument('--mode', choices=['legacy', 'budget'], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.mode:
+        run_mode(args.mode, args.requests)
+        return
+
+    results = {mode: spawn(mode, args.requests) for mode in ('legacy', 'budget')}
+    print(f"{'route':<24} {'legacy p50':>11} {'p99':>9} {'budget p50':>11} {'p99':>9}  (ms)")
+    for path in PATHS + ['all']:
+        row = []
+        for mode in ('legacy', 'budget'):
+            values = (np.concatenate([np.asarray(v) for v in results[mode].values()]) if path == 'all'
+                      else np.asarray(results[mode][path])) * 1e3
+            row += [np.percentile(values, 50), np.percentile(values, 99)]
+        print(f"{path:<24} {row[0]:>11.2f} {row[1]:>9.2f} {row[2]:>11.2f} {row[3]:>9.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,121 @@
+"""Check the NumPy indicator engine against pandas and time batch vs incremental updates.
+
+Usage: python benchmarks/bench_indicators.py [--tickers 500] [--days 1260]
+
+Exits non-zero if any indicator disagrees with its pandas reference.
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import indicators  # noqa: E402
+from fixtures import random_walk  # noqa: E402
+from stock_predictor import calculate_rsi  # noqa: E402
+
+
+def synthetic_bars(tickers, days, seed=0):
+    """(high, low, close, volume) matrices of shape (tickers, days), one random walk per row."""
+    bars = [random_walk(days, seed + i) for i in range(tickers)]
+    return tuple(np.stack([b[name] for b in bars]) for name in ('High', 'Low', 'Close', 'Volume'))
+
+
+def wilder_reference(values, period):
+    """Plain-loop Wilder smoothing seeded with the first `period` values."""
+    out = np.full(len(values), np.nan)
+    out[period - 1] = values[:period].mean()
+    for i in range(period, len(values)):
+        out[i] = out[i - 1] + (values[i] - out[i - 1]) / period
+    return out
+
+
+def pandas_reference(high, low, close, volume):
+    """The same indicators computed the pandas way, one series at a time."""
+    c, v = pd.Series(close), pd.Series(volume)
+    ref = {f'sma_{w}': c.rolling(w).mean() for w in indicators.SMA_WINDOWS}
+    ema_fast = c.ewm(span=indicators.EMA_FAST, adjust=False).mean()
+    ema_slow = c.ewm(span=indicators.EMA_SLOW, adjust=False).mean()
+    line = ema_fast - ema_slow
+    signal = line.ewm(span=indicators.MACD_SIGNAL, adjust=False).mean()
+    mid = c.rolling(indicators.BB_WINDOW).mean()
+    std = c.rolling(indicators.BB_WINDOW).std(ddof=0)
+    delta = c.diff().to_numpy()[1:]
+    avg_gain = wilder_reference(np.where(delta > 0, delta, 0.0), indicators.RSI_PERIOD)
+    avg_loss = wilder_reference(np.where(delta < 0, -delta, 0.0), indicators.RSI_PERIOD)
+    prev = c.shift(1)
+    tr = pd.concat([pd.Series(high) - pd.Series(low), (pd.Series(high) - prev).abs(), (pd.Series(low) - prev).abs()], axis=1).max(axis=1)
+    ref.update({
+        f'ema_{indicators.EMA_FAST}': ema_fast,
+        f'ema_{indicators.EMA_SLOW}': ema_slow,
+        'rsi': np.r_[np.nan, 100 - 100 / (1 + avg_gain / avg_loss)],
+        'rsi_sma': calculate_rsi(c, period=indicators.RSI_PERIOD),
+        'macd': line,
+        'macd_signal': signal,
+        'macd_hist': line - signal,
+        'atr': wilder_reference(tr.to_numpy(), indicators.ATR_PERIOD),
+        'bb_mid': mid,
+        'bb_upper': mid + indicators.BB_K * std,
+        'bb_lower': mid - indicators.BB_K * std,
+        'volume_z': (v - v.rolling(indicators.VOLUME_Z_WINDOW).mean()) / v.rolling(indicators.VOLUME_Z_WINDOW).std(ddof=0),
+    })
+    return {name: np.asarray(values, dtype=np.float64) for name, values in ref.items()}
+
+
+def check(high, low, close, volume, sample=5):
+    """Compare the batch engine and the incremental engine against pandas on a few tickers."""
+    batch = indicators.compute(high, low, close, volume)
+    split = close.shape[1] - 5
+    _, state = indicators.init_state(high[:, :split], low[:, :split], close[:, :split], volume[:, :split])
+    incremental, _ = indicators.update(state, high[:, split:], low[:, split:], close[:, split:], volume[:, split:])
+
+    failures = []
+    for i in range(min(sample, close.shape[0])):
+        ref = pandas_reference(high[i], low[i], close[i], volume[i])
+        for name, expected in ref.items():
+            if not np.allclose(batch[name][i], expected, rtol=1e-9, atol=1e-9, equal_nan=True):
+                failures.append(f"batch {name} (ticker {i})")
+            if not np.allclose(incremental[name][i], expected[split:], rtol=1e-9, atol=1e-9, equal_nan=True):
+                failures.append(f"incremental {name} (ticker {i})")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--tickers', type=int, default=500)
+    parser.add_argument('--days', type=int, default=1260)
+    args = parser.parse_args()
+
+    high, low, close, volume = synthetic_bars(args.tickers, args.days)
+    failures = check(high, low, close, volume)
+    print("pandas agreement:", "OK" if not failures else "FAILED " + ", ".join(failures))
+
+    start = time.perf_counter()
+    for i in range(args.tickers):
+        pandas_reference(high[i], low[i], close[i], volume[i])
+    pandas_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    _, state = indicators.init_state(high, low, close, volume)
+    batch_s = time.perf_counter() - start
+
+    # One new bar for every ticker, the nightly case
+    rng = np.random.default_rng(1)
+    bar = close[:, -1:] * np.exp(rng.normal(0, 0.02, (args.tickers, 1)))
+    start = time.perf_counter()
+    indicators.update(state, bar * 1.01, bar * 0.99, bar, volume[:, -1:])
+    update_s = time.perf_counter() - start
+
+    print(f"{args.tickers} tickers x {args.days} days")
+    print(f"  pandas, per ticker loop : {pandas_s * 1000:10.1f} ms")
+    print(f"  numpy batch (2-D)       : {batch_s * 1000:10.1f} ms")
+    print(f"  incremental, one new bar: {update_s * 1000:10.1f} ms")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+"""Benchmark: stream a large synthetic yfinance multi-ticker export into stock_prices.
+
+Usage: python benchmarks/bench_ingest.py [--tickers 500] [--days 2520] [--batch 50000]
+
+Writes a wide Price/Ticker/Date CSV to a temp directory (gaps included for late listings),
+loads it with csv_ingest, and reports throughput and peak memory. The loaded table is
+checked against a pandas parse of the same file.
+"""
+import argparse
+import os
+import resource
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import csv_ingest  # noqa: E402
+import database  # noqa: E402
+
+FIELDS = ['Close', 'High', 'Low', 'Open', 'Volume']
+
+
+def write_export(path, tickers, days):
+    rng = np.random.default_rng(0)
+    symbols = [f"T{i:04d}" for i in range(tickers)]
+    dates = pd.bdate_range('2015-01-02', periods=days).strftime('%Y-%m-%d')
+    listed = rng.integers(0, days // 2, tickers) * (rng.random(tickers) < 0.2)  # A fifth list late
+    closes = 100 * np.exp(np.cumsum(rng.normal(0, 0.02, (days, tickers)), axis=0))
+    with open(path, 'w') as f:
+        f.write('Price,' + ','.join(field for field in FIELDS for _ in symbols) + '\n')
+        f.write('Ticker,' + ','.join(symbol for _ in FIELDS for symbol in symbols) + '\n')
+        f.write('Date' + ',' * (len(FIELDS) * tickers) + '\n')
+        for d, day in enumerate(dates):
+            c = closes[d]
+            values = [c, c * 1.01, c * 0.99, c * 1.001, rng.integers(1e5, 1e7, tickers)]
+            cells = []
+            for field, column in zip(FIELDS, values):
+                cells.extend('' if d < listed[t] else (str(int(column[t])) if field == 'Volume' else repr(float(column[t])))
+                             for t in range(tickers))
+            f.write(day + ',' + ','.join(cells) + '\n')
+    return int(sum(days - l for l in listed))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--tickers', type=int, default=500)
+    parser.add_argument('--days', type=int, default=2520)
+    parser.add_argument('--batch', type=int, default=csv_ingest.BATCH_ROWS)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'export.csv')
+        started = time.perf_counter()
+        expected = write_export(path, args.tickers, args.days)
+        size = os.path.getsize(path)
+        print(f"Wrote {size / 1e6:.0f} MB export ({expected:,} bars) in {time.perf_counter() - started:.1f}s")
+
+        database.DB_PATH = os.path.join(tmp, 'ingest.db')
+        conn = database.get_connection()
+        database._ensure_stock_prices(conn)
+        conn.commit()
+
+        rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        started = time.perf_counter()
+        conn.execute('BEGIN IMMEDIATE')
+        rows = csv_ingest.ingest(conn, path, args.batch)
+        conn.commit()
+        elapsed = time.perf_counter() - started
+        rss_growth = (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - rss_before) / 1024
+
+        print(f"  streamed   {elapsed:7.1f}s  {rows / elapsed:11,.0f} rows/s  {size / 1e6 / elapsed:6.1f} MB/s  "
+              f"peak RSS growth {rss_growth:.0f} MB")
+        stored = conn.execute('SELECT COUNT(*) FROM stock_prices').fetchone()[0]
+
+        # Spot-check against pandas on a handful of tickers
+        wide = pd.read_csv(path, header=[0, 1], index_col=0, skiprows=[2])
+        ok = rows == stored == expected
+        for symbol in [f"T{i:04d}" for i in range(0, args.tickers, max(1, args.tickers // 5))]:
+            bars = wide.xs(symbol, axis=1, level=1).dropna(subset=['Close'])
+            loaded = pd.read_sql_query('SELECT date, open, high, low, close, volume FROM stock_prices '
+                                       'WHERE ticker = ? ORDER BY date', conn, params=(symbol,))
+            ok &= (loaded['date'].tolist() == bars.index.tolist()
+                   and np.allclose(loaded['close'], bars['Close']) and np.allclose(loaded['open'], bars['Open'])
+                   and (loaded['volume'].to_numpy() == bars['Volume'].to_numpy()).all())
+        print(f"  rows: {rows:,} written, {stored:,} stored, {expected:,} expected; matches pandas: {'yes' if ok else 'NO'}")
+        database.close_connection()
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,122 @@
+"""Stress test: many concurrent simulated trades against the portfolio ledger.
+
+Usage: python benchmarks/bench_ledger.py [--threads 8] [--trades 500] [--batch 50]
+
+Each thread fires single trades at a scratch database, then the same load is applied
+in batches. After every run the balances are checked against the trade ledger:
+cash must equal the starting cash plus sells minus buys, share counts must match the
+summed trades, and total value must equal cash plus holdings marked at their last price.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import database  # noqa: E402
+
+TICKERS = ['AAPL', 'MSFT', 'NVDA', 'AMZN', 'GOOGL', 'META', 'TSLA', 'JPM']
+STARTING_CASH = 10000.0
+
+
+def make_orders(count, seed):
+    """Random orders with ~70% confident signals, half of them up and half down."""
+    rng = np.random.default_rng(seed)
+    prices = rng.uniform(50, 500, count)
+    return [(TICKERS[t], float(p * (1 + move)), float(conf), float(p))
+            for t, p, move, conf in zip(rng.integers(0, len(TICKERS), count), prices,
+                                        rng.choice([-0.02, 0.02], count), rng.uniform(0.4, 1.0, count))]
+
+
+def reset(path):
+    database.close_connection()
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+    database.DB_PATH = path
+    database._create_ledger_tables(database.get_connection())
+
+
+def run(threads, per_thread, batch):
+    errors = []
+
+    def worker(seed):
+        orders = make_orders(per_thread, seed)
+        step = batch or 1
+        for i in range(0, len(orders), step):
+            chunk = orders[i:i + step]
+            messages = database.simulate_trades(chunk) if batch else [database.simulate_trade(*chunk[0])]
+            errors.extend(m for m in messages if m == "Trade simulation failed")
+        database.close_connection()
+
+    pool = [threading.Thread(target=worker, args=(seed,)) for seed in range(threads)]
+    started = time.perf_counter()
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    return time.perf_counter() - started, len(errors)
+
+
+def check():
+    """Compare the running totals with what the append-only ledger implies; returns a list of problems."""
+    conn = database.get_connection()
+    cash, stocks, total = conn.execute(
+        'SELECT cash_balance, total_stocks_value, total_value FROM portfolio ORDER BY id DESC LIMIT 1').fetchone()
+    flows = dict(conn.execute('SELECT action, SUM(total_amount) FROM trades GROUP BY action').fetchall())
+    expected_cash = STARTING_CASH + flows.get('SELL', 0.0) - flows.get('BUY', 0.0)
+    ledger_shares = dict(conn.execute('''
+        SELECT ticker, SUM(CASE action WHEN 'BUY' THEN shares ELSE -shares END) FROM trades GROUP BY ticker
+    ''').fetchall())
+    holdings = dict(conn.execute('SELECT ticker, shares FROM holdings').fetchall())
+    marked = conn.execute('SELECT COALESCE(SUM(shares * current_price), 0) FROM holdings').fetchone()[0]
+
+    problems = []
+    if not np.isclose(cash, expected_cash):
+        problems.append(f"cash {cash:.6f} != ledger {expected_cash:.6f}")
+    if cash < -1e-9:
+        problems.append(f"negative cash {cash:.6f}")
+    if not np.isclose(stocks, marked):
+        problems.append(f"stock value {stocks:.6f} != holdings {marked:.6f}")
+    if not np.isclose(total, cash + stocks):
+        problems.append(f"total {total:.6f} != cash + stocks {cash + stocks:.6f}")
+    for ticker, shares in ledger_shares.items():
+        if not np.isclose(holdings.get(ticker, 0.0), shares, atol=1e-9):
+            problems.append(f"{ticker} holds {holdings.get(ticker, 0.0):.6f}, ledger says {shares:.6f}")
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--trades', type=int, default=500, help='Trades per thread')
+    parser.add_argument('--batch', type=int, default=50, help='Orders per commit in batch mode')
+    args = parser.parse_args()
+
+    failed = False
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'ledger.db')
+        total = args.threads * args.trades
+        print(f"{args.threads} threads x {args.trades} trades")
+        for label, batch in (('single', 0), (f'batch={args.batch}', args.batch)):
+            reset(path)
+            elapsed, errors = run(args.threads, args.trades, batch)
+            trades = database.get_connection().execute('SELECT COUNT(*) FROM trades').fetchone()[0]
+            problems = check()
+            failed |= bool(problems or errors)
+            print(f"  {label:<10} {elapsed:7.2f}s  {total / elapsed:9,.0f} orders/s  "
+                  f"{trades} executed  {errors} failed  {'consistent' if not problems else 'INCONSISTENT'}")
+            for problem in problems[:10]:
+                print(f"    {problem}")
+        database.close_connection()
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+"""Benchmark: portfolio summary latency, cold (rebuild) and warm (cached), on a large ledger.
+
+Usage: python benchmarks/bench_portfolio_summary.py [--trades 1000000] [--days 2000] [--repeat 200]
+
+Builds a scratch database with `--trades` trades and `--days` portfolio snapshots, then times
+the cold path with and without the date indexes, the warm path, and checks that a new trade
+invalidates the cached summary.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import database  # noqa: E402
+
+
+def populate(trades, days):
+    conn = database.get_connection()
+    database._create_ledger_tables(conn)
+    rng = np.random.default_rng(0)
+    dates = [str(d) for d in np.datetime64('2015-01-01') + np.arange(days)]
+    conn.executemany('''
+        INSERT INTO portfolio (date, total_value, cash_balance, total_stocks_value, daily_return)
+        VALUES (?, ?, ?, 0, ?)
+    ''', ((day, 10000.0, 10000.0, float(r)) for day, r in zip(dates, rng.normal(0, 0.01, days))))
+    conn.executemany('''
+        INSERT INTO trades (ticker, action, shares, price, total_amount, prediction, confidence, trade_date)
+        VALUES (?, 'BUY', 1, ?, ?, ?, 0.9, ?)
+    ''', ((f"T{i % 500}", 100.0, 100.0, 101.0, dates[i * days // trades]) for i in range(trades)))
+    conn.commit()
+
+
+def timed(func, repeat):
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - started)
+    return np.median(samples) * 1e3
+
+
+def cold():
+    database._summary_cache = None
+    return database.get_portfolio_summary()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--trades', type=int, default=1_000_000)
+    parser.add_argument('--days', type=int, default=2000)
+    parser.add_argument('--repeat', type=int, default=200)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        database.DB_PATH = os.path.join(tmp, 'summary.db')
+        started = time.perf_counter()
+        populate(args.trades, args.days)
+        print(f"Populated {args.trades:,} trades / {args.days:,} snapshots in {time.perf_counter() - started:.1f}s")
+        conn = database.get_connection()
+
+        conn.execute('DROP INDEX idx_portfolio_date')
+        conn.execute('DROP INDEX idx_trades_trade_date')
+        no_index = timed(cold, max(3, args.repeat // 50))
+        conn.execute('CREATE INDEX idx_portfolio_date ON portfolio (date, id)')
+        conn.execute('CREATE INDEX idx_trades_trade_date ON trades (trade_date, id)')
+        conn.execute('ANALYZE')
+        indexed = timed(cold, args.repeat)
+        database.get_portfolio_summary()
+        warm = timed(database.get_portfolio_summary, args.repeat * 10)
+
+        print(f"  cold, no indexes  {no_index:10.3f} ms")
+        print(f"  cold, indexed     {indexed:10.3f} ms")
+        print(f"  warm (cached)     {warm:10.3f} ms")
+
+        before = database.get_portfolio_summary()
+        database.simulate_trade('NEWCO', 110.0, 0.9, 100.0)
+        after = database.get_portfolio_summary()
+        ok = after is not before and after['recent_trades'][0]['ticker'] == 'NEWCO'
+        print(f"  invalidated by a trade: {'yes' if ok else 'NO'}")
+        database.close_connection()
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
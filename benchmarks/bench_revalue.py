@@ -0,0 +1,87 @@
+"""Benchmark: bulk mark-to-market of every holding vs a per-ticker read and update loop.
+
+Usage: python benchmarks/bench_revalue.py [--positions 5000] [--days 30] [--repeat 5]
+
+Builds a scratch price store and ledger with `--positions` open holdings, then times
+price_store.latest_closes + database.revalue_portfolio (one bulk read, one executemany
+transaction) against one query per ticker and a committed UPDATE per holding.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import database  # noqa: E402
+import price_store  # noqa: E402
+from fixtures import random_walk, timed  # noqa: E402
+
+
+def populate(positions, days):
+    rng = np.random.default_rng(0)
+    tickers = [f"T{i:05d}" for i in range(positions)]
+    last_day = (np.datetime64('today', 'D') - np.datetime64('1970-01-01', 'D')).astype(int)
+    with price_store._connect() as conn:
+        for i, ticker in enumerate(tickers):
+            price_store._ensure_table(conn, ticker)
+            close = random_walk(days, seed=i)['Close']
+            conn.executemany(f'INSERT INTO {price_store._table_name(ticker)} VALUES (?, ?, ?, ?, ?, ?)',
+                             [(int(last_day - days + 1 + i), c, c, c, c, 1000) for i, c in enumerate(close.tolist())])
+            conn.execute('INSERT INTO price_meta (ticker, last_day, checked_at) VALUES (?, ?, ?)',
+                         (ticker, int(last_day), time.time()))
+
+    database.init_db()
+    conn = database.get_connection()
+    conn.executemany('INSERT INTO holdings (ticker, shares, avg_price, current_price) VALUES (?, ?, ?, ?)',
+                     [(ticker, float(rng.uniform(1, 20)), 100.0, 100.0) for ticker in tickers])
+    conn.commit()
+    return tickers
+
+
+def bulk():
+    tickers = database.held_tickers()
+    closes = price_store.latest_closes(tickers)
+    return database.revalue_portfolio({ticker: close for ticker, (_, close) in closes.items()})
+
+
+def per_ticker():
+    conn = database.get_connection()
+    with price_store._connect() as store:
+        closes = {ticker: store.execute(f'SELECT close FROM {price_store._table_name(ticker)} ORDER BY day DESC LIMIT 1').fetchone()
+                  for ticker in database.held_tickers()}
+    for ticker, row in closes.items():
+        conn.execute('''
+            UPDATE holdings SET current_price = ?, current_value = shares * ?, total_return = (? / avg_price - 1) * 100
+            WHERE ticker = ?
+        ''', (row[0], row[0], row[0], ticker))
+        conn.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--positions', type=int, default=5000)
+    parser.add_argument('--days', type=int, default=30, help='Bars stored per ticker')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        price_store.PRICE_DB = os.path.join(tmp, 'prices.db')
+        database.DB_PATH = os.path.join(tmp, 'stocks.db')
+        started = time.perf_counter()
+        populate(args.positions, args.days)
+        print(f"Seeded {args.positions} positions in {time.perf_counter() - started:.1f}s")
+
+        result = bulk()
+        print(f"  total ${result['total_value']:,.2f}, repriced {result['repriced']}/{result['holdings']}")
+        print(f"  bulk revaluation    {timed(bulk, args.repeat):9.1f} ms")
+        print(f"  per-ticker loop     {timed(per_ticker, args.repeat):9.1f} ms")
+        database.close_connection()
+
+
+if __name__ == '__main__':
+    main()
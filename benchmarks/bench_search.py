@@ -0,0 +1,49 @@
+"""Company search latency: in-memory index vs the old fetch-100-and-filter approach.
+
+Usage: python benchmarks/bench_search.py [--repeat 2000]
+"""
+import argparse
+import csv
+import os
+import sys
+import time
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import company_search  # noqa: E402
+
+QUERIES = ['a', 'aapl', 'app', 'micro', 'microsft', 'tesla', 'bank of am', 'corp', 'goldman', 'amazn']
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=2000)
+    args = parser.parse_args()
+
+    with open(os.path.join(ROOT, 'static', 'companies.csv'), newline='', encoding='utf-8') as f:
+        rows = [(r['ticker'], r['company_name'], r['short_name'], float(r['market_cap'] or 0)) for r in csv.DictReader(f)]
+
+    start = time.perf_counter()
+    index = company_search.build_index(rows)
+    print(f"index build: {(time.perf_counter() - start) * 1000:.1f} ms for {len(rows)} companies\n")
+
+    print(f"{'query':<12} {'median us':>10} {'p99 us':>8}  top results")
+    for query in QUERIES:
+        samples = []
+        for _ in range(args.repeat):
+            begin = time.perf_counter()
+            results = company_search.search(query, limit=10, index=index)
+            samples.append(time.perf_counter() - begin)
+        top = ', '.join(r['ticker'] for r in results[:4])
+        print(f"{query:<12} {np.median(samples) * 1e6:>10.1f} {np.percentile(samples, 99) * 1e6:>8.1f}  {top}")
+
+    # What the browser could find before: the first 100 rows, unordered
+    reachable = {r[0] for r in rows[:100]}
+    print(f"\nCompanies reachable by the old client-side filter: {len(reachable)} of {len(rows)}")
+
+
+if __name__ == '__main__':
+    main()
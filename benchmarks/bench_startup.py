@@ -0,0 +1,64 @@
+"""Startup benchmark: init_db on repeated boots, legacy reload-everything vs change detection.
+
+Usage: python benchmarks/bench_startup.py [--boots 5]
+
+Each variant runs in its own scratch directory with a copy of static/.
+"""
+import argparse
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+
+import pandas as pd
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def legacy_init_db():
+    """The CSV part of the previous init_db: replace companies, append all stock data again."""
+    conn = sqlite3.connect('stocks.db')
+    pd.read_csv('static/companies.csv').to_sql('companies', conn, if_exists='replace', index=False)
+    for chunk in pd.read_csv('static/stock_data.csv', chunksize=10000):
+        chunk.to_sql('stock_prices', conn, if_exists='append', index=False)
+    rows = conn.execute('SELECT COUNT(*) FROM stock_prices').fetchone()[0]
+    conn.close()
+    return rows
+
+
+def current_init_db():
+    import database
+    database.init_db()
+    return database.get_connection().execute('SELECT COUNT(*) FROM stock_prices').fetchone()[0]
+
+
+def run(name, init, boots):
+    workdir = tempfile.mkdtemp()
+    shutil.copytree(os.path.join(ROOT, 'static'), os.path.join(workdir, 'static'))
+    os.chdir(workdir)
+    try:
+        for boot in range(boots):
+            start = time.perf_counter()
+            rows = init()
+            elapsed = (time.perf_counter() - start) * 1000
+            print(f"{name:<8} boot {boot + 1}: {elapsed:8.1f} ms   stock_prices rows: {rows}")
+    finally:
+        os.chdir(ROOT)
+        if 'database' in sys.modules:
+            sys.modules['database'].close_connection()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--boots', type=int, default=5)
+    args = parser.parse_args()
+    run('legacy', legacy_init_db, args.boots)
+    run('current', current_init_db, args.boots)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,61 @@
+"""Benchmark: warm-started forests over cached features vs refitting every candidate from scratch.
+
+Usage: python benchmarks/bench_tuning.py [--days 750] [--repeat 1] [--jobs N]
+
+Cross-validates one setting of FOREST_GRID (depth 10, all features, every tree count in
+TREE_COUNTS) over the tuning folds. "refit" rebuilds the features for every fold and fits a
+fresh forest per tree count; "warm" builds the features once and grows one warm-started
+forest per fold through the tree counts, with the folds spread over --jobs processes.
+"""
+import argparse
+import os
+import sys
+
+import numpy as np
+from joblib import Parallel, delayed
+from sklearn.ensemble import RandomForestRegressor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import tuning  # noqa: E402
+from fixtures import random_walk, timed  # noqa: E402
+from stock_predictor import build_features  # noqa: E402
+
+FOREST = {'max_depth': 10, 'min_samples_leaf': 1, 'max_features': 1.0}
+
+
+def refit(data):
+    errors = []
+    for train_end, test_end in tuning.folds(len(build_features(data)[1])):
+        X, y, _ = build_features(data)
+        for n_trees in tuning.TREE_COUNTS:
+            model = RandomForestRegressor(n_estimators=n_trees, random_state=42, **FOREST)
+            model.fit(X[:train_end], y[:train_end])
+            errors.append(np.mean(np.abs(model.predict(X[train_end:test_end]) - y[train_end:test_end])))
+    return errors
+
+
+def warm(data, jobs):
+    X, y, _ = build_features(data)
+    return Parallel(n_jobs=jobs)(delayed(tuning._score_fold)(X, y, train_end, test_end, FOREST)
+                                 for train_end, test_end in tuning.folds(len(y)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--days', type=int, default=750, help='Trading days of synthetic history')
+    parser.add_argument('--repeat', type=int, default=1)
+    parser.add_argument('--jobs', type=int, default=tuning.N_JOBS)
+    args = parser.parse_args()
+
+    data = random_walk(args.days)
+    before = timed(lambda: refit(data), args.repeat)
+    after = timed(lambda: warm(data, args.jobs), args.repeat)
+    print(f"{tuning.N_FOLDS} folds x tree counts {tuning.TREE_COUNTS}, {args.days} days, {args.jobs} job(s)")
+    print(f"  refit   {before:9.1f} ms")
+    print(f"  warm    {after:9.1f} ms   ({before / after:.1f}x)")
+
+
+if __name__ == '__main__':
+    main()
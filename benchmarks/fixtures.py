@@ -0,0 +1,45 @@
+"""Shared benchmark fixture and timer: deterministic random-walk bars and a median-of-N stopwatch.
+
+Imported by suite.py and the bench_*.py scripts (all run from this directory, so a plain
+`from fixtures import ...` resolves), so every benchmark measures the same synthetic market.
+"""
+import time
+
+import numpy as np
+
+
+def random_walk(days, seed=0, end=None):
+    """Deterministic random-walk OHLCV arrays over `days` business days ending `end` (default today).
+
+    Shaped like price_store.load_columns output: float64 columns plus a datetime64[D] 'Date'.
+    """
+    rng = np.random.default_rng(seed)
+    close = 100 * np.exp(np.cumsum(rng.normal(0.0003, 0.02, days)))
+    end = np.datetime64(end or 'today', 'D')
+    return {'Date': np.busday_offset(end, np.arange(-days + 1, 1), roll='backward'),
+            'Open': close * (1 + rng.normal(0, 0.005, days)), 'High': close * 1.01, 'Low': close * 0.99,
+            'Close': close, 'Volume': rng.integers(100_000, 10_000_000, days).astype(np.float64)}
+
+
+def synthetic_frames(tickers, days=300, seed=0):
+    """random_walk bars as one DatetimeIndex'd frame per ticker, the shape providers return."""
+    import pandas as pd
+
+    frames = {}
+    for i, ticker in enumerate(tickers):
+        bars = random_walk(days, seed + i)
+        frames[ticker] = pd.DataFrame({name: bars[name] for name in ('Open', 'High', 'Low', 'Close', 'Volume')},
+                                      index=pd.DatetimeIndex(bars['Date']))
+    return frames
+
+
+def timed(func, repeat, setup=None):
+    """Median milliseconds over `repeat` calls to func(); setup() runs untimed before each one."""
+    samples = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        started = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - started)
+    return float(np.median(samples)) * 1e3
@@ -0,0 +1,275 @@
+"""Offline benchmark suite with a stored baseline and regression flags.
+
+Usage: python benchmarks/suite.py [--only NAME ...] [--update-baseline] [--threshold 0.25]
+                                  [--memory-threshold 0.15] [--rss-budget-mb 512] [--runs 3]
+
+Every case runs in a fresh interpreter inside a scratch directory, with a copy of static/
+and a synthetic random-walk price provider in place of Yahoo Finance, so nothing touches
+the network or the real databases. Each case runs in --runs processes and reports the
+median of each measurement over them:
+  wall_ms    median wall time per operation, best of 5 rounds of at least 5 samples
+  alloc_mb   peak traced Python/NumPy allocations during one extra operation (tracemalloc)
+  rss_mb     peak resident set size of the case's process (imports included)
+
+Results are compared with benchmarks/baseline.json. A case is flagged when its wall time
+grows by more than --threshold (or its WALL_THRESHOLDS entry), or its allocations or RSS by
+more than --memory-threshold. Any case whose RSS exceeds --rss-budget-mb (the 512MB free-tier
+limit MEMORY_OPTIMIZATIONS.md targets) is also flagged. The exit status is 1 when anything is
+flagged. Baselines are machine-specific: refresh them with --update-baseline on the machine
+that runs the suite.
+"""
+import argparse
+import json
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+from fixtures import synthetic_frames
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BASELINE = os.path.join(ROOT, 'benchmarks', 'baseline.json')
+
+ROUNDS = 5
+MIN_SAMPLES = 5  # Per round; a median of fewer samples is one slow sample away from a false flag
+# Wall-time limits for cases that swing with machine load however often they're sampled (pandas
+# and forest work, creating a database file, the full request stack); others use --threshold
+WALL_THRESHOLDS = {'calculate_rsi': 0.5, 'predict_cold': 0.5, 'predict_warm': 0.5, 'init_db_cold': 0.5,
+                   'routes': 0.5}
+SYNTHETIC_TICKERS = ['AAPL', 'MSFT', 'NVDA', 'AMZN', 'GOOGL', 'META', 'TSLA', 'JPM']
+
+
+# --- Fixture -----------------------------------------------------------------
+
+def install_fixture():
+    """Serve prices from the synthetic provider (the stores already point at the scratch directory)."""
+    import price_store
+    price_store.set_provider(price_store.frame_provider(synthetic_frames(SYNTHETIC_TICKERS)))
+
+
+# --- Cases -------------------------------------------------------------------
+# Each case returns (operation, repeat): the suite times `repeat` calls to operation().
+
+def case_calculate_rsi():
+    import pandas as pd
+    from stock_predictor import calculate_rsi
+    closes = pd.Series(synthetic_frames(['RSI'], days=2520)['RSI']['Close'].to_numpy())
+    return lambda: calculate_rsi(closes), 500
+
+
+def case_predict_cold():
+    import model_cache
+    from stock_predictor import predict_next_close
+    install_fixture()
+
+    def run():
+        model_cache.clear(disk=True)  # Force a fit every time
+        assert predict_next_close('AAPL') is not None
+    return run, 10
+
+
+def case_predict_warm():
+    from stock_predictor import predict_next_close
+    install_fixture()
+    predict_next_close('AAPL')
+    return lambda: predict_next_close('AAPL'), 20
+
+
+def case_init_db_cold():
+    import database
+
+    def run():
+        database.close_connection()
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(database.DB_PATH + suffix):
+                os.remove(database.DB_PATH + suffix)
+        database.init_db()
+    return run, 10
+
+
+def case_init_db_warm():
+    import database
+    database.init_db()
+    return database.init_db, 20
+
+
+def case_portfolio_summary_cold():
+    import database
+    database.init_db()
+    _seed_trades(database, 2000)
+
+    def run():
+        database._summary_cache = None
+        database.get_portfolio_summary()
+    return run, 200
+
+
+def case_portfolio_summary_warm():
+    import database
+    database.init_db()
+    _seed_trades(database, 2000)
+    database.get_portfolio_summary()
+    return database.get_portfolio_summary, 2000
+
+
+def case_simulate_trade():
+    import database
+    database.init_db()
+    orders = iter(_orders(1000))
+    return lambda: database.simulate_trade(*next(orders)), 500
+
+
+def case_routes():
+    import jobs
+    install_fixture()
+    import app
+    client = app.app.test_client()
+    # Warm the prediction job so /main renders a finished result rather than the pending page
+    client.get('/main?ticker=AAPL')
+    while jobs.inflight('AAPL'):
+        time.sleep(0.05)
+    paths = ['/', '/portfolio', '/api/companies?q=app', '/api/companies?q=micro', '/main?ticker=AAPL', '/metrics']
+
+    def run():
+        for path in paths:
+            assert client.get(path).status_code == 200, path
+    return run, 50
+
+
+CASES = {name[len('case_'):]: func for name, func in sorted(globals().items()) if name.startswith('case_')}
+
+
+def _orders(count, seed=0):
+    rng = np.random.default_rng(seed)
+    prices = rng.uniform(50, 500, count)
+    return [(SYNTHETIC_TICKERS[t], float(p * (1 + move)), 0.9, float(p))
+            for t, p, move in zip(rng.integers(0, len(SYNTHETIC_TICKERS), count), prices,
+                                  rng.choice([-0.02, 0.02], count))]
+
+
+def _seed_trades(database, count):
+    database.simulate_trades(_orders(count, seed=1))
+
+
+# --- Runner ------------------------------------------------------------------
+
+def run_case(name):
+    """Child process: set up the case, time it and print one JSON line."""
+    sys.path.insert(0, ROOT)
+    operation, repeat = CASES[name]()
+    operation()  # Warm-up
+    # Best of ROUNDS medians: scheduler noise only ever adds time, so the fastest round is the stable number
+    rounds = []
+    for _ in range(ROUNDS):
+        samples = []
+        for _ in range(max(MIN_SAMPLES, repeat // ROUNDS)):
+            started = time.perf_counter()
+            operation()
+            samples.append(time.perf_counter() - started)
+        rounds.append(np.median(samples))
+    tracemalloc.start()
+    operation()
+    alloc = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    print(json.dumps({
+        'wall_ms': round(float(min(rounds)) * 1e3, 4),
+        'alloc_mb': round(alloc / 1e6, 3),
+        'rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        'repeat': repeat,
+    }))
+
+
+def spawn_case(name):
+    """Run one case in a fresh interpreter and scratch directory; returns its measurements."""
+    with tempfile.TemporaryDirectory() as tmp:
+        shutil.copytree(os.path.join(ROOT, 'static'), os.path.join(tmp, 'static'))
+        env = dict(os.environ,
+                   DATABASE_PATH=os.path.join(tmp, 'stocks.db'),
+                   PRICE_STORE_PATH=os.path.join(tmp, 'prices.db'),
+                   PRICE_COLUMNS_PATH=os.path.join(tmp, 'price_columns'),
+                   MODEL_CACHE_DIR=os.path.join(tmp, 'model_cache'),
+                   PROFILE_REQUESTS='0', METRICS_TRACE_MEMORY='0')
+        proc = subprocess.run([sys.executable, os.path.abspath(__file__), '--run-case', name],
+                              cwd=tmp, env=env, capture_output=True, text=True)
+    if proc.returncode != 0:
+        raise RuntimeError(f"{name} failed:\n{proc.stderr[-2000:]}")
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def measure_case(name, runs):
+    """Median of each measurement over `runs` fresh processes (host load shifts between processes)."""
+    results = [spawn_case(name) for _ in range(runs)]
+    return {metric: float(np.median([result[metric] for result in results])) if metric != 'repeat' else value
+            for metric, value in results[0].items()}
+
+
+def compare(name, result, baseline, args):
+    """Return the list of regression messages for one case."""
+    flags = []
+    if result['rss_mb'] > args.rss_budget_mb:
+        flags.append(f"RSS {result['rss_mb']:.0f}MB over the {args.rss_budget_mb}MB budget")
+    if not baseline:
+        return flags
+    for metric, limit in (('wall_ms', WALL_THRESHOLDS.get(name, args.threshold)), ('alloc_mb', args.memory_threshold),
+                          ('rss_mb', args.memory_threshold)):
+        before, after = baseline.get(metric), result[metric]
+        # Ignore noise on tiny absolute values (sub-0.05ms, sub-0.1MB)
+        floor = 0.05 if metric == 'wall_ms' else 0.1
+        if before is not None and after > before * (1 + limit) and after - before > floor:
+            flags.append(f"{metric} {before:g} -> {after:g} (+{(after / max(before, 1e-12) - 1):.0%})")
+    return flags
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--only', nargs='*', choices=sorted(CASES), help='Run just these cases')
+    parser.add_argument('--update-baseline', action='store_true', help='Write results to baseline.json')
+    parser.add_argument('--threshold', type=float, default=0.25, help='Allowed wall-time growth (0.25 = 25%%)')
+    parser.add_argument('--memory-threshold', type=float, default=0.15, help='Allowed allocation/RSS growth')
+    parser.add_argument('--rss-budget-mb', type=float, default=512)
+    parser.add_argument('--runs', type=int, default=3, help='Processes per case; each measurement is their median')
+    parser.add_argument('--run-case', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_case:
+        run_case(args.run_case)
+        return 0
+
+    baseline = {}
+    if os.path.exists(BASELINE):
+        with open(BASELINE) as f:
+            baseline = json.load(f).get('cases', {})
+
+    results, flagged = {}, 0
+    print(f"{'case':<26} {'wall ms':>10} {'alloc MB':>9} {'RSS MB':>8}   vs baseline")
+    for name in args.only or sorted(CASES):
+        result = results[name] = measure_case(name, args.runs)
+        before = baseline.get(name)
+        flags = compare(name, result, before, args)
+        flagged += bool(flags)
+        delta = f"{result['wall_ms'] / before['wall_ms'] - 1:+.0%}" if before and before.get('wall_ms') else 'new'
+        status = 'REGRESSION: ' + '; '.join(flags) if flags else 'ok'
+        print(f"{name:<26} {result['wall_ms']:>10.3f} {result['alloc_mb']:>9.2f} {result['rss_mb']:>8.0f}   "
+              f"{delta:>5}  {status}")
+
+    if args.update_baseline:
+        merged = dict(baseline, **results)
+        with open(BASELINE, 'w') as f:
+            json.dump({'python': sys.version.split()[0], 'machine': os.uname().machine,
+                       'cpus': os.cpu_count(), 'cases': merged}, f, indent=2, sort_keys=True)
+            f.write('\n')
+        print(f"Baseline written to {os.path.relpath(BASELINE, ROOT)}")
+        return 0
+    if flagged:
+        print(f"{flagged} case(s) regressed")
+    return 1 if flagged else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
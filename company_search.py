@@ -0,0 +1,138 @@
+import re
+import threading
+from bisect import bisect_left
+from collections import Counter
+
+# In-memory company search index, built once at startup:
+#   - tickers in a sorted array for bisect prefix lookups
+#   - a trigram inverted index over company and short names for substring and fuzzy matches
+# Companies are numbered in market-cap order, so sorting ids ranks by market cap.
+
+DEFAULT_LIMIT = 10
+MAX_LIMIT = 100
+FUZZY_THRESHOLD = 0.5     # Share of the query's trigrams a name must contain to count as a fuzzy match
+FUZZY_COMMON_SHARE = 0.05  # Trigrams found in more than 5% of names are ignored for fuzzy matching
+
+_NON_ALNUM = re.compile(r'[^a-z0-9]+')
+_index = None
+_lock = threading.Lock()
+
+
+def _normalize(text):
+    return _NON_ALNUM.sub(' ', (text or '').lower()).strip()
+
+
+def _trigrams(text):
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+def build_index(rows):
+    """Build the index from (ticker, company_name, short_name, market_cap) rows."""
+    rows = sorted((row for row in rows if row[0]), key=lambda row: -(row[3] or 0))
+    records, names, grams = [], [], {}
+    for company_id, (ticker, company_name, short_name, market_cap) in enumerate(rows):
+        records.append({'ticker': ticker, 'name': company_name or short_name or ticker, 'market_cap': market_cap})
+        # Pad with spaces so word starts get their own trigrams (" ap" for "apple")
+        searchable = f" {_normalize(company_name)} | {_normalize(short_name)} "
+        names.append(searchable)
+        for gram in _trigrams(searchable):
+            grams.setdefault(gram, set()).add(company_id)
+
+    by_ticker = sorted((ticker.upper(), company_id) for company_id, (ticker, *_) in enumerate(rows))
+    return {
+        'records': records,
+        'names': names,
+        'tickers': [ticker for ticker, _ in by_ticker],
+        'ticker_ids': [company_id for _, company_id in by_ticker],
+        # Sets for membership tests, sorted tuples to walk candidates in market-cap order
+        'grams': {gram: frozenset(ids) for gram, ids in grams.items()},
+        'postings': {gram: tuple(sorted(ids)) for gram, ids in grams.items()},
+    }
+
+
+def load_index(rows):
+    """Build and install the process-wide index."""
+    global _index
+    index = build_index(rows)
+    with _lock:
+        _index = index
+    return index
+
+
+def is_loaded():
+    return _index is not None
+
+
+def search(query, limit=DEFAULT_LIMIT, index=None):
+    """Rank companies for a query: exact ticker, ticker prefix, name match, then fuzzy name match."""
+    index = index or _index
+    if index is None:
+        return []
+    limit = max(1, min(int(limit), MAX_LIMIT))
+    records = index['records']
+
+    ticker_query = query.strip().upper()
+    if not ticker_query:
+        return records[:limit]
+
+    ranked, seen = [], set()
+
+    def take(ids):
+        for company_id in sorted(ids):
+            if company_id not in seen:
+                seen.add(company_id)
+                ranked.append(company_id)
+        return len(ranked) >= limit
+
+    # Tickers: exact match, then prefix range from the sorted array
+    tickers = index['tickers']
+    lo = bisect_left(tickers, ticker_query)
+    hi = bisect_left(tickers, ticker_query + '\uffff')
+    exact = [index['ticker_ids'][i] for i in range(lo, hi) if tickers[i] == ticker_query]
+    if take(exact) or take(index['ticker_ids'][lo:hi]):
+        return [records[i] for i in ranked[:limit]]
+
+    name_query = _normalize(query)
+    if not name_query:
+        return [records[i] for i in ranked]
+
+    # Names: walk the rarest query trigram's postings in market-cap order, keep ids holding every
+    # other trigram, and stop once enough word-start matches are in hand
+    grams = index['grams']
+    names = index['names']
+    query_grams = _trigrams(f" {name_query}") if len(name_query) < 3 else _trigrams(name_query)
+    name_matched = False
+    if query_grams and all(gram in grams for gram in query_grams):
+        rarest, *others = sorted(query_grams, key=lambda gram: len(grams[gram]))
+        others = [grams[gram] for gram in others]
+        needed = limit - len(ranked)
+        word_start, substring = [], []
+        for company_id in index['postings'][rarest]:
+            if company_id in seen or not all(company_id in ids for ids in others):
+                continue
+            if f" {name_query}" in names[company_id]:
+                word_start.append(company_id)
+                if len(word_start) >= needed:
+                    break
+            elif name_query in names[company_id] and len(substring) < needed:
+                substring.append(company_id)
+        name_matched = bool(word_start or substring)
+        if take(word_start) or take(substring):
+            return [records[i] for i in ranked[:limit]]
+
+    # Fuzzy: only when nothing matched by name, take names holding most of the query's
+    # informative trigrams (typos); grams shared by a large share of names ("inc", " co") carry no signal
+    common = FUZZY_COMMON_SHARE * len(records)
+    fuzzy_grams = [gram for gram in _trigrams(f" {name_query} ") if 0 < len(grams.get(gram, ())) <= common]
+    if not name_matched and len(fuzzy_grams) >= 2:
+        hits = Counter()
+        for gram in fuzzy_grams:
+            hits.update(index['postings'][gram])
+        needed = FUZZY_THRESHOLD * len(fuzzy_grams)
+        scored = sorted((-count, company_id) for company_id, count in hits.items()
+                        if count >= needed and company_id not in seen)
+        for _, company_id in scored[:limit - len(ranked)]:
+            seen.add(company_id)
+            ranked.append(company_id)
+
+    return [records[i] for i in ranked[:limit]]
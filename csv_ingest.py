@@ -0,0 +1,149 @@
+import os
+import csv
+import sys
+import time
+import sqlite3
+import logging
+import argparse
+
+logger = logging.getLogger(__name__)
+
+# Streaming loader for yfinance multi-ticker CSV exports (wide: one column per field per ticker).
+# Reads the file once, row by row, so memory stays bounded by BATCH_ROWS whatever the file size.
+BATCH_ROWS = 50000            # Long rows per executemany call
+PROGRESS_EVERY = 64 << 20     # Report progress every 64MB read
+FIELDS = ('Open', 'High', 'Low', 'Close', 'Volume')
+
+UPSERT_SQL = '''
+    INSERT INTO stock_prices (ticker, date, open, high, low, close, volume) VALUES (?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT(ticker, date) DO UPDATE SET open = excluded.open, high = excluded.high,
+        low = excluded.low, close = excluded.close, volume = excluded.volume
+'''
+
+
+def parse_header(rows):
+    """Consume the header rows and return [(ticker, {field: column index})] in file order.
+
+    Handles both yfinance layouts: Price/Ticker (group_by='column', the default) and
+    Ticker/Price (group_by='ticker'), each followed by a Date row.
+    """
+    first, second = next(rows), next(rows)
+    first[0], second[0] = first[0].lstrip('\ufeff'), second[0].lstrip('\ufeff')
+    if first[0].strip().lower() == 'ticker':
+        first, second = second, first
+    if first[0].strip().lower() != 'price' or second[0].strip().lower() != 'ticker':
+        raise ValueError(f"Not a yfinance multi-ticker export: header starts {first[:3]} / {second[:3]}")
+
+    columns = {}
+    for index, (field, ticker) in enumerate(zip(first[1:], second[1:]), start=1):
+        field, ticker = field.strip().title(), ticker.strip().upper()
+        if field in FIELDS and ticker:
+            columns.setdefault(ticker, {})[field] = index
+    layout = [(ticker, fields) for ticker, fields in columns.items() if 'Close' in fields]
+
+    row = next(rows, None)
+    if row is not None and row[0].strip().lower() != 'date':
+        raise ValueError(f"Expected the Date header row, got {row[:3]}")
+    return layout
+
+
+def _number(text):
+    return float(text) if text else None
+
+
+def iter_bars(rows, layout):
+    """Yield long (ticker, date, open, high, low, close, volume) tuples from the wide data rows."""
+    # Column indices per ticker, with -1 for fields missing from the export
+    plan = [(ticker, *(fields.get(field, -1) for field in FIELDS)) for ticker, fields in layout]
+    for row in rows:
+        if not row or not row[0]:
+            continue
+        day = row[0][:10]  # Drop any time/timezone suffix
+        width = len(row)
+        for ticker, o, h, l, c, v in plan:
+            close = row[c] if c < width else ''
+            if not close:
+                continue  # Ticker didn't trade (or wasn't listed) that day
+            volume = row[v] if 0 <= v < width else ''
+            yield (ticker, day,
+                   _number(row[o]) if 0 <= o < width else None,
+                   _number(row[h]) if 0 <= h < width else None,
+                   _number(row[l]) if 0 <= l < width else None,
+                   float(close),
+                   int(float(volume)) if volume else 0)
+
+
+def ingest(conn, path, batch_rows=BATCH_ROWS, progress=None):
+    """Stream a wide export into stock_prices with batched prepared upserts; returns rows written.
+
+    progress(bytes_read, total_bytes, rows_written) is called every PROGRESS_EVERY bytes and at
+    the end. Transaction control is left to the caller.
+    """
+    total_bytes = os.path.getsize(path)
+    state = {'read': 0, 'reported': 0}
+
+    with open(path, 'rb') as f:
+        def lines():
+            for line in f:
+                state['read'] += len(line)
+                yield line.decode('utf-8')
+
+        rows = csv.reader(lines())
+        layout = parse_header(rows)
+        logger.info(f"Ingesting {len(layout)} tickers from {path} ({total_bytes / 1e6:.1f} MB)")
+
+        written = 0
+        batch = []
+        for bar in iter_bars(rows, layout):
+            batch.append(bar)
+            if len(batch) >= batch_rows:
+                conn.executemany(UPSERT_SQL, batch)
+                written += len(batch)
+                batch.clear()
+                if progress and state['read'] - state['reported'] >= PROGRESS_EVERY:
+                    state['reported'] = state['read']
+                    progress(state['read'], total_bytes, written)
+        if batch:
+            conn.executemany(UPSERT_SQL, batch)
+            written += len(batch)
+    if progress:
+        progress(total_bytes, total_bytes, written)
+    return written
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Load a yfinance multi-ticker CSV export into stock_prices.')
+    parser.add_argument('path', help='Wide CSV export (Price/Ticker/Date header rows)')
+    parser.add_argument('--db', default=None, help='SQLite database (default: DATABASE_PATH or stocks.db)')
+    parser.add_argument('--batch', type=int, default=BATCH_ROWS, help='Rows per bulk insert')
+    args = parser.parse_args(argv)
+
+    import database
+    if args.db:
+        database.DB_PATH = args.db
+    conn = database.get_connection()
+    database._ensure_stock_prices(conn)
+    conn.commit()
+
+    started = time.perf_counter()
+
+    def report(done, total, rows):
+        elapsed = time.perf_counter() - started
+        print(f"\r{done / max(total, 1):6.1%}  {rows:,} rows  {done / 1e6 / max(elapsed, 1e-9):.0f} MB/s",
+              end='', file=sys.stderr, flush=True)
+
+    try:
+        conn.execute('BEGIN IMMEDIATE')
+        rows = ingest(conn, args.path, args.batch, report)
+        conn.commit()
+    except (sqlite3.Error, ValueError, OSError) as e:
+        conn.rollback()
+        print(f"\nError ingesting {args.path}: {e}", file=sys.stderr)
+        return 1
+    print(f"\nLoaded {rows:,} rows in {time.perf_counter() - started:.1f}s", file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    sys.exit(main())
@@ -1,13 +1,109 @@
 import sqlite3
-import pandas as pd
+import threading
+import hashlib
+import json
+import time
+import csv
 import os
+import csv_ingest
+import metrics
+from dataclasses import dataclass
+
+DB_PATH = os.environ.get('DATABASE_PATH', 'stocks.db')
+COMPANIES_CSV = 'static/companies.csv'
+STOCK_DATA_CSV = 'static/stock_data.csv'
+
+# One tuned connection per thread (and per process, so forked gunicorn workers never share a handle)
+_local = threading.local()
+
+# Materialized portfolio summary: (ledger version, summary dict)
+_summary_cache = None
+_summary_lock = threading.Lock()
+
+# Precomputed predictions are served until they are this old; each ticker keeps its last few versions
+PREDICTION_TTL = int(os.environ.get('PREDICTION_TTL', str(24 * 3600)))
+PREDICTION_HISTORY = 30
+# A claimed run that never finished (crashed or killed process) can be claimed again after this long
+PREDICTION_RUN_TIMEOUT = int(os.environ.get('PRECOMPUTE_CLAIM_TIMEOUT', str(3 * 3600)))
+
+PRAGMAS = (
+    'PRAGMA journal_mode=WAL',        # Readers don't block the writer
+    'PRAGMA synchronous=NORMAL',      # Safe with WAL, far fewer fsyncs
+    'PRAGMA cache_size=-16000',       # 16MB page cache
+    'PRAGMA mmap_size=67108864',      # 64MB memory-mapped reads
+    'PRAGMA temp_store=MEMORY',
+    'PRAGMA busy_timeout=30000',
+)
+
+@dataclass(frozen=True)
+class Company:
+    ticker: str
+    company_name: str
+    industry: str
+    sector: str
+
+@dataclass(frozen=True)
+class PopularCompany:
+    ticker: str
+    name: str
+    market_cap: float
+
+def get_connection():
+    """Return this thread's pooled connection, opening and tuning it on first use."""
+    conn = getattr(_local, 'conn', None)
+    if conn is None or _local.pid != os.getpid():
+        # cached_statements keeps the prepared form of every query below around for reuse
+        conn = sqlite3.connect(DB_PATH, timeout=30, cached_statements=256)
+        for pragma in PRAGMAS:
+            conn.execute(pragma)
+        _local.conn = conn
+        _local.pid = os.getpid()
+    return conn
+
+def close_connection():
+    """Close this thread's pooled connection (tests, shutdown)."""
+    conn = getattr(_local, 'conn', None)
+    if conn is not None:
+        conn.close()
+        _local.conn = None
+
+def _rows_as_dicts(cursor):
+    """Turn a cursor's remaining rows into dicts keyed by column name."""
+    columns = [column[0] for column in cursor.description]
+    return [dict(zip(columns, row)) for row in cursor.fetchall()]
 
 def init_db():
     """Initialize SQLite database and create tables from CSV files with memory optimization."""
     # Create database connection
-    conn = sqlite3.connect('stocks.db')
+    conn = get_connection()
     
     # Create portfolio simulation tables
+    _create_ledger_tables(conn)
+    _create_prediction_tables(conn)
+    
+    # Price/company tables and the change-detection ledger for the CSV seeds
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS csv_loads (
+            path TEXT PRIMARY KEY,
+            size INTEGER NOT NULL,
+            mtime REAL NOT NULL,
+            sha256 TEXT NOT NULL,
+            loaded_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    _ensure_stock_prices(conn)
+    conn.commit()
+    
+    # Only reload a CSV when its contents changed since the last boot
+    try:
+        _load_if_changed(conn, COMPANIES_CSV, _load_companies)
+        if os.path.exists(STOCK_DATA_CSV):
+            _load_if_changed(conn, STOCK_DATA_CSV, _load_stock_prices)
+    except FileNotFoundError as e:
+        print(f"Warning: {e}. Database initialized without CSV data.")
+
+def _create_ledger_tables(conn):
+    """Create the portfolio, trades and holdings tables and seed the starting cash."""
     cursor = conn.cursor()
     
     # Portfolio table to track overall portfolio value
@@ -61,30 +157,154 @@ def init_db():
             VALUES (date('now'), 10000.0, 10000.0, 0.0)
         ''')
     
+    # Trade/performance indexes keep the summary queries cheap as the ledger grows
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_portfolio_date ON portfolio (date, id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_trades_trade_date ON trades (trade_date, id)')
+    
+    # Bumped in the same transaction as every ledger write; cached summaries compare against it
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS ledger_version (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            version INTEGER NOT NULL
+        )
+    ''')
+    cursor.execute('INSERT OR IGNORE INTO ledger_version (id, version) VALUES (1, 0)')
+    
     conn.commit()
+
+def _create_prediction_tables(conn):
+    """Create the versioned predictions table and the scheduler's run log."""
+    # One row per computed prediction; (ticker, version) is append-only and the highest version is served
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS predictions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            ticker TEXT NOT NULL,
+            version INTEGER NOT NULL,
+            run_id INTEGER,
+            bar_date TEXT,
+            prediction REAL NOT NULL,
+            last_close REAL NOT NULL,
+            confidence REAL NOT NULL,
+            feature_importance TEXT NOT NULL,
+            graph_data TEXT NOT NULL,
+            trade_message TEXT,
+            model_version TEXT,
+            computed_at REAL NOT NULL
+        )
+    ''')
+    if 'model_version' not in [row[1] for row in conn.execute('PRAGMA table_info(predictions)')]:
+        conn.execute('ALTER TABLE predictions ADD COLUMN model_version TEXT')  # Tables created before the API
+    conn.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_predictions_ticker_version ON predictions (ticker, version)')
     
-    # Read CSV files in chunks to reduce memory usage
+    # One row per market session; claiming it stops a second scheduler (worker, cron) from repeating the run
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS prediction_runs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            session TEXT UNIQUE NOT NULL,
+            started_at REAL NOT NULL,
+            finished_at REAL,
+            tickers INTEGER DEFAULT 0,
+            failures INTEGER DEFAULT 0
+        )
+    ''')
+    conn.commit()
+
+def _ensure_stock_prices(conn):
+    """Create the long (ticker, date) price table, replacing the old wide to_sql dump if present."""
+    columns = [row[1] for row in conn.execute('PRAGMA table_info(stock_prices)')]
+    if columns and 'ticker' not in columns:
+        # Earlier versions appended the raw multi-header CSV on every boot; it has no usable shape
+        conn.execute('DROP TABLE stock_prices')
+        conn.execute("DELETE FROM csv_loads WHERE path = ?", (STOCK_DATA_CSV,))
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS stock_prices (
+            ticker TEXT NOT NULL,
+            date TEXT NOT NULL,
+            open REAL,
+            high REAL,
+            low REAL,
+            close REAL,
+            volume INTEGER
+        )
+    ''')
+    conn.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_stock_prices_ticker_date ON stock_prices(ticker, date)')
+
+def _file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def _load_if_changed(conn, path, loader):
+    """Run loader(conn, path) in one transaction unless the file is unchanged since the last load."""
+    stat = os.stat(path)
+    row = conn.execute('SELECT size, mtime, sha256 FROM csv_loads WHERE path = ?', (path,)).fetchone()
+    if row and row[0] == stat.st_size and row[1] == stat.st_mtime:
+        return False  # Same size and mtime: skip without even hashing
+
+    sha256 = _file_sha256(path)
+    if row and row[0] == stat.st_size and row[2] == sha256:
+        # Touched (fresh checkout, copy) but identical content
+        conn.execute('UPDATE csv_loads SET mtime = ? WHERE path = ?', (stat.st_mtime, path))
+        conn.commit()
+        return False
+
     try:
-        # Read companies CSV (usually smaller)
-        companies_df = pd.read_csv('static/companies.csv')
-        companies_df.to_sql('companies', conn, if_exists='replace', index=False)
-        
-        # Read stock data in chunks if it's large
-        if os.path.exists('static/stock_data.csv'):
-            chunk_size = 10000  # Process in smaller chunks
-            for chunk in pd.read_csv('static/stock_data.csv', chunksize=chunk_size):
-                chunk.to_sql('stock_prices', conn, if_exists='append', index=False)
-    except FileNotFoundError as e:
-        print(f"Warning: {e}. Database initialized without CSV data.")
-    
-    conn.close()
+        conn.execute('BEGIN IMMEDIATE')
+        loader(conn, path)
+        conn.execute('''
+            INSERT INTO csv_loads (path, size, mtime, sha256) VALUES (?, ?, ?, ?)
+            ON CONFLICT(path) DO UPDATE SET size = excluded.size, mtime = excluded.mtime,
+                sha256 = excluded.sha256, loaded_at = CURRENT_TIMESTAMP
+        ''', (path, stat.st_size, stat.st_mtime, sha256))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return True
+
+def _load_companies(conn, path):
+    """Replace the companies table from the CSV with one executemany."""
+    conn.execute('DROP TABLE IF EXISTS companies')
+    conn.execute('''
+        CREATE TABLE companies (
+            ticker TEXT PRIMARY KEY,
+            company_name TEXT,
+            short_name TEXT,
+            industry TEXT,
+            description TEXT,
+            website TEXT,
+            logo TEXT,
+            ceo TEXT,
+            exchange TEXT,
+            market_cap REAL,
+            sector TEXT,
+            tag_1 TEXT,
+            tag_2 TEXT,
+            tag_3 TEXT
+        )
+    ''')
+    with open(path, newline='', encoding='utf-8') as f:
+        reader = csv.reader(f)
+        next(reader)  # Header
+        rows = ([value or None for value in row[:14]] for row in reader if row and row[0])
+        conn.executemany('INSERT OR REPLACE INTO companies VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', rows)
+    # Lookups by ticker and the market-cap leaderboard hit these on every page
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_companies_ticker ON companies(ticker COLLATE NOCASE)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_companies_market_cap ON companies(market_cap)')
+
+def _load_stock_prices(conn, path):
+    """Upsert a yfinance multi-ticker export (Price/Ticker/Date header rows) into stock_prices."""
+    csv_ingest.ingest(conn, path)
 
 def get_stock_data(ticker):
     """Get stock price data for a specific ticker with limit to reduce memory."""
-    conn = sqlite3.connect('stocks.db')
+    import pandas as pd  # Only this helper needs pandas; keep it off the web process's startup path
+    conn = get_connection()
     try:
         query = """
-        SELECT date, price, volume
+        SELECT date, open, high, low, close, volume
         FROM stock_prices
         WHERE ticker = ?
         ORDER BY date DESC
@@ -94,97 +314,143 @@ def get_stock_data(ticker):
     except Exception as e:
         print(f"Error getting stock data: {e}")
         df = pd.DataFrame()
-    finally:
-        conn.close()
     return df
 
 def get_company_info(ticker):
     """Get company information for a specific ticker."""
-    conn = sqlite3.connect('stocks.db')
     try:
-        query = """
+        row = get_connection().execute("""
         SELECT ticker, company_name, industry, sector
         FROM companies
         WHERE ticker = ? COLLATE NOCASE
-        """
-        df = pd.read_sql_query(query, conn, params=(ticker,))
-        result = df.to_dict('records')[0] if not df.empty else None
+        """, (ticker,)).fetchone()
+        result = Company(*row) if row else None
     except Exception as e:
         print(f"Error getting company info: {e}")
         result = None
-    finally:
-        conn.close()
     return result
 
 def popular_companies():
     """Get a list of popular companies based on market cap with reduced memory usage."""
-    conn = sqlite3.connect('stocks.db')
     try:
-        query = """
+        rows = get_connection().execute("""
         SELECT ticker, company_name, market_cap
         FROM companies
         ORDER BY market_cap DESC
         LIMIT 10
-        """
-        df = pd.read_sql_query(query, conn)
-        result = df.to_dict('records')
+        """).fetchall()
+        result = [PopularCompany(*row) for row in rows]
     except Exception as e:
         print(f"Error getting popular companies: {e}")
         # Return fallback data if database query fails
         result = [
-            {'ticker': 'AAPL', 'company_name': 'Apple Inc.', 'market_cap': 3000000000000},
-            {'ticker': 'MSFT', 'company_name': 'Microsoft Corp.', 'market_cap': 2800000000000},
-            {'ticker': 'GOOGL', 'company_name': 'Alphabet Inc.', 'market_cap': 1700000000000},
-            {'ticker': 'AMZN', 'company_name': 'Amazon.com Inc.', 'market_cap': 1500000000000},
-            {'ticker': 'TSLA', 'company_name': 'Tesla Inc.', 'market_cap': 800000000000}
+            PopularCompany('AAPL', 'Apple Inc.', 3000000000000),
+            PopularCompany('MSFT', 'Microsoft Corp.', 2800000000000),
+            PopularCompany('GOOGL', 'Alphabet Inc.', 1700000000000),
+            PopularCompany('AMZN', 'Amazon.com Inc.', 1500000000000),
+            PopularCompany('TSLA', 'Tesla Inc.', 800000000000)
         ]
-    finally:
-        conn.close()
     return result
 
+def get_search_rows():
+    """Fetch the columns the company search index is built from."""
+    try:
+        return get_connection().execute("""
+            SELECT ticker, company_name, short_name, market_cap
+            FROM companies
+        """).fetchall()
+    except Exception as e:
+        print(f"Error loading companies for search: {e}")
+        return []
+
+def list_companies(limit=100):
+    """List companies for autocomplete."""
+    try:
+        rows = get_connection().execute("""
+            SELECT ticker, company_name
+            FROM companies
+            LIMIT ?
+        """, (limit,)).fetchall()
+        result = [{'ticker': ticker, 'name': name} for ticker, name in rows]
+    except Exception as e:
+        print(f"Error listing companies: {e}")
+        result = []
+    return result
+
+def _ledger_version(conn):
+    row = conn.execute('SELECT version FROM ledger_version WHERE id = 1').fetchone()
+    return row[0] if row else None
+
+def _bump_ledger_version(conn):
+    """Mark the ledger as changed; call inside the writing transaction."""
+    conn.execute('UPDATE ledger_version SET version = version + 1 WHERE id = 1')
+
+def _load_portfolio_summary(conn):
+    """Run the summary queries; each one is served by an index."""
+    # Get latest portfolio value
+    portfolio_rows = _rows_as_dicts(conn.execute("""
+    SELECT * FROM portfolio 
+    ORDER BY date DESC, id DESC 
+    LIMIT 1
+    """))
+    
+    # Get current holdings
+    holdings = _rows_as_dicts(conn.execute("""
+    SELECT * FROM holdings 
+    WHERE shares > 0
+    ORDER BY current_value DESC
+    """))
+    
+    # Get recent trades
+    recent_trades = _rows_as_dicts(conn.execute("""
+    SELECT * FROM trades 
+    ORDER BY trade_date DESC, id DESC 
+    LIMIT 10
+    """))
+    
+    # Get portfolio performance over time
+    performance = _rows_as_dicts(conn.execute("""
+    SELECT date, total_value, daily_return 
+    FROM portfolio 
+    ORDER BY date DESC, id DESC 
+    LIMIT 30
+    """))
+    
+    return {
+        'current': portfolio_rows[0] if portfolio_rows else None,
+        'holdings': holdings,
+        'recent_trades': recent_trades,
+        'performance': performance
+    }
+
 def get_portfolio_summary():
-    """Get current portfolio summary."""
-    conn = sqlite3.connect('stocks.db')
+    """Get current portfolio summary, rebuilt only when the ledger version has moved.
+
+    The returned dict is shared between requests; treat it as read-only.
+    """
+    global _summary_cache
+    conn = get_connection()
     try:
-        # Get latest portfolio value
-        portfolio_query = """
-        SELECT * FROM portfolio 
-        ORDER BY date DESC 
-        LIMIT 1
-        """
-        portfolio_df = pd.read_sql_query(portfolio_query, conn)
-        
-        # Get current holdings
-        holdings_query = """
-        SELECT * FROM holdings 
-        WHERE shares > 0
-        ORDER BY current_value DESC
-        """
-        holdings_df = pd.read_sql_query(holdings_query, conn)
-        
-        # Get recent trades
-        trades_query = """
-        SELECT * FROM trades 
-        ORDER BY trade_date DESC 
-        LIMIT 10
-        """
-        trades_df = pd.read_sql_query(trades_query, conn)
-        
-        # Get portfolio performance over time
-        performance_query = """
-        SELECT date, total_value, daily_return 
-        FROM portfolio 
-        ORDER BY date DESC 
-        LIMIT 30
-        """
-        performance_df = pd.read_sql_query(performance_query, conn)
+        # One primary-key read decides whether the cached snapshot is still current,
+        # including after writes from other threads or worker processes
+        version = _ledger_version(conn)
+        cached = _summary_cache
+        if cached is not None and version is not None and cached[0] == version:
+            return cached[1]
         
-        portfolio_summary = {
-            'current': portfolio_df.to_dict('records')[0] if not portfolio_df.empty else None,
-            'holdings': holdings_df.to_dict('records'),
-            'recent_trades': trades_df.to_dict('records'),
-            'performance': performance_df.to_dict('records')
-        }
+        with _summary_lock:
+            cached = _summary_cache
+            if cached is not None and version is not None and cached[0] >= version:
+                return cached[1]  # Another thread rebuilt it while we waited
+            # Read the version and the rows from one snapshot so they always agree
+            conn.execute('BEGIN')
+            try:
+                version = _ledger_version(conn)
+                portfolio_summary = _load_portfolio_summary(conn)
+            finally:
+                conn.commit()
+            if version is not None:
+                _summary_cache = (version, portfolio_summary)
         
     except Exception as e:
         print(f"Error getting portfolio summary: {e}")
@@ -194,136 +460,310 @@ def get_portfolio_summary():
             'recent_trades': [],
             'performance': []
         }
-    finally:
-        conn.close()
     
     return portfolio_summary
 
+def _apply_trade(conn, ticker, prediction, confidence, current_price):
+    """Apply one trade inside the caller's write transaction and return its message.
+
+    Cash and stock value live on the latest portfolio row as running totals and are
+    moved by deltas, so no trade ever rescans holdings.
+    """
+    portfolio_id, cash_balance = conn.execute(
+        'SELECT id, cash_balance FROM portfolio ORDER BY id DESC LIMIT 1').fetchone()
+    holding = conn.execute('SELECT shares, avg_price, current_price FROM holdings WHERE ticker = ?',
+                           (ticker,)).fetchone()
+    old_shares, avg_price, old_price = holding or (0.0, current_price, current_price)
+
+    # Simple trading strategy
+    trade_amount = min(1000, cash_balance * 0.1)  # Max 10% of cash or $1000
+
+    if prediction > current_price and confidence > 0.6 and cash_balance >= trade_amount:  # Buy signal
+        action, shares = 'BUY', trade_amount / current_price
+        new_shares = old_shares + shares
+        avg_price = ((old_shares * avg_price) + (shares * current_price)) / new_shares
+        cash_delta = -trade_amount
+    elif prediction < current_price and confidence > 0.6 and old_shares > 0:  # Sell signal
+        action, shares = 'SELL', old_shares * 0.5  # Sell half the position
+        trade_amount = shares * current_price
+        new_shares = old_shares - shares
+        cash_delta = trade_amount
+    else:
+        return "No trade executed (low confidence or insufficient conditions)"
+
+    conn.execute('''
+        INSERT INTO trades (ticker, action, shares, price, total_amount, prediction, confidence, trade_date)
+        VALUES (?, ?, ?, ?, ?, ?, ?, date('now'))
+    ''', (ticker, action, shares, current_price, trade_amount, prediction, confidence))
+
+    if new_shares > 0:
+        conn.execute('''
+            INSERT INTO holdings (ticker, shares, avg_price, current_price, current_value, total_return)
+            VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT(ticker) DO UPDATE SET shares = excluded.shares, avg_price = excluded.avg_price,
+                current_price = excluded.current_price, current_value = excluded.current_value,
+                total_return = excluded.total_return, updated_at = CURRENT_TIMESTAMP
+        ''', (ticker, new_shares, avg_price, current_price, new_shares * current_price,
+              (current_price / avg_price - 1) * 100))
+    else:
+        conn.execute('DELETE FROM holdings WHERE ticker = ?', (ticker,))
+
+    # The trade also marks this holding to the new price
+    stocks_delta = new_shares * current_price - old_shares * old_price
+    conn.execute('''
+        UPDATE portfolio
+        SET cash_balance = cash_balance + ?, total_stocks_value = total_stocks_value + ?,
+            total_value = total_value + ?
+        WHERE id = ?
+    ''', (cash_delta, stocks_delta, cash_delta + stocks_delta, portfolio_id))
+
+    verb = 'Bought' if action == 'BUY' else 'Sold'
+    return f"{verb} {shares:.2f} shares of {ticker} at ${current_price:.2f}"
+
+def simulate_trades(orders):
+    """Apply many (ticker, prediction, confidence, current_price) orders in one atomic commit.
+
+    BEGIN IMMEDIATE takes the write lock before cash is read, so concurrent callers
+    (threads or gunicorn workers) queue up instead of spending the same balance twice.
+    """
+    conn = get_connection()
+    try:
+        with metrics.span('trade'):
+            conn.execute('BEGIN IMMEDIATE')
+            changes_before = conn.total_changes
+            messages = [_apply_trade(conn, *order) for order in orders]
+            if conn.total_changes != changes_before:
+                _bump_ledger_version(conn)
+        with metrics.span('db_commit'):
+            conn.commit()
+        return messages
+    except Exception as e:
+        conn.rollback()
+        print(f"Error simulating trades: {e}")
+        return ["Trade simulation failed"] * len(orders)
+
 def simulate_trade(ticker, prediction, confidence, current_price):
     """Simulate a trade based on prediction."""
-    conn = sqlite3.connect('stocks.db')
+    return simulate_trades([(ticker, prediction, confidence, current_price)])[0]
+
+def store_predictions(rows, run_id=None):
+    """Append a new version of each ticker's prediction in one commit; returns the versions written.
+
+    Each row is a dict with ticker, prediction, last_close, confidence (0-1), feature_importance,
+    graph_data and optionally bar_date, trade_message and model_version. Rows without a
+    trade_message have not been traded yet; see trade_predictions.
+    """
+    conn = get_connection()
+    now = time.time()
     try:
-        cursor = conn.cursor()
-        
-        # Get current portfolio
-        cursor.execute('SELECT cash_balance FROM portfolio ORDER BY date DESC LIMIT 1')
-        cash_balance = cursor.fetchone()[0]
-        
-        # Simple trading strategy
-        trade_amount = min(1000, cash_balance * 0.1)  # Max 10% of cash or $1000
-        
-        if prediction > current_price and confidence > 0.6:  # Buy signal
-            shares_to_buy = trade_amount / current_price
-            if cash_balance >= trade_amount:
-                # Record trade
-                cursor.execute('''
-                    INSERT INTO trades (ticker, action, shares, price, total_amount, prediction, confidence, trade_date)
-                    VALUES (?, 'BUY', ?, ?, ?, ?, ?, date('now'))
-                ''', (ticker, shares_to_buy, current_price, trade_amount, prediction, confidence))
-                
-                # Update holdings
-                cursor.execute('SELECT shares, avg_price FROM holdings WHERE ticker = ?', (ticker,))
-                holding = cursor.fetchone()
-                
-                if holding:
-                    old_shares, old_avg_price = holding
-                    new_shares = old_shares + shares_to_buy
-                    new_avg_price = ((old_shares * old_avg_price) + (shares_to_buy * current_price)) / new_shares
-                    cursor.execute('''
-                        UPDATE holdings 
-                        SET shares = ?, avg_price = ?, current_price = ?, updated_at = CURRENT_TIMESTAMP
-                        WHERE ticker = ?
-                    ''', (new_shares, new_avg_price, current_price, ticker))
-                else:
-                    cursor.execute('''
-                        INSERT INTO holdings (ticker, shares, avg_price, current_price)
-                        VALUES (?, ?, ?, ?)
-                    ''', (ticker, shares_to_buy, current_price, current_price))
-                
-                # Update cash balance
-                new_cash_balance = cash_balance - trade_amount
-                cursor.execute('''
-                    UPDATE portfolio 
-                    SET cash_balance = ?, updated_at = CURRENT_TIMESTAMP 
-                    WHERE date = (SELECT MAX(date) FROM portfolio)
-                ''', (new_cash_balance,))
-                
-                conn.commit()
-                return f"Bought {shares_to_buy:.2f} shares of {ticker} at ${current_price:.2f}"
-        
-        elif prediction < current_price and confidence > 0.6:  # Sell signal
-            cursor.execute('SELECT shares FROM holdings WHERE ticker = ?', (ticker,))
-            holding = cursor.fetchone()
-            
-            if holding and holding[0] > 0:
-                shares_to_sell = holding[0] * 0.5  # Sell half the position
-                sell_amount = shares_to_sell * current_price
-                
-                # Record trade
-                cursor.execute('''
-                    INSERT INTO trades (ticker, action, shares, price, total_amount, prediction, confidence, trade_date)
-                    VALUES (?, 'SELL', ?, ?, ?, ?, ?, date('now'))
-                ''', (ticker, shares_to_sell, current_price, sell_amount, prediction, confidence))
-                
-                # Update holdings
-                new_shares = holding[0] - shares_to_sell
-                if new_shares > 0:
-                    cursor.execute('''
-                        UPDATE holdings 
-                        SET shares = ?, current_price = ?, updated_at = CURRENT_TIMESTAMP
-                        WHERE ticker = ?
-                    ''', (new_shares, current_price, ticker))
-                else:
-                    cursor.execute('DELETE FROM holdings WHERE ticker = ?', (ticker,))
-                
-                # Update cash balance
-                new_cash_balance = cash_balance + sell_amount
-                cursor.execute('''
-                    UPDATE portfolio 
-                    SET cash_balance = ?, updated_at = CURRENT_TIMESTAMP 
-                    WHERE date = (SELECT MAX(date) FROM portfolio)
-                ''', (new_cash_balance,))
-                
-                conn.commit()
-                return f"Sold {shares_to_sell:.2f} shares of {ticker} at ${current_price:.2f}"
-        
-        return "No trade executed (low confidence or insufficient conditions)"
-        
+        conn.execute('BEGIN IMMEDIATE')
+        versions = []
+        for row in rows:
+            ticker = row['ticker'].upper()
+            version = conn.execute('SELECT COALESCE(MAX(version), 0) + 1 FROM predictions WHERE ticker = ?',
+                                   (ticker,)).fetchone()[0]
+            conn.execute('''
+                INSERT INTO predictions (ticker, version, run_id, bar_date, prediction, last_close, confidence,
+                                         feature_importance, graph_data, trade_message, model_version, computed_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', (ticker, version, run_id, row.get('bar_date'), float(row['prediction']), float(row['last_close']),
+                  float(row['confidence']), json.dumps(row['feature_importance']), json.dumps(row['graph_data']),
+                  row.get('trade_message'), row.get('model_version'), now))
+            conn.execute('DELETE FROM predictions WHERE ticker = ? AND version <= ?',
+                         (ticker, version - PREDICTION_HISTORY))
+            versions.append(version)
+        conn.commit()
+        return versions
     except Exception as e:
-        print(f"Error simulating trade: {e}")
-        return "Trade simulation failed"
-    finally:
-        conn.close()
+        conn.rollback()
+        print(f"Error storing predictions: {e}")
+        return []
+
+def get_latest_prediction(ticker, max_age=PREDICTION_TTL, model_version=None):
+    """Newest stored prediction for a ticker (one index probe), or None when missing or stale.
+
+    With `model_version`, a row made by any other model (e.g. before a retune) is stale too.
+    """
+    try:
+        rows = _rows_as_dicts(get_connection().execute('''
+            SELECT ticker, version, run_id, bar_date, prediction, last_close, confidence,
+                   feature_importance, graph_data, trade_message, model_version, computed_at
+            FROM predictions
+            WHERE ticker = ?
+            ORDER BY version DESC
+            LIMIT 1
+        ''', (ticker.upper(),)))
+    except Exception as e:
+        print(f"Error reading stored prediction: {e}")
+        return None
+    if not rows or time.time() - rows[0]['computed_at'] > max_age:
+        return None
+    if model_version is not None and rows[0]['model_version'] != model_version:
+        return None
+    row = rows[0]
+    row['feature_importance'] = json.loads(row['feature_importance'])
+    row['graph_data'] = json.loads(row['graph_data'])
+    return row
+
+def trade_predictions(keys):
+    """Run the paper-trading rule on stored predictions, at most once each; returns their trade messages.
+
+    `keys` are (ticker, version) pairs. A prediction's trade_message is NULL until it has been
+    traded; one that already has a message is not traded again and keeps that message. The check
+    and the trade share one BEGIN IMMEDIATE transaction, so concurrent callers can't both trade it.
+    """
+    conn = get_connection()
+    try:
+        with metrics.span('trade'):
+            conn.execute('BEGIN IMMEDIATE')
+            messages, traded = [], False
+            for ticker, version in keys:
+                row = conn.execute('SELECT prediction, confidence, last_close, trade_message FROM predictions '
+                                   'WHERE ticker = ? AND version = ?', (ticker.upper(), version)).fetchone()
+                if row is None or row[3] is not None:
+                    messages.append(row[3] if row else None)
+                    continue
+                changes_before = conn.total_changes
+                message = _apply_trade(conn, ticker.upper(), row[0], row[1], row[2])
+                traded = traded or conn.total_changes != changes_before
+                conn.execute('UPDATE predictions SET trade_message = ? WHERE ticker = ? AND version = ?',
+                             (message, ticker.upper(), version))
+                messages.append(message)
+            if traded:
+                _bump_ledger_version(conn)
+        with metrics.span('db_commit'):
+            conn.commit()
+        return messages
+    except Exception as e:
+        conn.rollback()
+        print(f"Error trading stored predictions: {e}")
+        return ["Trade simulation failed"] * len(keys)
+
+def claim_prediction_run(session):
+    """Start the run for a market session; returns its id, or None if another process already claimed it."""
+    conn = get_connection()
+    try:
+        # An unfinished claim older than the timeout belongs to a run that died; take it over
+        conn.execute('DELETE FROM prediction_runs WHERE session = ? AND finished_at IS NULL AND started_at < ?',
+                     (session, time.time() - PREDICTION_RUN_TIMEOUT))
+        cursor = conn.execute('INSERT OR IGNORE INTO prediction_runs (session, started_at) VALUES (?, ?)',
+                              (session, time.time()))
+        conn.commit()
+        return cursor.lastrowid if cursor.rowcount else None
+    except Exception as e:
+        conn.rollback()
+        print(f"Error claiming prediction run: {e}")
+        return None
+
+def finish_prediction_run(run_id, tickers, failures):
+    """Record how a scheduled run went."""
+    conn = get_connection()
+    try:
+        conn.execute('UPDATE prediction_runs SET finished_at = ?, tickers = ?, failures = ? WHERE id = ?',
+                     (time.time(), tickers, failures, run_id))
+        conn.commit()
+    except Exception as e:
+        conn.rollback()
+        print(f"Error finishing prediction run: {e}")
+
+def release_prediction_run(run_id):
+    """Drop an unfinished claim so the session can be run again."""
+    conn = get_connection()
+    try:
+        conn.execute('DELETE FROM prediction_runs WHERE id = ? AND finished_at IS NULL', (run_id,))
+        conn.commit()
+    except Exception as e:
+        conn.rollback()
+        print(f"Error releasing prediction run: {e}")
+
+def held_tickers():
+    """Tickers with an open paper position (the portfolio's watchlist)."""
+    try:
+        return [row[0] for row in get_connection().execute('SELECT ticker FROM holdings WHERE shares > 0')]
+    except Exception as e:
+        print(f"Error listing holdings: {e}")
+        return []
 
 def update_portfolio_value():
-    """Update the total portfolio value."""
-    conn = sqlite3.connect('stocks.db')
+    """Return the total portfolio value (kept current by every trade)."""
+    conn = get_connection()
     try:
-        cursor = conn.cursor()
-        
-        # Get current cash balance
-        cursor.execute('SELECT cash_balance FROM portfolio ORDER BY date DESC LIMIT 1')
-        cash_balance = cursor.fetchone()[0]
-        
-        # Calculate total stock value
-        cursor.execute('SELECT SUM(shares * current_price) FROM holdings WHERE shares > 0')
-        result = cursor.fetchone()
-        total_stocks_value = result[0] if result[0] else 0.0
-        
+        row = conn.execute('SELECT total_value FROM portfolio ORDER BY id DESC LIMIT 1').fetchone()
+        return row[0] if row else 10000.0
+    except Exception as e:
+        print(f"Error reading portfolio value: {e}")
+        return 10000.0
+
+def revalue_portfolio(prices):
+    """Mark every holding in `prices` ({ticker: close}) to market and record today's snapshot.
+
+    One write transaction: the holdings are updated with executemany, the stock value is
+    re-summed once and today's portfolio row is appended (or refreshed if it already exists)
+    with its return against the last snapshot of an earlier day. Returns the new totals.
+    """
+    conn = get_connection()
+    try:
+        conn.execute('BEGIN IMMEDIATE')
+        held = conn.execute('SELECT ticker FROM holdings WHERE shares > 0').fetchall()
+        updates = [(float(prices[ticker]),) * 3 + (ticker,) for ticker, in held if prices.get(ticker) is not None]
+        conn.executemany('''
+            UPDATE holdings
+            SET current_price = ?, current_value = shares * ?, total_return = (? / avg_price - 1) * 100,
+                updated_at = CURRENT_TIMESTAMP
+            WHERE ticker = ?
+        ''', updates)
+
+        total_stocks_value = conn.execute(
+            'SELECT COALESCE(SUM(current_value), 0) FROM holdings WHERE shares > 0').fetchone()[0]
+        latest_id, latest_date, cash_balance = conn.execute(
+            'SELECT id, date, cash_balance FROM portfolio ORDER BY id DESC LIMIT 1').fetchone()
         total_value = cash_balance + total_stocks_value
-        
-        # Update portfolio
-        cursor.execute('''
-            UPDATE portfolio 
-            SET total_value = ?, total_stocks_value = ?, updated_at = CURRENT_TIMESTAMP
-            WHERE date = (SELECT MAX(date) FROM portfolio)
-        ''', (total_value, total_stocks_value))
-        
+        previous = conn.execute('''
+            SELECT total_value FROM portfolio
+            WHERE date < date('now')
+            ORDER BY date DESC, id DESC
+            LIMIT 1
+        ''').fetchone()
+        daily_return = (total_value / previous[0] - 1) * 100 if previous and previous[0] else 0.0
+
+        today = conn.execute("SELECT date('now')").fetchone()[0]
+        if latest_date == today:
+            conn.execute('''
+                UPDATE portfolio
+                SET total_value = ?, total_stocks_value = ?, daily_return = ?
+                WHERE id = ?
+            ''', (total_value, total_stocks_value, daily_return, latest_id))
+        else:
+            # The new row becomes the latest, so later trades move its running totals
+            conn.execute('''
+                INSERT INTO portfolio (date, total_value, cash_balance, total_stocks_value, daily_return)
+                VALUES (?, ?, ?, ?, ?)
+            ''', (today, total_value, cash_balance, total_stocks_value, daily_return))
+        _bump_ledger_version(conn)
         conn.commit()
-        return total_value
-        
+        return {'holdings': len(held), 'repriced': len(updates), 'total_value': total_value,
+                'total_stocks_value': total_stocks_value, 'daily_return': daily_return}
     except Exception as e:
-        print(f"Error updating portfolio value: {e}")
-        return 10000.0
-    finally:
-        conn.close()
\ No newline at end of file
+        conn.rollback()
+        print(f"Error revaluing portfolio: {e}")
+        return None
+
+def rebuild_portfolio_totals():
+    """Recompute the running totals from holdings with a full scan (repair/verification only)."""
+    conn = get_connection()
+    try:
+        conn.execute('BEGIN IMMEDIATE')
+        total_stocks_value = conn.execute(
+            'SELECT COALESCE(SUM(shares * current_price), 0) FROM holdings WHERE shares > 0').fetchone()[0]
+        conn.execute('''
+            UPDATE portfolio
+            SET total_stocks_value = ?, total_value = cash_balance + ?
+            WHERE id = (SELECT MAX(id) FROM portfolio)
+        ''', (total_stocks_value, total_stocks_value))
+        _bump_ledger_version(conn)
+        conn.commit()
+        return total_stocks_value
+    except Exception as e:
+        conn.rollback()
+        print(f"Error rebuilding portfolio totals: {e}")
+        return None
@@ -0,0 +1,270 @@
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+from datetime import date, timedelta
+
+import numpy as np
+from joblib import Parallel, cpu_count, delayed
+from sklearn.ensemble import HistGradientBoostingRegressor, RandomForestRegressor
+from sklearn.linear_model import Ridge
+from threadpoolctl import threadpool_limits
+
+import price_store
+import model_cache
+import indicators
+import metrics
+from stock_predictor import MODEL_PARAMS
+
+logger = logging.getLogger(__name__)
+
+# Multi-horizon forecasts from several model families sharing one lagged feature matrix.
+# Row t only uses bars up to and including day t, and targets are log returns from close[t]
+# to close[t + h], so nothing from the forecast window leaks into the features.
+HORIZONS = (1, 5, 20)
+FORECAST_DAYS = 3 * 365   # Calendar days of history; 20-day targets need more than the predictor's year
+TEST_ROWS = 50            # Most recent labelled rows held out to score each model
+MIN_TRAIN_ROWS = 100
+
+
+def jobs_from_env(name):
+    """Parallel fits from the `name` environment variable, else the available cores."""
+    return int(os.environ.get(name, '0')) or cpu_count()  # Respects CPU affinity and cgroup quotas
+
+
+N_JOBS = jobs_from_env('FORECAST_JOBS')
+
+FEATURES = ['ret_1', 'ret_5', 'ret_10', 'ret_20', 'sma_5_gap', 'sma_20_gap', 'rsi',
+            'macd_hist', 'atr', 'bb_position', 'volume_z', 'range', 'gap']
+
+MODELS = {
+    'ridge': {'alpha': 1.0},
+    'hgb': {'max_iter': 200, 'learning_rate': 0.05, 'max_leaf_nodes': 15, 'random_state': 42},
+    'forest': dict(MODEL_PARAMS),
+}
+# Ridge and the forest fit every horizon at once as one multi-output model; HGB is single-output
+MULTI_OUTPUT = {'ridge', 'forest'}
+
+
+def lagged_features(data):
+    """Feature matrix for one ticker's columns; row t depends only on bars 0..t."""
+    close = np.asarray(data['Close'], dtype=np.float64)
+    high = np.asarray(data['High'], dtype=np.float64)
+    low = np.asarray(data['Low'], dtype=np.float64)
+    log_close = np.log(close)
+    ind = indicators.compute(high, low, close, data['Volume'])
+
+    X = np.full((len(close), len(FEATURES)), np.nan)
+    for column, lag in enumerate((1, 5, 10, 20)):
+        X[lag:, column] = log_close[lag:] - log_close[:-lag]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        X[:, 4] = close / ind['sma_5'] - 1
+        X[:, 5] = close / ind['sma_20'] - 1
+        X[:, 6] = ind['rsi'] / 100
+        X[:, 7] = ind['macd_hist'] / close
+        X[:, 8] = ind['atr'] / close
+        X[:, 9] = (close - ind['bb_lower']) / (ind['bb_upper'] - ind['bb_lower'])
+        X[:, 10] = ind['volume_z']
+        X[:, 11] = (high - low) / close
+        X[1:, 12] = np.asarray(data['Open'], dtype=np.float64)[1:] / close[:-1] - 1
+    return X, log_close
+
+
+def targets(log_close, horizons=HORIZONS):
+    """Log return from close[t] to close[t + h] for each horizon; NaN where the future is unknown."""
+    Y = np.full((len(log_close), len(horizons)), np.nan)
+    for column, h in enumerate(horizons):
+        Y[:-h, column] = log_close[h:] - log_close[:-h]
+    return Y
+
+
+def split(n_rows, horizons=HORIZONS, test_rows=TEST_ROWS):
+    """Chronological train/test slices shared by every model.
+
+    The test block is the last `test_rows` rows whose longest-horizon target is known. Training
+    stops max(horizons) rows before it, so no training target overlaps the test period.
+    """
+    labelled = n_rows - max(horizons)
+    test = slice(max(0, labelled - test_rows), labelled)
+    train = slice(0, max(0, test.start - max(horizons) + 1))
+    return train, test
+
+
+def _make_model(name, params, inner_jobs):
+    if name == 'ridge':
+        return Ridge(**params)
+    if name == 'hgb':
+        return HistGradientBoostingRegressor(**params)
+    return RandomForestRegressor(n_jobs=inner_jobs, **params)
+
+
+def _standardize(X, train):
+    """Scale by the training rows' mean and spread (for ridge; the trees don't care)."""
+    mean = X[train].mean(axis=0)
+    std = X[train].std(axis=0)
+    std[std == 0] = 1.0
+    return (X - mean) / std
+
+
+def _fit_task(ticker, name, params, horizons, window, X, Y, last_date, inner_jobs):
+    """Fit one model for `horizons` (a single horizon unless the model is multi-output).
+
+    `window` is (first row, stop row, total rows) of the training slice; it is part of the cache
+    key, so a model trained on other rows (another horizon set or history length) is never reused.
+    """
+    key = model_cache.make_key(ticker, last_date, FEATURES,
+                               dict(params, model=name, horizons=list(horizons), rows=list(window), forecast=True),
+                               model_cache.fingerprint(X, Y))
+    model = model_cache.get_model(key)
+    if model is None:
+        model = _make_model(name, params, inner_jobs)
+        model.fit(X, Y if Y.shape[1] > 1 else Y[:, 0])
+        model_cache.put_model(key, model)
+    return name, horizons, model
+
+
+def fit_models(ticker, X, Y, train, last_date, horizons=HORIZONS, models=None, n_jobs=None):
+    """Fit every (model, horizon) pair in parallel; returns {(name, h): (model, output column, training rows)}.
+
+    `train` is the shared training slice. With None each model trains on every row whose targets
+    it needs are known, which is what the live forecasts use.
+
+    Work runs on threads (the fits release the GIL), so the feature matrix is shared rather than
+    copied. The forest gets whatever cores the other tasks leave free, and OpenMP inside HGB is
+    held to one thread while the tasks run side by side.
+    """
+    models = models or list(MODELS)
+    n_jobs = n_jobs or N_JOBS
+    tasks = []
+    for name in models:
+        groups = [tuple(horizons)] if name in MULTI_OUTPUT else [(h,) for h in horizons]
+        for group in groups:
+            rows = train if train is not None else slice(0, len(X) - max(group))
+            columns = [horizons.index(h) for h in group]
+            X_part = _standardize(X, rows)[rows] if name == 'ridge' else X[rows]
+            tasks.append((name, group, rows, X_part, Y[rows][:, columns]))
+
+    outer = min(n_jobs, len(tasks))
+    inner = max(1, n_jobs - outer + 1)
+    with threadpool_limits(limits=1 if outer > 1 else None, user_api='openmp'):
+        fitted = Parallel(n_jobs=outer, prefer='threads')(
+            delayed(_fit_task)(ticker, name, MODELS[name], group, (rows.start, rows.stop, len(X)),
+                               X_part, Y_part, last_date, inner)
+            for name, group, rows, X_part, Y_part in tasks)
+
+    result = {}
+    for (_, _, rows, _, _), (name, group, model) in zip(tasks, fitted):
+        for h in group:
+            result[(name, h)] = (model, group.index(h), rows)
+    return result
+
+
+def _predict(model, output, X):
+    predicted = model.predict(X)
+    return predicted[:, output] if predicted.ndim > 1 else predicted
+
+
+def forecast(ticker, horizons=HORIZONS, models=None, days=FORECAST_DAYS, n_jobs=None):
+    """Forecast `ticker`'s close at each horizon with each model family.
+
+    Returns {'ticker', 'last_close', 'last_bar_date', 'forecasts': {h: {model: {...}}}, 'best': {h: model}},
+    where each model entry holds the forecast price and return plus its held-out MAE (in price)
+    and directional accuracy. None when there is not enough history.
+    """
+    horizons = tuple(sorted(horizons))
+    models = models or list(MODELS)
+    unknown = set(models) - set(MODELS)
+    if unknown:
+        raise ValueError(f"Unknown models: {', '.join(sorted(unknown))}")
+
+    with metrics.span('fetch'):
+        price_store.refresh(ticker)
+        price_store.backfill([ticker], date.today() - timedelta(days=days))
+    with metrics.span('load'):
+        data = price_store.load_columns(ticker, days=days, refresh_first=False)
+    with metrics.span('features'):
+        X, log_close = lagged_features(data)
+        Y = targets(log_close, horizons)
+        dates = np.asarray(data['Date'], dtype='datetime64[D]')
+    del data
+
+    # Drop indicator warm-up rows; the last rows stay even though their targets are unknown
+    first = int(np.argmax(np.isfinite(X).all(axis=1))) if len(X) else 0
+    X, Y, log_close, dates = X[first:], Y[first:], log_close[first:], dates[first:]
+    if not np.isfinite(X).all():
+        X = np.nan_to_num(X, nan=0.0, posinf=0.0, neginf=0.0)  # Flat stretches (zero ranges, zero volume)
+    train, test = split(len(X), horizons)
+    if train.stop - train.start < MIN_TRAIN_ROWS or test.stop <= test.start:
+        logger.error(f"Insufficient history to forecast {ticker} ({len(X)} rows)")
+        return None
+
+    with metrics.span('fit'):
+        # Scored on the held-out block, then refit on every labelled row (the newest bars included) to forecast
+        scored = fit_models(ticker, X, Y, train, dates[-1], horizons, models, n_jobs)
+        live = fit_models(ticker, X, Y, None, dates[-1], horizons, models, n_jobs)
+
+    with metrics.span('predict'):
+        last_close = float(np.exp(log_close[-1]))
+        forecasts = {h: {} for h in horizons}
+        for (name, h), (model, output, rows) in scored.items():
+            inputs = _standardize(X, rows) if name == 'ridge' else X
+            column = horizons.index(h)
+            held_out = _predict(model, output, inputs[test])
+            actual = Y[test, column]
+            base = np.exp(log_close[test])
+            mae = float(np.mean(np.abs(base * np.exp(held_out) - base * np.exp(actual))))
+            model, output, rows = live[(name, h)]
+            inputs = _standardize(X, rows) if name == 'ridge' else X
+            predicted = float(_predict(model, output, inputs[-1:])[0])
+            forecasts[h][name] = {
+                'price': last_close * float(np.exp(predicted)),
+                'return': float(np.expm1(predicted)),
+                'mae': mae,
+                'direction_accuracy': float(np.mean(np.sign(held_out) == np.sign(actual))),
+            }
+
+    return {
+        'ticker': ticker,
+        'last_close': last_close,
+        'last_bar_date': str(dates[-1]),
+        'forecasts': forecasts,
+        'best': {h: min(by_model, key=lambda name: by_model[name]['mae']) for h, by_model in forecasts.items()},
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Multi-horizon forecasts from ridge, gradient boosting and forest models.')
+    parser.add_argument('tickers', nargs='+', help='Ticker symbols')
+    parser.add_argument('--horizons', type=int, nargs='+', default=list(HORIZONS), help='Trading days ahead')
+    parser.add_argument('--models', nargs='+', choices=sorted(MODELS), default=None)
+    parser.add_argument('--jobs', type=int, default=None, help=f'Parallel fits (default {N_JOBS})')
+    parser.add_argument('--json', action='store_true', help='Write one JSON object per ticker')
+    args = parser.parse_args(argv)
+
+    status = 0
+    for ticker in args.tickers:
+        ticker = ticker.strip().upper()
+        started = time.perf_counter()
+        result = forecast(ticker, args.horizons, args.models, n_jobs=args.jobs)
+        if result is None:
+            print(f"{ticker}: not enough history", file=sys.stderr)
+            status = 1
+            continue
+        if args.json:
+            print(json.dumps(result))
+            continue
+        print(f"{ticker} last close {result['last_close']:.2f} on {result['last_bar_date']} "
+              f"({time.perf_counter() - started:.2f}s)")
+        for h, by_model in result['forecasts'].items():
+            for name, entry in sorted(by_model.items()):
+                marker = '*' if result['best'][h] == name else ' '
+                print(f"  {h:>3}d {marker}{name:<7} {entry['price']:>10.2f} ({entry['return']:+.2%})  "
+                      f"MAE {entry['mae']:.2f}  direction {entry['direction_accuracy']:.0%}")
+    return status
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.WARNING)
+    sys.exit(main())
@@ -0,0 +1,233 @@
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+from scipy.signal import lfilter
+
+# Vectorized technical indicators over NumPy arrays.
+# Every function works along the last axis, so inputs can be one series (days,)
+# or a batch of aligned series (tickers x days). Warm-up values are NaN.
+
+SMA_WINDOWS = (5, 20)
+EMA_FAST, EMA_SLOW, MACD_SIGNAL = 12, 26, 9
+RSI_PERIOD = 14
+ATR_PERIOD = 14
+BB_WINDOW, BB_K = 20, 2.0
+VOLUME_Z_WINDOW = 20
+
+# Bars kept in the incremental state for the windowed indicators
+TAIL = max(max(SMA_WINDOWS), BB_WINDOW, VOLUME_Z_WINDOW, RSI_PERIOD + 1)
+# Fewest bars init_state accepts: every recursive indicator must already be seeded
+MIN_BARS = max(EMA_SLOW + MACD_SIGNAL, RSI_PERIOD + 1, ATR_PERIOD, TAIL)
+
+
+def _as_float(values):
+    return np.asarray(values, dtype=np.float64)
+
+
+def rolling_mean(values, window):
+    """Trailing mean over `window` points."""
+    values = _as_float(values)
+    out = np.full(values.shape, np.nan)
+    if values.shape[-1] >= window:
+        out[..., window - 1:] = sliding_window_view(values, window, axis=-1).mean(axis=-1)
+    return out
+
+
+def rolling_std(values, window):
+    """Trailing population standard deviation over `window` points."""
+    values = _as_float(values)
+    out = np.full(values.shape, np.nan)
+    if values.shape[-1] >= window:
+        out[..., window - 1:] = sliding_window_view(values, window, axis=-1).std(axis=-1)
+    return out
+
+
+def _smooth(values, alpha, initial):
+    """y[t] = alpha * x[t] + (1 - alpha) * y[t-1], starting from y[-1] = initial (C loop via lfilter)."""
+    zi = ((1 - alpha) * np.asarray(initial, dtype=np.float64))[..., np.newaxis]
+    out, _ = lfilter([alpha], [1.0, alpha - 1.0], values, axis=-1, zi=zi)
+    return out
+
+
+def sma(values, window):
+    """Simple moving average."""
+    return rolling_mean(values, window)
+
+
+def ema(values, span):
+    """Exponential moving average seeded with the first value (pandas ewm(span, adjust=False))."""
+    values = _as_float(values)
+    if values.shape[-1] == 0:
+        return values.copy()
+    return _smooth(values, 2.0 / (span + 1), values[..., 0])
+
+
+def _changes(close):
+    delta = np.diff(close, axis=-1)
+    return np.where(delta > 0, delta, 0.0), np.where(delta < 0, -delta, 0.0)
+
+
+def _rsi_from_averages(avg_gain, avg_loss):
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return 100 - (100 / (1 + avg_gain / avg_loss))
+
+
+def _wilder(values, period, seed_end):
+    """Wilder smoothing: mean of the first `period` values ending at `seed_end`, then alpha = 1/period."""
+    out = np.full(values.shape, np.nan)
+    if values.shape[-1] <= seed_end:
+        return out
+    seed = values[..., seed_end - period + 1:seed_end + 1].mean(axis=-1)
+    out[..., seed_end] = seed
+    out[..., seed_end + 1:] = _smooth(values[..., seed_end + 1:], 1.0 / period, seed)
+    return out
+
+
+def rsi(close, period=RSI_PERIOD):
+    """Wilder's RSI."""
+    close = _as_float(close)
+    gain, loss = _changes(close)
+    out = np.full(close.shape, np.nan)
+    avg_gain = _wilder(gain, period, period - 1)
+    avg_loss = _wilder(loss, period, period - 1)
+    out[..., 1:] = _rsi_from_averages(avg_gain, avg_loss)
+    return out
+
+
+def rsi_sma(close, period=RSI_PERIOD):
+    """RSI from simple rolling means of gains and losses (the predictor's RSI feature, same as calculate_rsi)."""
+    close = _as_float(close)
+    gain, loss = _changes(close)
+    # calculate_rsi counts the first (undefined) change as zero, so pad with it
+    pad = [(0, 0)] * (close.ndim - 1) + [(1, 0)]
+    return _rsi_from_averages(rolling_mean(np.pad(gain, pad), period), rolling_mean(np.pad(loss, pad), period))
+
+
+def macd(close, fast=EMA_FAST, slow=EMA_SLOW, signal=MACD_SIGNAL):
+    """MACD line, signal line and histogram."""
+    line = ema(close, fast) - ema(close, slow)
+    signal_line = ema(line, signal)
+    return line, signal_line, line - signal_line
+
+
+def true_range(high, low, close):
+    """True range; the first bar has no previous close and uses high - low."""
+    high, low, close = _as_float(high), _as_float(low), _as_float(close)
+    tr = high - low
+    prev_close = close[..., :-1]
+    tr[..., 1:] = np.maximum(tr[..., 1:], np.maximum(np.abs(high[..., 1:] - prev_close),
+                                                     np.abs(low[..., 1:] - prev_close)))
+    return tr
+
+
+def atr(high, low, close, period=ATR_PERIOD):
+    """Average true range with Wilder smoothing."""
+    return _wilder(true_range(high, low, close), period, period - 1)
+
+
+def bollinger(close, window=BB_WINDOW, k=BB_K):
+    """Bollinger middle, upper and lower bands (population standard deviation)."""
+    mid = rolling_mean(close, window)
+    width = k * rolling_std(close, window)
+    return mid, mid + width, mid - width
+
+
+def volume_zscore(volume, window=VOLUME_Z_WINDOW):
+    """How many standard deviations today's volume is from its trailing mean."""
+    volume = _as_float(volume)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return (volume - rolling_mean(volume, window)) / rolling_std(volume, window)
+
+
+def compute(high, low, close, volume):
+    """Compute every indicator for one series or a tickers x days batch."""
+    high, low, close, volume = _as_float(high), _as_float(low), _as_float(close), _as_float(volume)
+    line, signal_line, hist = macd(close)
+    mid, upper, lower = bollinger(close)
+    out = {f'sma_{window}': sma(close, window) for window in SMA_WINDOWS}
+    out.update({
+        f'ema_{EMA_FAST}': ema(close, EMA_FAST),
+        f'ema_{EMA_SLOW}': ema(close, EMA_SLOW),
+        'rsi': rsi(close),
+        'rsi_sma': rsi_sma(close),
+        'macd': line,
+        'macd_signal': signal_line,
+        'macd_hist': hist,
+        'atr': atr(high, low, close),
+        'bb_mid': mid,
+        'bb_upper': upper,
+        'bb_lower': lower,
+        'volume_z': volume_zscore(volume),
+    })
+    return out
+
+
+# --- Incremental mode ------------------------------------------------------
+# State is a plain dict of arrays (picklable, one entry per ticker along the
+# leading axis) holding the recursive averages plus the last TAIL raw bars.
+
+def _state_from(high, low, close, volume, indicators):
+    gain, loss = _changes(close)
+    return {
+        'tail': {name: values[..., -TAIL:].copy() for name, values in
+                 (('high', high), ('low', low), ('close', close), ('volume', volume))},
+        'ema_fast': indicators[f'ema_{EMA_FAST}'][..., -1].copy(),
+        'ema_slow': indicators[f'ema_{EMA_SLOW}'][..., -1].copy(),
+        'macd_signal': indicators['macd_signal'][..., -1].copy(),
+        'avg_gain': _wilder(gain, RSI_PERIOD, RSI_PERIOD - 1)[..., -1].copy(),
+        'avg_loss': _wilder(loss, RSI_PERIOD, RSI_PERIOD - 1)[..., -1].copy(),
+        'atr': indicators['atr'][..., -1].copy(),
+    }
+
+
+def init_state(high, low, close, volume):
+    """Compute indicators over the full history and return (indicators, state) for later updates."""
+    high, low, close, volume = _as_float(high), _as_float(low), _as_float(close), _as_float(volume)
+    if close.shape[-1] < MIN_BARS:
+        raise ValueError(f"Need at least {MIN_BARS} bars to seed indicator state, got {close.shape[-1]}")
+    indicators = compute(high, low, close, volume)
+    return indicators, _state_from(high, low, close, volume, indicators)
+
+
+def update(state, high, low, close, volume):
+    """Advance the state by new bars only, in O(new bars); returns (indicators for the new bars, new state)."""
+    new = {'high': _as_float(high), 'low': _as_float(low), 'close': _as_float(close), 'volume': _as_float(volume)}
+    count = new['close'].shape[-1]
+    if count == 0:
+        return {}, state
+    tail = state['tail']
+    # Windowed indicators only need the stored tail plus the new bars
+    joined = {name: np.concatenate([tail[name], new[name]], axis=-1) for name in new}
+    close_j = joined['close']
+
+    out = {f'sma_{window}': sma(close_j, window)[..., -count:] for window in SMA_WINDOWS}
+    out['rsi_sma'] = rsi_sma(close_j)[..., -count:]
+    mid, upper, lower = bollinger(close_j)
+    out.update(bb_mid=mid[..., -count:], bb_upper=upper[..., -count:], bb_lower=lower[..., -count:])
+    out['volume_z'] = volume_zscore(joined['volume'])[..., -count:]
+
+    # Recursive indicators continue from the stored averages
+    ema_fast = _smooth(new['close'], 2.0 / (EMA_FAST + 1), state['ema_fast'])
+    ema_slow = _smooth(new['close'], 2.0 / (EMA_SLOW + 1), state['ema_slow'])
+    line = ema_fast - ema_slow
+    signal_line = _smooth(line, 2.0 / (MACD_SIGNAL + 1), state['macd_signal'])
+    out.update({f'ema_{EMA_FAST}': ema_fast, f'ema_{EMA_SLOW}': ema_slow,
+                'macd': line, 'macd_signal': signal_line, 'macd_hist': line - signal_line})
+
+    gain, loss = _changes(close_j[..., -(count + 1):])
+    avg_gain = _smooth(gain, 1.0 / RSI_PERIOD, state['avg_gain'])
+    avg_loss = _smooth(loss, 1.0 / RSI_PERIOD, state['avg_loss'])
+    out['rsi'] = _rsi_from_averages(avg_gain, avg_loss)
+
+    tr = true_range(joined['high'], joined['low'], close_j)[..., -count:]
+    out['atr'] = _smooth(tr, 1.0 / ATR_PERIOD, state['atr'])
+
+    new_state = {
+        'tail': {name: values[..., -TAIL:].copy() for name, values in joined.items()},
+        'ema_fast': ema_fast[..., -1].copy(),
+        'ema_slow': ema_slow[..., -1].copy(),
+        'macd_signal': signal_line[..., -1].copy(),
+        'avg_gain': avg_gain[..., -1].copy(),
+        'avg_loss': avg_loss[..., -1].copy(),
+        'atr': out['atr'][..., -1].copy(),
+    }
+    return out, new_state
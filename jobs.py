@@ -0,0 +1,118 @@
+import os
+import time
+import uuid
+import queue
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Background job queue so page renders never wait on downloads or model training
+JOB_WORKERS = int(os.environ.get('JOB_WORKERS', '1'))
+JOB_QUEUE_SIZE = int(os.environ.get('JOB_QUEUE_SIZE', '16'))
+RESULT_TTL = int(os.environ.get('JOB_RESULT_TTL', '900'))  # Finished results are served for 15 minutes
+FAILED_TTL = 60                                              # Failures are retried after a minute
+
+_queue = queue.Queue(maxsize=JOB_QUEUE_SIZE)
+_jobs = {}       # job id -> job dict
+_inflight = {}   # key -> id of the queued/running job for that key
+_latest = {}     # key -> id of the most recently finished job for that key
+_lock = threading.Lock()
+_workers = []
+
+
+class QueueFullError(RuntimeError):
+    """Raised when the job queue is at capacity; callers should ask the client to retry later."""
+
+
+def _start_workers():
+    """Start worker threads lazily so a preloaded gunicorn master never forks with live threads."""
+    while len(_workers) < JOB_WORKERS:
+        worker = threading.Thread(target=_work, name=f"job-worker-{len(_workers)}", daemon=True)
+        worker.start()
+        _workers.append(worker)
+
+
+def _work():
+    while True:
+        job_id, func, args = _queue.get()
+        with _lock:
+            job = _jobs[job_id]
+            job['status'] = 'running'
+            job['started_at'] = time.time()
+        try:
+            result = func(*args)
+            status, error = ('done', None) if result is not None else ('failed', 'No result')
+        except Exception as e:
+            logger.error(f"Job {job_id} ({job['key']}) failed: {str(e)}")
+            result, status, error = None, 'failed', str(e)
+        with _lock:
+            job.update(status=status, result=result, error=error, finished_at=time.time())
+            _inflight.pop(job['key'], None)
+            _latest[job['key']] = job_id
+        _queue.task_done()
+
+
+def _prune(now):
+    """Forget finished jobs nobody can ask for anymore."""
+    for job_id in [job_id for job_id, job in _jobs.items()
+                   if job['finished_at'] and now - job['finished_at'] > RESULT_TTL]:
+        job = _jobs.pop(job_id)
+        if _latest.get(job['key']) == job_id:
+            del _latest[job['key']]
+
+
+def submit(key, func, *args):
+    """Queue func(*args) under `key`, coalescing with any queued or running job for the same key."""
+    now = time.time()
+    with _lock:
+        _prune(now)
+        job_id = _inflight.get(key)
+        if job_id is not None:
+            return dict(_jobs[job_id])
+
+        job_id = uuid.uuid4().hex
+        job = {'id': job_id, 'key': key, 'status': 'queued', 'result': None, 'error': None,
+               'created_at': now, 'started_at': None, 'finished_at': None}
+        try:
+            _queue.put_nowait((job_id, func, args))
+        except queue.Full:
+            raise QueueFullError(f"Job queue is full ({JOB_QUEUE_SIZE} pending)")
+        _jobs[job_id] = job
+        _inflight[key] = job_id
+        _start_workers()
+        return dict(job)
+
+
+def get_job(job_id):
+    """Return a snapshot of a job, or None if it is unknown or expired."""
+    with _lock:
+        job = _jobs.get(job_id)
+        return dict(job) if job else None
+
+
+def latest(key):
+    """Return the most recent finished job for `key` while its result is still fresh."""
+    now = time.time()
+    with _lock:
+        job = _jobs.get(_latest.get(key))
+        if job is None:
+            return None
+        ttl = RESULT_TTL if job['status'] == 'done' else FAILED_TTL
+        return dict(job) if now - job['finished_at'] <= ttl else None
+
+
+def inflight(key):
+    """Return the queued or running job for `key`, if any."""
+    with _lock:
+        job_id = _inflight.get(key)
+        return dict(_jobs[job_id]) if job_id else None
+
+
+def stats():
+    """Queue depth and job counts for monitoring."""
+    with _lock:
+        counts = {}
+        for job in _jobs.values():
+            counts[job['status']] = counts.get(job['status'], 0) + 1
+        return {'queued': _queue.qsize(), 'capacity': JOB_QUEUE_SIZE, 'workers': len(_workers), 'jobs': counts}
@@ -0,0 +1,94 @@
+import gc
+import os
+import time
+import ctypes
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Memory governance: collect only when the process is over its RSS budget, and reuse scratch
+# buffers instead of reallocating them on every request
+RSS_BUDGET_MB = int(os.environ.get('RSS_BUDGET_MB', '400'))         # Headroom under a 512MB instance
+MIN_COLLECT_INTERVAL = float(os.environ.get('GC_MIN_INTERVAL', '5'))  # Seconds between forced collections
+SCRATCH_MAX_BYTES = 8 * 1024 * 1024  # Larger scratch requests get a one-off array instead of a kept buffer
+
+_lock = threading.Lock()
+_local = threading.local()
+_stats = {'checks': 0, 'collections': 0, 'freed_bytes': 0}
+_last_collect = 0.0
+
+try:
+    _malloc_trim = ctypes.CDLL('libc.so.6').malloc_trim  # glibc: hand freed arenas back to the OS
+except (OSError, AttributeError):
+    _malloc_trim = None
+
+
+def rss_bytes():
+    """Current resident set size, or None where /proc is unavailable."""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def budget_bytes():
+    return RSS_BUDGET_MB * 1024 * 1024
+
+
+def maybe_collect(force=False):
+    """Run a full collection only when RSS is over budget (at most once per MIN_COLLECT_INTERVAL)."""
+    global _last_collect
+    rss = rss_bytes()
+    with _lock:
+        _stats['checks'] += 1
+        now = time.monotonic()
+        if not force and (rss is None or rss <= budget_bytes() or now - _last_collect < MIN_COLLECT_INTERVAL):
+            return False
+        _last_collect = now
+
+    gc.collect()
+    if _malloc_trim is not None:
+        _malloc_trim(0)
+    after = rss_bytes()
+    with _lock:
+        _stats['collections'] += 1
+        if rss is not None and after is not None:
+            _stats['freed_bytes'] += max(0, rss - after)
+    logger.info(f"RSS {rss / 1e6 if rss else 0:.0f}MB over the {RSS_BUDGET_MB}MB budget; "
+                f"collected down to {after / 1e6 if after else 0:.0f}MB")
+    return True
+
+
+def scratch(name, shape, dtype='float64'):
+    """A per-thread reusable array of `shape`; contents are garbage and valid until the next call with `name`.
+
+    Buffers only grow, and requests over SCRATCH_MAX_BYTES get a fresh array so a one-off
+    large batch never pins memory for the life of the worker.
+    """
+    import numpy as np  # Only the prediction path uses scratch buffers; the web routes never load NumPy
+    dtype = np.dtype(dtype)
+    size = int(np.prod(shape))
+    if size * dtype.itemsize > SCRATCH_MAX_BYTES:
+        return np.empty(shape, dtype=dtype)
+    buffers = _local.__dict__.setdefault('buffers', {})
+    buffer = buffers.get(name)
+    if buffer is None or buffer.dtype != dtype or buffer.size < size:
+        buffer = buffers[name] = np.empty(max(size, 1), dtype=dtype)
+    return buffer[:size].reshape(shape)
+
+
+def batch_size(bytes_per_item, default):
+    """How many items fit in half the remaining RSS headroom, capped at `default`."""
+    rss = rss_bytes()
+    if rss is None:
+        return default
+    headroom = max(budget_bytes() - rss, 0) // 2
+    return max(1, min(default, headroom // max(bytes_per_item, 1)))
+
+
+def stats():
+    """Counters for /metrics."""
+    with _lock:
+        return dict(_stats, budget_bytes=budget_bytes())
@@ -0,0 +1,164 @@
+import os
+import time
+import logging
+import threading
+import tracemalloc
+from bisect import bisect_left
+from contextlib import contextmanager
+
+import memory
+
+logger = logging.getLogger(__name__)
+
+# In-process latency histograms and per-stage memory peaks, rendered in the Prometheus text format
+TRACE_MEMORY = os.environ.get('METRICS_TRACE_MEMORY', '0') == '1'  # tracemalloc costs ~2x on allocation-heavy code
+PROFILE_ENABLED = os.environ.get('PROFILE_REQUESTS', '0') == '1'  # Allow ?profile=1 dumps
+PROFILE_DIR = os.environ.get('PROFILE_DIR', 'profiles')
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_lock = threading.Lock()
+_histograms = {}   # (metric, label value) -> [bucket counts..., +Inf count], sum
+_memory_peaks = {}  # stage -> (last peak bytes, max peak bytes)
+_local = threading.local()
+
+_HELP = {
+    'stage_seconds': 'Time spent in each stage of a prediction request.',
+    'http_request_seconds': 'HTTP request latency by endpoint.',
+}
+_LABELS = {'stage_seconds': 'stage', 'http_request_seconds': 'endpoint'}
+
+
+def observe(metric, label, seconds):
+    """Record one latency sample in the histogram for (metric, label)."""
+    with _lock:
+        entry = _histograms.get((metric, label))
+        if entry is None:
+            entry = _histograms[(metric, label)] = [[0] * (len(BUCKETS) + 1), 0.0]
+        entry[0][bisect_left(BUCKETS, seconds)] += 1
+        entry[1] += seconds
+
+
+def _record_peak(stage, peak):
+    with _lock:
+        _, highest = _memory_peaks.get(stage, (0, 0))
+        _memory_peaks[stage] = (peak, max(highest, peak))
+
+
+@contextmanager
+def span(stage):
+    """Time a stage of the prediction path (and its peak traced memory when METRICS_TRACE_MEMORY=1).
+
+    Spans nest: an inner span's peak also counts toward its parent. Memory peaks come from the
+    process-wide tracemalloc counters, so concurrent requests blur them; use them on a quiet box.
+    """
+    tracing = TRACE_MEMORY and tracemalloc.is_tracing()
+    if tracing:
+        stack = _local.__dict__.setdefault('stack', [])
+        current, peak = tracemalloc.get_traced_memory()
+        if stack:
+            stack[-1][1] = max(stack[-1][1], peak)
+        tracemalloc.reset_peak()
+        stack.append([current, 0])
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe('stage_seconds', stage, time.perf_counter() - started)
+        if tracing:
+            _, peak = tracemalloc.get_traced_memory()
+            baseline, inner_peak = stack.pop()
+            peak = max(peak, inner_peak)
+            if stack:
+                stack[-1][1] = max(stack[-1][1], peak)
+            _record_peak(stage, max(0, peak - baseline))
+
+
+def start_memory_tracing():
+    """Turn on tracemalloc if METRICS_TRACE_MEMORY=1."""
+    if TRACE_MEMORY and not tracemalloc.is_tracing():
+        tracemalloc.start()
+
+
+def render(gauges=None, counters=None):
+    """Prometheus text exposition of every histogram, the stage memory peaks and extra gauges/counters."""
+    lines = []
+    with _lock:
+        histograms = {key: (list(counts), total) for key, (counts, total) in _histograms.items()}
+        peaks = dict(_memory_peaks)
+
+    for metric in sorted({metric for metric, _ in histograms}):
+        name = f"stock_predictor_{metric}"
+        label = _LABELS.get(metric, 'label')
+        lines += [f"# HELP {name} {_HELP.get(metric, metric)}", f"# TYPE {name} histogram"]
+        for (key_metric, value), (counts, total) in sorted(histograms.items()):
+            if key_metric != metric:
+                continue
+            cumulative = 0
+            for bound, count in zip(BUCKETS + (float('inf'),), counts):
+                cumulative += count
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                lines.append(f'{name}_bucket{{{label}="{value}",le="{le}"}} {cumulative}')
+            lines.append(f'{name}_sum{{{label}="{value}"}} {total:.6f}')
+            lines.append(f'{name}_count{{{label}="{value}"}} {cumulative}')
+
+    if peaks:
+        for suffix, index, help_text in (('last', 0, 'Peak traced memory of the latest run of each stage.'),
+                                         ('max', 1, 'Highest peak traced memory seen for each stage.')):
+            name = f"stock_predictor_stage_peak_bytes_{suffix}"
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} gauge"]
+            lines += [f'{name}{{stage="{stage}"}} {values[index]}' for stage, values in sorted(peaks.items())]
+
+    gauges = dict(gauges or {})
+    rss = memory.rss_bytes()
+    if rss is not None:
+        gauges['process_resident_memory_bytes'] = rss
+    for name, value in sorted(gauges.items()):
+        lines += [f"# TYPE {name} gauge", f"{name} {value}"]
+    for name, value in sorted((counters or {}).items()):
+        lines += [f"# TYPE {name} counter", f"{name} {value}"]
+    return '\n'.join(lines) + '\n'
+
+
+def reset():
+    """Drop every recorded sample (tests, benchmarks)."""
+    with _lock:
+        _histograms.clear()
+        _memory_peaks.clear()
+
+
+@contextmanager
+def profiled(name):
+    """Profile the enclosed block and write the report to PROFILE_DIR.
+
+    Uses pyinstrument (HTML) when it is installed, otherwise cProfile (.prof, open with snakeviz
+    or pstats). Yields a dict whose 'path' is filled in once the report is written.
+    """
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    stem = os.path.join(PROFILE_DIR, f"{time.strftime('%Y%m%d-%H%M%S')}-{name}-{os.getpid()}")
+    report = {'path': None}
+    try:
+        from pyinstrument import Profiler
+    except ImportError:
+        Profiler = None
+
+    if Profiler is not None:
+        profiler = Profiler()
+        profiler.start()
+        try:
+            yield report
+        finally:
+            profiler.stop()
+            report['path'] = f"{stem}.html"
+            with open(report['path'], 'w') as f:
+                f.write(profiler.output_html())
+    else:
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            yield report
+        finally:
+            profiler.disable()
+            report['path'] = f"{stem}.prof"
+            profiler.dump_stats(report['path'])
+    logger.info(f"Wrote profile {report['path']}")
@@ -0,0 +1,185 @@
+import os
+import sys
+import json
+import time
+import pickle
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+# Fitted models are kept in memory (LRU bounded by serialized size) and written through to disk
+MODEL_CACHE_DIR = os.environ.get('MODEL_CACHE_DIR', 'model_cache')
+MAX_MEMORY_BYTES = int(os.environ.get('MODEL_CACHE_MB', '64')) * 1024 * 1024
+MODEL_TTL = int(os.environ.get('MODEL_CACHE_TTL', str(24 * 3600)))  # One trading day is plenty
+MAX_DISK_BYTES = int(os.environ.get('MODEL_CACHE_DISK_MB', '512')) * 1024 * 1024
+PRUNE_INTERVAL = 300  # Seconds between directory scans, unless the writes since the last one could overflow the disk budget
+
+_models = OrderedDict()   # key -> (model, size_bytes, created_at)
+_memory_bytes = 0
+_lock = threading.Lock()
+_stats = {'hits': 0, 'disk_hits': 0, 'misses': 0, 'evictions': 0, 'disk_evictions': 0}
+_last_prune = 0.0
+_written_since_prune = 0
+
+
+def fingerprint(*arrays):
+    """Short hash of the training arrays, so a model fitted before bars were revised is never reused."""
+    digest = hashlib.sha1()
+    for array in arrays:
+        digest.update(repr(array.shape).encode())
+        digest.update(array.tobytes())
+    return digest.hexdigest()[:16]
+
+
+def make_key(ticker, last_bar_date, feature_columns, params, data=None):
+    """Build the registry key for (ticker, last bar date, feature set, hyperparameters, training data)."""
+    payload = json.dumps({
+        'ticker': ticker.upper(),
+        'last_bar': str(last_bar_date),
+        'features': list(feature_columns),
+        'params': params,
+        'data': data,
+    }, sort_keys=True, default=str)
+    return f"{ticker.upper()}-{hashlib.sha1(payload.encode()).hexdigest()[:16]}"
+
+
+def _path(key):
+    return os.path.join(MODEL_CACHE_DIR, f"{key}.joblib")
+
+
+def _expired(created_at, now=None):
+    return (now or time.time()) - created_at > MODEL_TTL
+
+
+def _remember(key, model, size, created_at):
+    """Insert into the in-memory LRU and evict least recently used models over budget."""
+    global _memory_bytes
+    if key in _models:
+        _memory_bytes -= _models.pop(key)[1]
+    _models[key] = (model, size, created_at)
+    _memory_bytes += size
+    while _memory_bytes > MAX_MEMORY_BYTES and len(_models) > 1:
+        _, (_, evicted_size, _) = _models.popitem(last=False)
+        _memory_bytes -= evicted_size
+        _stats['evictions'] += 1
+
+
+def get_model(key):
+    """Return a cached fitted model, checking memory first and then disk; None on a miss."""
+    global _memory_bytes
+    with _lock:
+        entry = _models.get(key)
+        if entry is not None:
+            if not _expired(entry[2]):
+                _models.move_to_end(key)
+                _stats['hits'] += 1
+                return entry[0]
+            _memory_bytes -= _models.pop(key)[1]
+
+    import joblib  # Pulls in NumPy; only needed once a prediction reaches the disk cache
+    path = _path(key)
+    try:
+        created_at = os.path.getmtime(path)
+        if not _expired(created_at):
+            model = joblib.load(path)
+            os.utime(path, (time.time(), created_at))  # atime is the disk LRU clock; mtime stays the creation time
+            with _lock:
+                _remember(key, model, os.path.getsize(path), created_at)
+                _stats['disk_hits'] += 1
+            return model
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        # A truncated or incompatible file is just a miss; it gets overwritten on the next put
+        logger.warning(f"Could not load cached model {key}: {e}")
+
+    with _lock:
+        _stats['misses'] += 1
+    return None
+
+
+def put_model(key, model):
+    """Store a fitted model in memory and persist it to disk for reuse across restarts."""
+    global _written_since_prune
+    import joblib
+    path = _path(key)
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        os.makedirs(MODEL_CACHE_DIR, exist_ok=True)
+        joblib.dump(model, tmp_path)
+        os.replace(tmp_path, path)  # Atomic so other workers never read half a file
+        size = os.path.getsize(path)
+    except Exception as e:
+        logger.warning(f"Could not persist model {key}: {e}")
+        try:
+            size = len(pickle.dumps(model, protocol=pickle.HIGHEST_PROTOCOL))  # Still counts against the memory budget
+        except Exception:
+            size = sys.getsizeof(model)
+    with _lock:
+        _remember(key, model, size, time.time())
+        _written_since_prune += size
+        due = (time.time() - _last_prune > PRUNE_INTERVAL or _written_since_prune > MAX_DISK_BYTES // 10)
+    if due:
+        prune_disk()
+
+
+def prune_disk(now=None, max_bytes=None):
+    """Delete persisted models older than the TTL, then least recently used ones over the disk budget."""
+    global _last_prune, _written_since_prune
+    now = now or time.time()
+    max_bytes = MAX_DISK_BYTES if max_bytes is None else max_bytes
+    with _lock:
+        _last_prune, _written_since_prune = now, 0
+    try:
+        names = os.listdir(MODEL_CACHE_DIR)
+    except FileNotFoundError:
+        return 0
+    removed, kept, total = 0, [], 0
+    for name in names:
+        path = os.path.join(MODEL_CACHE_DIR, name)
+        try:
+            st = os.stat(path)
+            if _expired(st.st_mtime, now):
+                os.remove(path)
+                removed += 1
+            else:
+                kept.append((max(st.st_atime, st.st_mtime), st.st_size, path))
+                total += st.st_size
+        except OSError:
+            continue
+    kept.sort()
+    for _, size, path in kept:
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+        except OSError:
+            continue
+        total -= size
+        removed += 1
+        with _lock:
+            _stats['disk_evictions'] += 1
+    return removed
+
+
+def stats():
+    """Return hit/miss counters and current memory usage of the registry."""
+    with _lock:
+        return dict(_stats, models=len(_models), memory_bytes=_memory_bytes)
+
+
+def clear(disk=False):
+    """Drop every in-memory model (and optionally the persisted ones)."""
+    global _memory_bytes
+    with _lock:
+        _models.clear()
+        _memory_bytes = 0
+        for name in _stats:
+            _stats[name] = 0
+    if disk and os.path.isdir(MODEL_CACHE_DIR):
+        for name in os.listdir(MODEL_CACHE_DIR):
+            os.remove(os.path.join(MODEL_CACHE_DIR, name))
@@ -0,0 +1,87 @@
+import os
+import csv
+import json
+import hashlib
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Which features and forest settings the live predictor trains a ticker with, and the model
+# version that names them. Standard library only, so the web process can check a stored
+# prediction's version without importing sklearn.
+SMA_WINDOW = 5
+RSI_PERIOD = 14
+MODEL_PARAMS = {'n_estimators': 50, 'max_depth': 10, 'random_state': 42}
+DEFAULT_CONFIG = {'params': MODEL_PARAMS, 'sma_window': SMA_WINDOW, 'rsi_period': RSI_PERIOD}
+# Per-ticker and per-sector settings written by tuning.py; without the file every ticker uses DEFAULT_CONFIG
+MODEL_CONFIG_PATH = os.environ.get('MODEL_CONFIG_PATH', 'model_configs.json')
+
+_configs = (None, {})  # (mtime, parsed MODEL_CONFIG_PATH)
+_sectors = None
+
+
+def feature_columns(sma_window=SMA_WINDOW, rsi_period=RSI_PERIOD):
+    """Feature names for the given indicator windows (the defaults give FEATURE_COLUMNS)."""
+    rsi = 'RSI' if rsi_period == RSI_PERIOD else f'RSI_{rsi_period}'
+    return ['Open', 'High', 'Low', 'Volume', f'SMA_{sma_window}', rsi]
+
+
+FEATURE_COLUMNS = feature_columns()
+
+
+def model_version(config=DEFAULT_CONFIG):
+    """Short hash of the features and hyperparameters a config trains with."""
+    features = feature_columns(config['sma_window'], config['rsi_period'])
+    return hashlib.sha1(json.dumps({'features': features, 'params': config['params']},
+                                   sort_keys=True).encode()).hexdigest()[:12]
+
+
+# Changes whenever the features or hyperparameters do; stored with every prediction and part of the API's ETag
+MODEL_VERSION = model_version()
+
+
+def _load_configs():
+    global _configs
+    try:
+        mtime = os.path.getmtime(MODEL_CONFIG_PATH)
+    except OSError:
+        return {}
+    if _configs[0] != mtime:
+        try:
+            with open(MODEL_CONFIG_PATH) as f:
+                _configs = (mtime, json.load(f))
+        except (OSError, ValueError) as e:
+            logger.error(f"Error reading {MODEL_CONFIG_PATH}: {str(e)}")
+            return {}
+    return _configs[1]
+
+
+def sector_of(ticker, path='static/companies.csv'):
+    """Sector from the companies CSV, or None when unknown."""
+    global _sectors
+    if _sectors is None:
+        with open(path, newline='', encoding='utf-8') as f:
+            _sectors = {row['ticker']: row.get('sector') or None for row in csv.DictReader(f) if row.get('ticker')}
+    return _sectors.get(ticker)
+
+
+def config_for(ticker):
+    """Tuned config for the ticker, else for its sector, else DEFAULT_CONFIG."""
+    configs = _load_configs()
+    if not configs:
+        return DEFAULT_CONFIG
+    tuned = configs.get('tickers', {}).get(ticker)
+    if tuned is None and configs.get('sectors'):
+        try:
+            tuned = configs['sectors'].get(sector_of(ticker))
+        except OSError:
+            tuned = None
+    if tuned is None:
+        return DEFAULT_CONFIG
+    return {'params': tuned['params'], 'sma_window': tuned.get('sma_window', SMA_WINDOW),
+            'rsi_period': tuned.get('rsi_period', RSI_PERIOD)}
+
+
+def current_version(ticker):
+    """Model version a prediction for `ticker` made right now would carry."""
+    return model_version(config_for(ticker))
@@ -0,0 +1,525 @@
+import os
+import re
+import sqlite3
+import threading
+import time
+import logging
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta, timezone
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# Local OHLCV store: one table per ticker keyed by trading day
+PRICE_DB = os.environ.get('PRICE_STORE_PATH', 'prices.db')
+COLUMNS_DIR = os.environ.get('PRICE_COLUMNS_PATH', 'price_columns')  # Memory-mapped read copies of each table
+HISTORY_DAYS = 365           # Same window the predictor used to download (period='1y')
+REFRESH_TTL = 3600           # Don't ask the provider again within an hour when nothing new arrived
+BULK_CHUNK = 200             # Tickers per bulk provider call
+MARKET_CLOSE_UTC_HOUR = 21   # 16:00 New York, conservative across DST
+
+OHLCV_COLUMNS = ['Open', 'High', 'Low', 'Close', 'Volume']
+EPOCH = date(1970, 1, 1)
+
+_TICKER_RE = re.compile(r'^[A-Za-z0-9.\-^=]{1,15}$')
+_locks = {}
+_locks_guard = threading.Lock()
+
+
+def _table_name(ticker):
+    """Return the quoted price table name for a ticker."""
+    if not ticker or not _TICKER_RE.match(ticker):
+        raise ValueError(f"Invalid ticker symbol: {ticker!r}")
+    return f'"px_{ticker.upper()}"'
+
+
+def _ticker_lock(ticker):
+    """Per-ticker lock so concurrent requests don't fetch the same bars twice."""
+    with _locks_guard:
+        return _locks.setdefault(ticker.upper(), threading.Lock())
+
+
+def _from_day(day):
+    """Convert days since the epoch back to a date."""
+    return EPOCH + timedelta(days=int(day))
+
+
+def expected_session(now=None):
+    """Most recent trading day whose close should already be available."""
+    now = now or datetime.now(timezone.utc)
+    day = now.date()
+    if day.weekday() >= 5 or now.hour < MARKET_CLOSE_UTC_HOUR:
+        day -= timedelta(days=1)
+    while day.weekday() >= 5:
+        day -= timedelta(days=1)
+    return day
+
+
+# --- Providers -------------------------------------------------------------
+# A provider is any callable provider(ticker, start) returning a DataFrame
+# indexed by date with Open/High/Low/Close/Volume columns. start is a date
+# (fetch bars on or after it) or None for the default history window.
+
+def _normalize_frame(frame):
+    """Flatten yfinance-style columns and keep only OHLCV."""
+    if frame is None or frame.empty:
+        return pd.DataFrame(columns=OHLCV_COLUMNS)
+    if isinstance(frame.columns, pd.MultiIndex):
+        frame = frame.copy()
+        frame.columns = frame.columns.get_level_values(0)
+    frame = frame[OHLCV_COLUMNS].apply(pd.to_numeric, errors='coerce')
+    frame.index = pd.to_datetime(frame.index)
+    return frame.dropna(subset=['Close'])
+
+
+def yfinance_provider(ticker, start=None):
+    """Fetch bars from Yahoo Finance."""
+    import yfinance as yf
+
+    if start is None:
+        data = yf.download(ticker, period='1y', auto_adjust=True, progress=False)
+    else:
+        data = yf.download(ticker, start=start.isoformat(), auto_adjust=True, progress=False)
+    return _normalize_frame(data)
+
+
+def _yfinance_many(tickers, start=None):
+    """Fetch many tickers in one Yahoo Finance request."""
+    import yfinance as yf
+
+    kwargs = {'period': '1y'} if start is None else {'start': start.isoformat()}
+    data = yf.download(list(tickers), auto_adjust=True, progress=False, group_by='ticker', threads=True, **kwargs)
+    if data is None or data.empty:
+        return {}
+    available = set(data.columns.get_level_values(0))
+    return {ticker: data[ticker] for ticker in tickers if ticker in available}
+
+
+yfinance_provider.many = _yfinance_many
+
+
+def csv_provider(path='static/stock_data.csv'):
+    """Build a provider that serves bars from a yfinance multi-ticker CSV export."""
+    cache = {}
+
+    def provider(ticker, start=None):
+        if 'frame' not in cache:
+            # Export layout: Price/Ticker/Date header rows, then one row per day
+            cache['frame'] = pd.read_csv(path, header=[0, 1], index_col=0, skiprows=[2], parse_dates=True)
+        frame = cache['frame']
+        if ticker not in frame.columns.get_level_values(1):
+            return pd.DataFrame(columns=OHLCV_COLUMNS)
+        bars = frame.xs(ticker, axis=1, level=1)
+        if start is not None:
+            bars = bars[bars.index >= pd.Timestamp(start)]
+        return _normalize_frame(bars)
+
+    provider.many = lambda tickers, start=None: {ticker: provider(ticker, start) for ticker in tickers}
+    return provider
+
+
+def frame_provider(frames):
+    """Build a provider that serves bars from in-memory frames keyed by ticker (handy for tests)."""
+    def provider(ticker, start=None):
+        bars = frames.get(ticker)
+        if bars is None:
+            return pd.DataFrame(columns=OHLCV_COLUMNS)
+        if start is not None:
+            bars = bars[bars.index >= pd.Timestamp(start)]
+        return _normalize_frame(bars)
+
+    return provider
+
+
+# PRICE_PROVIDER=csv serves the bundled export instead of hitting Yahoo (offline/dev boxes)
+_provider = csv_provider() if os.environ.get('PRICE_PROVIDER') == 'csv' else yfinance_provider
+
+
+def set_provider(provider):
+    """Replace the default provider used to fill the store."""
+    global _provider
+    _provider = provider
+
+
+# --- Store -----------------------------------------------------------------
+
+_migrated = set()  # Store paths whose price_meta already has the revision columns
+
+
+@contextmanager
+def _connect(db_path=None):
+    """Open the store, commit on success and always close the connection."""
+    conn = sqlite3.connect(db_path or PRICE_DB, timeout=30)
+    try:
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS price_meta (
+                ticker TEXT PRIMARY KEY,
+                last_day INTEGER,
+                checked_at REAL NOT NULL,
+                revision INTEGER NOT NULL DEFAULT 0,
+                mirror_revision INTEGER NOT NULL DEFAULT -1
+            )
+        ''')
+        path = db_path or PRICE_DB
+        if path not in _migrated:
+            columns = [row[1] for row in conn.execute('PRAGMA table_info(price_meta)')]
+            if 'revision' not in columns:  # Stores created before the column files tracked revisions
+                conn.execute('ALTER TABLE price_meta ADD COLUMN revision INTEGER NOT NULL DEFAULT 0')
+                conn.execute('ALTER TABLE price_meta ADD COLUMN mirror_revision INTEGER NOT NULL DEFAULT -1')
+                conn.commit()
+            _migrated.add(path)
+        with conn:
+            yield conn
+    finally:
+        conn.close()
+
+
+def _ensure_table(conn, ticker):
+    conn.execute(f'''
+        CREATE TABLE IF NOT EXISTS {_table_name(ticker)} (
+            day INTEGER PRIMARY KEY,
+            open REAL NOT NULL,
+            high REAL NOT NULL,
+            low REAL NOT NULL,
+            close REAL NOT NULL,
+            volume INTEGER NOT NULL
+        )
+    ''')
+
+
+def _read_meta(conn, ticker):
+    row = conn.execute('SELECT last_day, checked_at FROM price_meta WHERE ticker = ?',
+                       (ticker.upper(),)).fetchone()
+    return row if row else (None, 0.0)
+
+
+def is_fresh(ticker, db_path=None, now=None):
+    """Check whether the store already holds the latest expected bar for a ticker."""
+    with _connect(db_path) as conn:
+        last_day, checked_at = _read_meta(conn, ticker)
+    return _is_fresh(last_day, checked_at, now)
+
+
+def _is_fresh(last_day, checked_at, now=None):
+    if last_day is not None and _from_day(last_day) >= expected_session(now):
+        return True
+    # Holidays, provider lag and unknown tickers: don't hammer the provider for bars that don't exist yet
+    return time.time() - checked_at < REFRESH_TTL
+
+
+def store_bars(ticker, bars, db_path=None):
+    """Upsert a frame of bars into the store and return the number of rows written."""
+    bars = _normalize_frame(bars)
+    with _connect(db_path) as conn:
+        return _write_bars(conn, ticker, bars)
+
+
+def _write_bars(conn, ticker, bars):
+    _ensure_table(conn, ticker)
+    if not bars.empty:
+        days = (bars.index.values.astype('datetime64[D]').astype(np.int64)).tolist()
+        rows = zip(days,
+                   bars['Open'].astype(float).tolist(),
+                   bars['High'].astype(float).tolist(),
+                   bars['Low'].astype(float).tolist(),
+                   bars['Close'].astype(float).tolist(),
+                   bars['Volume'].fillna(0).astype(np.int64).tolist())
+        conn.executemany(f'INSERT OR REPLACE INTO {_table_name(ticker)} VALUES (?, ?, ?, ?, ?, ?)', rows)
+    last_day = conn.execute(f'SELECT MAX(day) FROM {_table_name(ticker)}').fetchone()[0]
+    # Any written bar (new, revised or a backfilled gap) bumps the revision the column file is checked against
+    conn.execute('''
+        INSERT INTO price_meta (ticker, last_day, checked_at, revision) VALUES (?, ?, ?, ?)
+        ON CONFLICT(ticker) DO UPDATE SET last_day = excluded.last_day, checked_at = excluded.checked_at,
+            revision = revision + excluded.revision
+    ''', (ticker.upper(), last_day, time.time(), 1 if len(bars) else 0))
+    return len(bars)
+
+
+def refresh(ticker, provider=None, db_path=None, force=False):
+    """Fetch only the bars newer than the last stored day; returns how many were added."""
+    provider = provider or _provider
+    with _ticker_lock(ticker):
+        with _connect(db_path) as conn:
+            last_day, checked_at = _read_meta(conn, ticker)
+            if not force and _is_fresh(last_day, checked_at):
+                return 0
+
+            start = _from_day(last_day + 1) if last_day is not None else None
+            logger.info(f"Fetching {ticker} bars since {start or 'start of window'}")
+            bars = provider(ticker, start)
+            bars = _normalize_frame(bars)
+            if last_day is not None and not bars.empty:
+                bars = bars[bars.index > pd.Timestamp(_from_day(last_day))]
+            return _write_bars(conn, ticker, bars)
+
+
+def refresh_many(tickers, provider=None, db_path=None, force=False):
+    """Refresh many tickers; providers exposing a `many(tickers, start)` attribute fetch stale ones in bulk."""
+    provider = provider or _provider
+    with _connect(db_path) as conn:
+        meta = {row[0]: (row[1], row[2]) for row in conn.execute('SELECT ticker, last_day, checked_at FROM price_meta')}
+    stale = [ticker for ticker in tickers
+             if force or not _is_fresh(*meta.get(ticker.upper(), (None, 0.0)))]
+    if not stale:
+        return 0
+
+    bulk = getattr(provider, 'many', None)
+    if bulk is None:
+        return sum(refresh(ticker, provider=provider, db_path=db_path, force=True) for ticker in stale)
+
+    added = 0
+    for i in range(0, len(stale), BULK_CHUNK):
+        chunk = stale[i:i + BULK_CHUNK]
+        last_days = [meta.get(ticker.upper(), (None, 0.0))[0] for ticker in chunk]
+        # One request per chunk starting at the oldest gap; a brand-new ticker needs the full window
+        start = None if None in last_days else _from_day(min(last_days) + 1)
+        logger.info(f"Bulk fetching {len(chunk)} tickers since {start or 'start of window'}")
+        frames = bulk(chunk, start)
+        with _connect(db_path) as conn:
+            for ticker, last_day in zip(chunk, last_days):
+                bars = _normalize_frame(frames.get(ticker))
+                if last_day is not None and not bars.empty:
+                    bars = bars[bars.index > pd.Timestamp(_from_day(last_day))]
+                added += _write_bars(conn, ticker, bars)
+    return added
+
+
+def backfill(tickers, start, provider=None, db_path=None):
+    """Make sure stored history reaches back to `start`; returns how many bars were added."""
+    provider = provider or _provider
+    start_day = (start - EPOCH).days
+    with _connect(db_path) as conn:
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS price_backfill (
+                ticker TEXT PRIMARY KEY,
+                start_day INTEGER NOT NULL
+            )
+        ''')
+        done = {row[0]: row[1] for row in conn.execute('SELECT ticker, start_day FROM price_backfill')}
+    missing = [ticker for ticker in dict.fromkeys(tickers)
+               if _TICKER_RE.match(ticker or '') and done.get(ticker.upper(), start_day + 1) > start_day]
+    if not missing:
+        return 0
+
+    bulk = getattr(provider, 'many', None)
+    added = 0
+    for i in range(0, len(missing), BULK_CHUNK):
+        chunk = missing[i:i + BULK_CHUNK]
+        logger.info(f"Backfilling {len(chunk)} tickers from {start}")
+        frames = bulk(chunk, start) if bulk else {ticker: provider(ticker, start) for ticker in chunk}
+        with _connect(db_path) as conn:
+            for ticker in chunk:
+                added += _write_bars(conn, ticker, _normalize_frame(frames.get(ticker)))
+                # Remember the attempt even if the ticker listed later than `start`
+                conn.execute('INSERT OR REPLACE INTO price_backfill (ticker, start_day) VALUES (?, ?)',
+                             (ticker.upper(), start_day))
+    return added
+
+
+def load_many(tickers, days=HISTORY_DAYS, provider=None, db_path=None, refresh_first=True):
+    """Bulk-load the last `days` of bars for many tickers as one long Ticker/Date/OHLCV frame sorted by ticker and date."""
+    tickers = [ticker for ticker in dict.fromkeys(tickers) if _TICKER_RE.match(ticker or '')]
+    if refresh_first:
+        refresh_many(tickers, provider=provider, db_path=db_path)
+
+    names, blocks = [], []
+    with _connect(db_path) as conn:
+        stored = {row[0] for row in conn.execute('SELECT ticker FROM price_meta WHERE last_day IS NOT NULL')}
+        for ticker in tickers:
+            if ticker.upper() not in stored:
+                continue
+            table = _table_name(ticker)
+            rows = conn.execute(f'''
+                SELECT day, open, high, low, close, volume FROM {table}
+                WHERE day > (SELECT MAX(day) FROM {table}) - ?
+                ORDER BY day
+            ''', (days,)).fetchall()
+            if rows:
+                names.append((ticker, len(rows)))
+                blocks.append(np.array(rows, dtype=np.float64))
+
+    if not blocks:
+        return pd.DataFrame(columns=['Ticker', 'Date'] + OHLCV_COLUMNS)
+
+    values = np.concatenate(blocks)
+    frame = pd.DataFrame(values[:, 1:], columns=OHLCV_COLUMNS)
+    frame.insert(0, 'Date', values[:, 0].astype(np.int64).astype('datetime64[D]').astype('datetime64[ns]'))
+    frame.insert(0, 'Ticker', np.repeat([name for name, _ in names], [count for _, count in names]))
+    frame['Volume'] = frame['Volume'].astype(np.int64)
+    return frame
+
+
+def load_prices(ticker, days=HISTORY_DAYS, provider=None, db_path=None, refresh_first=True):
+    """Return the last `days` calendar days of bars as a Date/Open/High/Low/Close/Volume frame."""
+    if refresh_first:
+        refresh(ticker, provider=provider, db_path=db_path)
+
+    with _connect(db_path) as conn:
+        _ensure_table(conn, ticker)
+        table = _table_name(ticker)
+        rows = conn.execute(f'''
+            SELECT day, open, high, low, close, volume FROM {table}
+            WHERE day > (SELECT COALESCE(MAX(day), 0) FROM {table}) - ?
+            ORDER BY day
+        ''', (days,)).fetchall()
+
+    if not rows:
+        return pd.DataFrame(columns=['Date'] + OHLCV_COLUMNS)
+
+    values = np.array(rows, dtype=np.float64)
+    frame = pd.DataFrame(values[:, 1:], columns=OHLCV_COLUMNS)
+    frame.insert(0, 'Date', values[:, 0].astype(np.int64).astype('datetime64[D]').astype('datetime64[ns]'))
+    frame['Volume'] = frame['Volume'].astype(np.int64)
+    return frame
+
+
+# --- Columnar read path ----------------------------------------------------
+# Each ticker's table is mirrored to one .npy file holding a (fields x days) float64
+# array, so every field is a contiguous row. Training reads it with np.load(mmap_mode='r')
+# and slices the last N days as views: no row tuples, no DataFrame, no copies until the
+# feature matrix is filled. SQLite stays the source of truth; a file is rewritten when
+# price_meta's revision (bumped by every write of bars) has moved past the one it was
+# exported at, or when its first or last day no longer matches the table. Day numbers and
+# volumes are whole numbers, exact in float64.
+
+COLUMN_FIELDS = ['Date'] + OHLCV_COLUMNS
+
+
+def _columns_path(ticker, columns_dir=None):
+    _table_name(ticker)  # Validates the symbol before it becomes a file name
+    return os.path.join(columns_dir or COLUMNS_DIR, f"{ticker.upper()}.npy")
+
+
+def _open_columns(path):
+    try:
+        array = np.load(path, mmap_mode='r')
+    except (OSError, ValueError):
+        return None  # Missing or half-written by a crashed process: rebuild it
+    return array if array.ndim == 2 and array.shape[0] == len(COLUMN_FIELDS) else None
+
+
+def _write_columns(conn, ticker, path, revision=None):
+    """Export a ticker's table to its column file (atomic replace) and return the memory-mapped copy."""
+    _ensure_table(conn, ticker)
+    rows = conn.execute(f'SELECT day, open, high, low, close, volume FROM {_table_name(ticker)} ORDER BY day').fetchall()
+    array = np.array(rows, dtype=np.float64).reshape(-1, len(COLUMN_FIELDS)).T.copy()
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        np.save(f, array)
+    os.replace(tmp_path, path)  # Readers see either the old file or the new one
+    if revision is not None:
+        # Read before the export, so a write racing it leaves the file marked stale rather than current
+        conn.execute('UPDATE price_meta SET mirror_revision = ? WHERE ticker = ?', (revision, ticker.upper()))
+    return _open_columns(path)
+
+
+def _columns_for(conn, ticker, columns_dir=None):
+    """Return the memory-mapped (fields x days) array for a ticker, re-exporting it if SQLite moved on."""
+    path = _columns_path(ticker, columns_dir)
+    array = _open_columns(path)
+    table = _table_name(ticker)
+    # Separate subqueries so each is a single primary-key seek (MIN and MAX together scan the table)
+    first, last = conn.execute(f'SELECT (SELECT MIN(day) FROM {table}), (SELECT MAX(day) FROM {table})').fetchone()
+    if first is None:
+        return None
+    meta = conn.execute('SELECT revision, mirror_revision FROM price_meta WHERE ticker = ?', (ticker.upper(),)).fetchone()
+    revision, exported = meta if meta else (None, None)
+    if (array is None or array.shape[1] == 0 or array[0, 0] != first or array[0, -1] != last
+            or revision != exported):
+        array = _write_columns(conn, ticker, path, revision)
+    return array
+
+
+def _window(array, days):
+    """Views of the last `days` calendar days of a column array, keyed like load_prices' columns."""
+    day = array[0]
+    start = np.searchsorted(day, day[-1] - days, side='right')
+    columns = {field: array[i, start:] for i, field in enumerate(COLUMN_FIELDS)}
+    columns['Date'] = columns['Date'].astype(np.int64).astype('datetime64[D]')
+    return columns
+
+
+def _empty_columns():
+    columns = {field: np.empty(0, dtype=np.float64) for field in OHLCV_COLUMNS}
+    columns['Date'] = np.empty(0, dtype='datetime64[D]')
+    return columns
+
+
+def load_columns(ticker, days=HISTORY_DAYS, provider=None, db_path=None, refresh_first=True, columns_dir=None):
+    """Like load_prices, but returns {column: array} with OHLCV columns as zero-copy memmap views."""
+    if refresh_first:
+        refresh(ticker, provider=provider, db_path=db_path)
+    with _connect(db_path) as conn:
+        _ensure_table(conn, ticker)
+        array = _columns_for(conn, ticker, columns_dir)
+    return _window(array, days) if array is not None else _empty_columns()
+
+
+def load_columns_many(tickers, days=HISTORY_DAYS, provider=None, db_path=None, refresh_first=True,
+                      columns_dir=None):
+    """Like load_many, but returns {column: array} (plus 'Ticker') concatenated from the column files."""
+    tickers = [ticker for ticker in dict.fromkeys(tickers) if _TICKER_RE.match(ticker or '')]
+    if refresh_first:
+        refresh_many(tickers, provider=provider, db_path=db_path)
+
+    names, windows = [], []
+    with _connect(db_path) as conn:
+        stored = {row[0] for row in conn.execute('SELECT ticker FROM price_meta WHERE last_day IS NOT NULL')}
+        for ticker in tickers:
+            if ticker.upper() not in stored:
+                continue
+            array = _columns_for(conn, ticker, columns_dir)
+            if array is not None:
+                names.append(ticker)
+                windows.append(_window(array, days))
+
+    if not windows:
+        return dict(_empty_columns(), Ticker=np.empty(0, dtype=object))
+    columns = {field: np.concatenate([window[field] for window in windows]) for field in COLUMN_FIELDS}
+    columns['Ticker'] = np.repeat(np.array(names, dtype=object), [len(window['Close']) for window in windows])
+    return columns
+
+
+LATEST_CHUNK = 400  # SELECTs per compound statement (SQLite's default limit is 500)
+
+
+def latest_closes(tickers, db_path=None):
+    """Return {TICKER: (date, close)} for the last stored bar of every ticker that has one.
+
+    price_meta already knows each ticker's last day, so every lookup is a primary-key seek;
+    they are batched into a few UNION ALL statements instead of one query per ticker.
+    """
+    tickers = [ticker.upper() for ticker in dict.fromkeys(tickers) if _TICKER_RE.match(ticker or '')]
+    closes = {}
+    with _connect(db_path) as conn:
+        last_days = dict(conn.execute('SELECT ticker, last_day FROM price_meta WHERE last_day IS NOT NULL'))
+        wanted = [(ticker, last_days[ticker]) for ticker in tickers if ticker in last_days]
+        for i in range(0, len(wanted), LATEST_CHUNK):
+            chunk = wanted[i:i + LATEST_CHUNK]
+            sql = ' UNION ALL '.join(f'SELECT ?, day, close FROM {_table_name(ticker)} WHERE day = ?'
+                                     for ticker, _ in chunk)
+            params = [value for pair in chunk for value in pair]
+            for ticker, day, close in conn.execute(sql, params):
+                closes[ticker] = (_from_day(day), close)
+    return closes
+
+
+def last_stored_date(ticker, db_path=None):
+    """Return the last stored trading day for a ticker, or None."""
+    with _connect(db_path) as conn:
+        last_day, _ = _read_meta(conn, ticker)
+    return _from_day(last_day) if last_day is not None else None
+
+
+def fill_from_csv(path='static/stock_data.csv', db_path=None):
+    """Seed the store from a yfinance multi-ticker CSV export."""
+    provider = csv_provider(path)
+    frame = pd.read_csv(path, header=[0, 1], index_col=0, skiprows=[2], nrows=0)
+    tickers = sorted(set(frame.columns.get_level_values(1)))
+    with _connect(db_path) as conn:
+        for ticker in tickers:
+            _write_bars(conn, ticker, provider(ticker))
+    return tickers
@@ -0,0 +1,194 @@
+import os
+import sys
+import time
+import logging
+import argparse
+import threading
+from datetime import datetime, timedelta, timezone
+
+import database
+
+logger = logging.getLogger(__name__)
+
+# After-close precomputation: score the popular and held tickers once per market session and
+# store the results in the predictions table, so /main serves them without training anything.
+# Each run then marks the portfolio to market.
+SCHEDULE_ENABLED = os.environ.get('PRECOMPUTE_SCHEDULE', '0') == '1'  # Run the loop inside the web process
+RUN_AT_UTC = os.environ.get('PRECOMPUTE_AT', '22:00')  # An hour after price_store.MARKET_CLOSE_UTC_HOUR
+EXTRA_TICKERS = [t.strip().upper() for t in os.environ.get('PRECOMPUTE_TICKERS', '').split(',') if t.strip()]
+TRADE = os.environ.get('PRECOMPUTE_TRADE', '0') == '1'  # Also apply the paper-trading rule to each prediction
+STORE_EVERY = 100  # Results written per commit
+RETRY_AFTER = 15 * 60  # Seconds before the loop retries a session whose run failed
+MAX_CLOSE_AGE_DAYS = 4  # Calendar days a close may trail the expected session (holidays) and still reprice
+
+_lock = threading.Lock()
+_thread = None
+
+
+def default_tickers():
+    """Popular companies, open positions and PRECOMPUTE_TICKERS, in that order."""
+    tickers = [company.ticker for company in database.popular_companies()]
+    tickers += database.held_tickers() + EXTRA_TICKERS
+    return list(dict.fromkeys(t.upper() for t in tickers))
+
+
+def precompute(tickers, trade=TRADE, run_id=None, max_workers=None):
+    """Predict every ticker and store the results; returns (stored, failures).
+
+    With `trade`, the stored predictions are paper-traded together once every ticker has been
+    scored, in one transaction, so a run that fails part-way leaves no trades behind for its
+    retry to repeat.
+    """
+    from stock_predictor import predict_many
+
+    failures, rows, stored = 0, [], []
+
+    def flush():
+        versions = database.store_predictions(rows, run_id)
+        stored.extend((row['ticker'], version) for row, version in zip(rows, versions))
+        rows.clear()
+
+    for result in predict_many(tickers, max_workers=max_workers, details=True):
+        if 'error' in result:
+            logger.warning(f"Precompute {result['ticker']}: {result['error']}")
+            failures += 1
+            continue
+        rows.append(dict(result, bar_date=result['last_bar_date']))
+        if len(rows) >= STORE_EVERY:
+            flush()
+    if rows:
+        flush()
+    if trade and stored:
+        database.trade_predictions(stored)
+    return len(stored), failures
+
+
+def revalue(refresh=True, now=None):
+    """Mark every open position to its latest stored close and append today's portfolio snapshot.
+
+    Closes older than the expected session (less MAX_CLOSE_AGE_DAYS) are skipped, so those
+    holdings keep their last price; the result's 'stale' counts them.
+    """
+    import price_store
+
+    tickers = database.held_tickers()
+    if refresh:
+        price_store.refresh_many(tickers)
+    cutoff = price_store.expected_session(now) - timedelta(days=MAX_CLOSE_AGE_DAYS)
+    closes = price_store.latest_closes(tickers)
+    stale = sorted(ticker for ticker, (day, _) in closes.items() if day < cutoff)
+    if stale:
+        logger.warning(f"Not repricing {len(stale)} holding(s) with no close since {cutoff}: "
+                       f"{', '.join(stale[:10])}{' ...' if len(stale) > 10 else ''}")
+    result = database.revalue_portfolio({ticker: close for ticker, (day, close) in closes.items() if day >= cutoff})
+    if result is not None:
+        result['stale'] = len(stale)
+        logger.info(f"Revalued {result['repriced']}/{result['holdings']} holdings ({len(stale)} stale): "
+                    f"${result['total_value']:,.2f} ({result['daily_return']:+.2f}%)")
+    return result
+
+
+def run_session(now=None, tickers=None, trade=TRADE, max_workers=None):
+    """Run the precomputation for the latest closed session unless some process already has."""
+    from price_store import expected_session
+
+    session = expected_session(now).isoformat()
+    run_id = database.claim_prediction_run(session)
+    if run_id is None:
+        logger.info(f"Predictions for {session} already computed or in progress")
+        return None
+    started = time.perf_counter()
+    try:
+        tickers = tickers or default_tickers()
+        stored, failures = precompute(tickers, trade=trade, run_id=run_id, max_workers=max_workers)
+        if failures and not stored:
+            raise RuntimeError(f"every ticker failed ({failures})")  # e.g. the price provider is down
+    except BaseException:
+        # Give the session back so the next attempt (loop retry, cron, restart) runs it
+        database.release_prediction_run(run_id)
+        raise
+    database.finish_prediction_run(run_id, stored, failures)
+    revalue()  # Held tickers were just refreshed by the run, so this is all local reads
+    logger.info(f"Precomputed {stored} predictions for {session} ({failures} failed) "
+                f"in {time.perf_counter() - started:.1f}s")
+    return stored, failures
+
+
+def seconds_until_next_run(now=None):
+    """Seconds until RUN_AT_UTC on the next weekday."""
+    now = now or datetime.now(timezone.utc)
+    hour, minute = (int(part) for part in RUN_AT_UTC.split(':'))
+    run_at = now.replace(hour=hour, minute=minute, second=0, microsecond=0)
+    if run_at <= now:
+        run_at += timedelta(days=1)
+    while run_at.weekday() >= 5:
+        run_at += timedelta(days=1)
+    return (run_at - now).total_seconds()
+
+
+def _loop():
+    while True:
+        try:
+            run_session()  # Catches up at startup when the last session was never computed
+            delay = seconds_until_next_run()
+        except Exception as e:
+            logger.error(f"Scheduled precompute failed: {str(e)}")
+            delay = min(RETRY_AFTER, seconds_until_next_run())
+        time.sleep(delay)
+
+
+def ensure_started():
+    """Start the in-process scheduler thread once (no-op unless PRECOMPUTE_SCHEDULE=1).
+
+    Called from the first request rather than at import, so a preloaded gunicorn master
+    never forks with a live thread.
+    """
+    global _thread
+    if not SCHEDULE_ENABLED or _thread is not None:
+        return
+    with _lock:
+        if _thread is None:
+            _thread = threading.Thread(target=_loop, name='precompute-scheduler', daemon=True)
+            _thread.start()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Precompute daily predictions into the predictions table.')
+    parser.add_argument('tickers', nargs='*', help='Tickers to score now (default: popular, held and PRECOMPUTE_TICKERS)')
+    parser.add_argument('--trade', action='store_true', default=TRADE, help='Also apply the paper-trading rule')
+    parser.add_argument('--workers', type=int, default=None, help='Model-fitting processes')
+    parser.add_argument('--revalue', action='store_true', help='Only mark holdings to market')
+    parser.add_argument('--loop', action='store_true', help=f'Keep running, once per weekday at {RUN_AT_UTC} UTC')
+    args = parser.parse_args(argv)
+
+    database.init_db()
+    if args.revalue:
+        result = revalue()
+        if result is None:
+            return 1
+        print(f"Revalued {result['repriced']}/{result['holdings']} holdings ({result['stale']} with stale closes "
+              f"skipped): total ${result['total_value']:,.2f}, daily return {result['daily_return']:+.2f}%")
+        return 0
+    if args.loop:
+        _loop()
+    if args.tickers:
+        # Ad-hoc runs are not tied to a session, so they never block the scheduled one
+        stored, failures = precompute([t.strip().upper() for t in args.tickers], trade=args.trade,
+                                      max_workers=args.workers)
+    else:
+        try:
+            result = run_session(trade=args.trade, max_workers=args.workers)
+        except Exception as e:
+            print(f"Precompute failed, session released for a retry: {e}", file=sys.stderr)
+            return 1
+        if result is None:
+            print("This session's predictions are already computed (or being computed).")
+            return 0
+        stored, failures = result
+    print(f"Stored {stored} predictions, {failures} failed")
+    return 1 if failures and not stored else 0
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    sys.exit(main())
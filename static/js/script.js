@@ -1,16 +1,7 @@
 document.addEventListener('DOMContentLoaded', () => {
-    let companies = [];
     const input = document.getElementById('ticker');
     const suggestions = document.getElementById('suggestions');
 
-    // Fetch companies data when the page loads
-    fetch('/api/companies')
-        .then(response => response.json())
-        .then(data => {
-            companies = data;
-        })
-        .catch(error => console.error('Error fetching companies:', error));
-
     // Debounce function to limit how often we search
     function debounce(func, wait) {
         let timeout;
@@ -24,18 +15,26 @@ document.addEventListener('DOMContentLoaded', () => {
         };
     }
 
-    const updateSuggestions = debounce(() => {
-        const value = input.value.toLowerCase();
+    const updateSuggestions = debounce(async () => {
+        const value = input.value.trim();
         suggestions.innerHTML = ''; // Clear previous suggestions
 
         if (!value) {
             return; // Don't show suggestions if input is empty
         }
 
-            const matches = companies.filter(company =>
-                company.name.toLowerCase().includes(value) ||
-                company.ticker.toLowerCase().includes(value)
-            ).slice(0, 10); // Limit to top 10 matches
+            // Search runs on the server against the full company index
+            let matches = [];
+            try {
+                const response = await fetch(`/api/companies?q=${encodeURIComponent(value)}&limit=10`);
+                matches = await response.json();
+            } catch (error) {
+                console.error('Error fetching companies:', error);
+                return;
+            }
+            if (input.value.trim() !== value) {
+                return; // A newer query is already on its way
+            }
 
             matches.forEach(company => {
                 const div = document.createElement('div');
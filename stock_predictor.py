@@ -1,12 +1,21 @@
-import pandas as pd
-import yfinance as yf
-import sqlite3
 from sklearn.ensemble import RandomForestRegressor
-from sklearn.model_selection import train_test_split
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, as_completed, wait
+import multiprocessing
+import threading
+import argparse
 import logging
 import numpy as np
 import json
-import gc
+import csv
+import os
+import sys
+import price_store
+import model_cache
+import indicators
+import metrics
+import memory
+from model_config import (DEFAULT_CONFIG, FEATURE_COLUMNS, MODEL_PARAMS, RSI_PERIOD, SMA_WINDOW,  # noqa: F401
+                          config_for, feature_columns, model_version)
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -19,124 +28,283 @@ def calculate_rsi(prices, period=14):
     rs = gain / loss
     return 100 - (100 / (1 + rs))
 
-def create_stock_graph(historical_data, predictions, ticker):
+BATCH_WORKERS = int(os.environ.get('BATCH_WORKERS', str(min(2, os.cpu_count() or 1))))
+BATCH_CHUNK = 250  # Tickers loaded and featurized together
+# Rough working set of one ticker in a batch: a year of bars through columns, features and temporaries
+BYTES_PER_TICKER = 260 * (len(FEATURE_COLUMNS) + 12) * 8
+
+def create_stock_graph(dates, closes, prediction_dates, predicted, ticker):
     """Create a lightweight graph representation without heavy plotting libraries"""
     # Return lightweight data structure instead of full plotly figure
     graph_data = {
         'ticker': ticker,
         'historical': {
-            'dates': historical_data['Date'].tail(30).tolist(),  # Only last 30 days
-            'prices': historical_data['Close'].tail(30).tolist()
+            'dates': np.datetime_as_string(dates[-30:], unit='D').tolist(),  # Only last 30 days
+            'prices': closes[-30:].tolist()
         },
         'predictions': {
-            'dates': predictions['Date'].tolist()[-10:] if len(predictions) > 10 else predictions['Date'].tolist(),  # Only last 10 predictions
-            'prices': predictions['Predicted'].tolist()[-10:] if len(predictions) > 10 else predictions['Predicted'].tolist()
+            'dates': np.datetime_as_string(prediction_dates[-10:], unit='D').tolist(),  # Only last 10 predictions
+            'prices': predicted[-10:].tolist()
         }
     }
     return graph_data
 
-def predict_next_close(ticker):
-    """Memory-optimized stock prediction function"""
-    try:
-        logger.info(f"Downloading data for {ticker}")
-        # Download only recent data to reduce memory usage (1 year instead of 5+ years)
-        data = yf.download(ticker, period='1y', auto_adjust=True)
-        if data.empty:
-            logger.error(f"No data downloaded for {ticker}")
-            return None
+def _rolling_mean(values, window, position):
+    """Trailing mean over concatenated per-ticker series; NaN until a series has `window` points"""
+    out = indicators.rolling_mean(values, window)
+    out[position < window - 1] = np.nan
+    return out
 
-        logger.info(f"Downloaded data shape: {data.shape}")
+def _feature_matrix(data, position, out=None, sma_window=SMA_WINDOW, rsi_period=RSI_PERIOD):
+    """Compute FEATURE_COLUMNS for one or many tickers stacked end to end in a single vectorized pass
 
-        # Clean up column names
-        data.columns = data.columns.get_level_values(0) if hasattr(data.columns, 'levels') else data.columns
-        
-        # Use memory mapping for database operations
-        db_path = "stocks.db"
-        with sqlite3.connect(db_path) as conn:
-            data.reset_index(inplace=True)
-            # Only store essential columns to save space
-            essential_data = data[['Date', 'Open', 'High', 'Low', 'Close', 'Volume']].copy()
-            essential_data.to_sql(f"{ticker}_temp", conn, if_exists='replace', index=False)
-            
-            # Load data back with chunking for large datasets
-            loaded_data = pd.read_sql_query(f"SELECT * FROM {ticker}_temp", conn)
-            
-            # Clean up temp table immediately
-            conn.execute(f"DROP TABLE IF EXISTS {ticker}_temp")
-
-        # Convert to numeric and handle errors efficiently
-        numeric_cols = ['Open', 'High', 'Low', 'Close', 'Volume']
-        for col in numeric_cols:
-            loaded_data[col] = pd.to_numeric(loaded_data[col], errors='coerce')
-
-        # Add minimal technical indicators (reduce memory footprint)
-        loaded_data['SMA_5'] = loaded_data['Close'].rolling(window=5).mean()
-        loaded_data['RSI'] = calculate_rsi(loaded_data['Close'], period=14)
-        
-        # Drop intermediate calculations from memory
-        del data
-        gc.collect()
-        
-        # Drop rows with NaN values
-        loaded_data = loaded_data.dropna()
-        
-        # Use fewer features to reduce model complexity and memory
-        feature_columns = ['Open', 'High', 'Low', 'Volume', 'SMA_5', 'RSI']
-        X = loaded_data[feature_columns].copy()
-        y = loaded_data['Close'].copy()
-
-        # Check for sufficient data
-        if len(y) < 30:
-            logger.error("Insufficient data points")
-            return None
-            
-        # Use smaller train/test split and simpler model
-        test_size = min(0.2, 50/len(y))  # Max 50 test samples or 20%
-        X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=test_size, shuffle=False)
-        
-        # Use smaller, more memory-efficient model
-        model = RandomForestRegressor(n_estimators=50, max_depth=10, random_state=42)
-        model.fit(X_train, y_train)
-        
-        # Calculate simple feature importance without SHAP (memory heavy)
-        feature_importance = dict(zip(feature_columns, model.feature_importances_))
+    `data` is a DataFrame or a {column: array} mapping such as price_store.load_columns returns.
+    """
+    close = np.asarray(data['Close'], dtype=np.float64)
+
+    # Feature matrix in FEATURE_COLUMNS order, filled column by column into one contiguous block
+    X = out if out is not None else np.empty((len(close), len(FEATURE_COLUMNS)), dtype=np.float64)
+    X[:, 0] = data['Open']
+    X[:, 1] = data['High']
+    X[:, 2] = data['Low']
+    X[:, 3] = data['Volume']
+    X[:, 4] = _rolling_mean(close, sma_window, position)
+
+    # Same RSI as calculate_rsi; the first change of each series counts as neither gain nor loss
+    delta = np.diff(close, prepend=np.nan)
+    delta[position == 0] = np.nan
+    gain = np.where(delta > 0, delta, 0.0)
+    loss = np.where(delta < 0, -delta, 0.0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rs = _rolling_mean(gain, rsi_period, position) / _rolling_mean(loss, rsi_period, position)
+        X[:, 5] = 100 - (100 / (1 + rs))
+
+    # Rows where any feature or the target is missing (indicator warm-up, bad ticks) get dropped
+    valid = np.isfinite(X).all(axis=1) & np.isfinite(close)
+    return X, close, np.asarray(data['Date'], dtype='datetime64[D]'), valid
+
+def build_features(data, sma_window=SMA_WINDOW, rsi_period=RSI_PERIOD):
+    """Build float64 feature/target arrays straight from a raw OHLCV frame (no database round-trip)"""
+    n = len(data['Close'])
+    # The full matrix is scratch: boolean indexing below hands back a fresh copy of the valid rows
+    X, close, dates, valid = _feature_matrix(data, np.arange(n), memory.scratch('features', (n, len(FEATURE_COLUMNS))),
+                                             sma_window, rsi_period)
+    return X[valid], close[valid], dates[valid]
+
+def build_features_many(prices, sma_window=SMA_WINDOW, rsi_period=RSI_PERIOD):
+    """Build feature arrays for every ticker in a long Ticker/Date frame or column mapping (sorted by ticker, then date)"""
+    tickers = np.asarray(prices['Ticker'])
+    if len(tickers) == 0:
+        return {}
+    starts = np.flatnonzero(np.r_[True, tickers[1:] != tickers[:-1]])
+    lengths = np.diff(np.r_[starts, len(tickers)])
+    position = np.arange(len(tickers)) - np.repeat(starts, lengths)
+
+    X, close, dates, valid = _feature_matrix(prices, position,
+                                            memory.scratch('features', (len(tickers), len(FEATURE_COLUMNS))),
+                                            sma_window, rsi_period)
+    features = {}
+    for start, length in zip(starts, lengths):
+        rows = slice(start, start + length)
+        keep = valid[rows]
+        features[tickers[start]] = (X[rows][keep], close[rows][keep], dates[rows][keep])
+    return features
+
+def _fit_and_predict(ticker, X, y, dates, config=DEFAULT_CONFIG):
+    """Fit (or reuse) the forest on prepared arrays and score the next close"""
+    params = config['params']
+    columns = feature_columns(config['sma_window'], config['rsi_period'])
+    # Check for sufficient data
+    if len(y) < 30:
+        logger.error("Insufficient data points")
+        return None
         
+    # Use smaller train/test split and simpler model (same chronological split as train_test_split(shuffle=False))
+    test_size = min(0.2, 50/len(y))  # Max 50 test samples or 20%
+    n_test = int(np.ceil(test_size * len(y)))
+    n_train = len(y) - n_test
+    
+    # Reuse the fitted model when the data hasn't changed since the last call (same trading day)
+    cache_key = model_cache.make_key(ticker, dates[-1], columns, params, model_cache.fingerprint(X, y))
+    with metrics.span('fit'):
+        model = model_cache.get_model(cache_key)
+        if model is None:
+            # Use smaller, more memory-efficient model
+            model = RandomForestRegressor(**params)
+            model.fit(X[:n_train], y[:n_train])
+            model_cache.put_model(cache_key, model)
+        else:
+            logger.info(f"Using cached model for {ticker} ({model_cache.stats()})")
+    
+    # Calculate simple feature importance without SHAP (memory heavy)
+    feature_importance = dict(zip(columns, model.feature_importances_))
+    
+    with metrics.span('predict'):
         # Make predictions for graph (limit to recent data only)
-        recent_indices = X_test.index[-min(20, len(X_test)):]  # Only last 20 predictions
-        X_test_recent = X_test.loc[recent_indices]
-        
-        predictions = pd.DataFrame(index=recent_indices)
-        predictions['Date'] = loaded_data.loc[recent_indices, 'Date'].values
-        predictions['Predicted'] = model.predict(X_test_recent)
+        recent = slice(len(y) - min(20, n_test), len(y))  # Only last 20 predictions
+        recent_predictions = model.predict(X[recent])
         
         # Generate lightweight graph data
-        graph_data = create_stock_graph(loaded_data, predictions, ticker)
+        graph_data = create_stock_graph(dates, y, dates[recent], recent_predictions, ticker)
         
         # Make prediction for next day using the trained model (no retraining)
-        last_data = X.iloc[-1:].copy()
-        prediction = model.predict(last_data)[0]
-        last_close = y.iloc[-1]
-        
-        # Calculate simple confidence score based on recent prediction accuracy
-        if len(X_test_recent) > 0:
-            recent_predictions = model.predict(X_test_recent)
-            recent_actual = y.loc[recent_indices].values
-            mae = np.mean(np.abs(recent_predictions - recent_actual))
-            confidence_score = max(0.1, 1.0 - (mae / np.mean(recent_actual)))
-        else:
-            confidence_score = 0.5  # Default confidence
-        
-        # Clean up memory
-        del loaded_data, X, y, X_train, X_test, y_train, y_test
-        gc.collect()
-        
-        logger.info(f"Prediction: {prediction:.2f}, Last Close: {last_close:.2f}")
-        return prediction, last_close, confidence_score, feature_importance, graph_data
+        prediction = model.predict(X[-1:])[0]
+        last_close = y[-1]
+    
+    # Calculate simple confidence score based on recent prediction accuracy
+    if len(recent_predictions) > 0:
+        recent_actual = y[recent]
+        mae = np.mean(np.abs(recent_predictions - recent_actual))
+        confidence_score = max(0.1, 1.0 - (mae / np.mean(recent_actual)))
+    else:
+        confidence_score = 0.5  # Default confidence
+    
+    logger.info(f"Prediction: {prediction:.2f}, Last Close: {last_close:.2f}")
+    return prediction, last_close, confidence_score, feature_importance, graph_data
+
+def predict_next_close(ticker):
+    """Memory-optimized stock prediction function"""
+    try:
+        logger.info(f"Loading data for {ticker}")
+        # Serve the last year from the local price store; only bars newer than the last stored day are fetched.
+        # The columns are memory-mapped views, copied once straight into the feature matrix
+        with metrics.span('fetch'):
+            price_store.refresh(ticker)
+        with metrics.span('load'):
+            data = price_store.load_columns(ticker, days=price_store.HISTORY_DAYS, refresh_first=False)
+        if len(data['Close']) == 0:
+            logger.error(f"No data available for {ticker}")
+            return None
+
+        logger.info(f"Loaded {len(data['Close'])} bars")
+
+        # Features go straight from the columns into typed arrays; nothing is written to stocks.db
+        config = config_for(ticker)
+        with metrics.span('features'):
+            X, y, dates = build_features(data, config['sma_window'], config['rsi_period'])
+        del data
+
+        return _fit_and_predict(ticker, X, y, dates, config)
 
     except Exception as e:
         logger.error(f"Error in predict_next_close: {str(e)}")
         return None
 
+def _score_ticker(ticker, X, y, dates, details=False, config=DEFAULT_CONFIG):
+    """Process-pool task: score one ticker and return a JSON-ready result (with graph data if `details`)"""
+    try:
+        result = _fit_and_predict(ticker, X, y, dates, config)
+    except Exception as e:
+        return {'ticker': ticker, 'error': str(e)}
+    if result is None:
+        return {'ticker': ticker, 'error': 'Insufficient data points'}
+    prediction, last_close, confidence_score, feature_importance, graph_data = result
+    scored = {
+        'ticker': ticker,
+        'prediction': float(prediction),
+        'last_close': float(last_close),
+        'direction': 'rise' if prediction > last_close else 'fall or stay the same',
+        'confidence': float(confidence_score),
+        'last_bar_date': str(dates[-1]),
+        'model_version': model_version(config),
+        'feature_importance': {name: float(value) for name, value in feature_importance.items()},
+    }
+    if details:
+        scored['graph_data'] = graph_data
+    return scored
+
+def predict_many(tickers, max_workers=None, chunk_size=BATCH_CHUNK, details=False):
+    """Score many tickers in one pass, yielding each result as soon as its model finishes
+
+    Without `max_workers` the fits go to the shared pool, so concurrent batches (e.g. several
+    /api/predict/batch requests) never start more than BATCH_WORKERS processes between them.
+    """
+    tickers = list(dict.fromkeys(t.strip().upper() for t in tickers if t and t.strip()))
+    # Load fewer tickers at a time when the process is close to its RSS budget
+    chunk_size = memory.batch_size(BYTES_PER_TICKER, chunk_size)
+
+    if max_workers:
+        pool = ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context('spawn'))
+    else:
+        pool, max_workers = _shared_pool(), BATCH_WORKERS
+    pending = set()
+    try:
+        for i in range(0, len(tickers), chunk_size):
+            chunk = tickers[i:i + chunk_size]
+            configs = {ticker: config_for(ticker) for ticker in chunk}
+            # Tickers sharing indicator windows (tuned or default) are loaded and featurized together
+            groups = {}
+            for ticker in chunk:
+                groups.setdefault((configs[ticker]['sma_window'], configs[ticker]['rsi_period']), []).append(ticker)
+            features = {}
+            for (sma_window, rsi_period), group in groups.items():
+                try:
+                    features.update(build_features_many(price_store.load_columns_many(group), sma_window, rsi_period))
+                except Exception as e:
+                    logger.error(f"Error loading batch starting at {group[0]}: {str(e)}")
+
+            for ticker in chunk:
+                if ticker not in features:
+                    yield {'ticker': ticker, 'error': 'No data available'}
+                    continue
+                config = configs[ticker]
+                # Bound in-flight fits so memory stays flat across the whole universe
+                while len(pending) >= max_workers * 2:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        yield future.result()
+                pending.add(pool.submit(_score_ticker, ticker, *features.pop(ticker), details, config))
+
+        for future in as_completed(pending):
+            yield future.result()
+    finally:
+        if pool is _pool:
+            # A closed stream (client gone) drops its queued fits; the shared pool stays up
+            for future in pending:
+                future.cancel()
+        else:
+            pool.shutdown(wait=True, cancel_futures=True)
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def _shared_pool():
+    """One spawn pool of BATCH_WORKERS processes for the whole process, started on first use"""
+    global _pool
+    with _pool_lock:
+        if _pool is None or _pool._broken:
+            # spawn keeps workers safe to start from a threaded gunicorn process
+            _pool = ProcessPoolExecutor(max_workers=BATCH_WORKERS, mp_context=multiprocessing.get_context('spawn'))
+        return _pool
+
+def load_universe(path='static/companies.csv'):
+    """Read every ticker from the companies CSV"""
+    with open(path, newline='', encoding='utf-8') as f:
+        return [row['ticker'] for row in csv.DictReader(f) if row.get('ticker')]
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Predict next-day closes; batch results are written as NDJSON.')
+    parser.add_argument('tickers', nargs='*', help='Ticker symbols to score')
+    parser.add_argument('--all', action='store_true', help='Score every ticker in static/companies.csv')
+    parser.add_argument('--file', help='Read tickers from a file, one per line')
+    parser.add_argument('--workers', type=int, default=None, help=f'Model-fitting processes (default {BATCH_WORKERS})')
+    args = parser.parse_args(argv)
+
+    tickers = list(args.tickers)
+    if args.file:
+        with open(args.file) as f:
+            tickers += [line.strip() for line in f if line.strip()]
+    if args.all:
+        tickers += load_universe()
+
+    if not tickers:
+        result = predict_next_close('AAPL')
+        print(f"Prediction result: {result}")
+        return
+
+    for result in predict_many(tickers, max_workers=args.workers):
+        sys.stdout.write(json.dumps(result) + '\n')
+        sys.stdout.flush()
+
 if __name__ == "__main__":
-    result = predict_next_close('AAPL')
-    print(f"Prediction result: {result}")
\ No newline at end of file
+    main()
@@ -0,0 +1,224 @@
+import os
+import csv
+import sys
+import json
+import time
+import logging
+import argparse
+import itertools
+import threading
+from datetime import date, datetime, timedelta, timezone
+
+import numpy as np
+from joblib import Parallel, delayed
+from sklearn.ensemble import RandomForestRegressor
+
+import price_store
+from forecasting import jobs_from_env
+from model_config import MODEL_CONFIG_PATH, MODEL_PARAMS, RSI_PERIOD, SMA_WINDOW
+from stock_predictor import build_features
+
+logger = logging.getLogger(__name__)
+
+# Expanding-window time-series CV of the live predictor's forest over a grid of forest and
+# indicator settings. Fold k trains on every row before its test window and scores the next
+# TEST_ROWS rows, so each model is only ever scored on days after everything it trained on.
+TUNE_DAYS = 3 * 365       # Calendar days of history to cross-validate over
+N_FOLDS = 5
+TEST_ROWS = 50            # Rows per test window, the live predictor's hold-out size
+MIN_TRAIN_ROWS = 100      # Rows the first fold trains on at the least
+N_JOBS = jobs_from_env('TUNE_JOBS')
+
+# Tree counts are not separate candidates: one warm-started forest per fold grows through them in order
+TREE_COUNTS = (25, 50, 100, 200)
+FOREST_GRID = {'max_depth': (5, 10, None), 'min_samples_leaf': (1, 5), 'max_features': (1.0, 0.5)}
+FEATURE_GRID = {'sma_window': (5, 10, 20), 'rsi_period': (7, 14)}
+# The live predictor's settings, reported next to the winner
+BASELINE = ((SMA_WINDOW, RSI_PERIOD), {'max_depth': MODEL_PARAMS['max_depth'], 'min_samples_leaf': 1,
+                                       'max_features': 1.0}, MODEL_PARAMS['n_estimators'])
+
+
+def grid(params):
+    """Every combination of a {name: values} grid, as dicts."""
+    names = sorted(params)
+    return [dict(zip(names, values)) for values in itertools.product(*(params[name] for name in names))]
+
+
+def folds(n_rows, n_folds=N_FOLDS, test_rows=TEST_ROWS):
+    """(train_end, test_end) per fold: train on rows [0, train_end), score rows [train_end, test_end)."""
+    test_rows = min(test_rows, (n_rows - MIN_TRAIN_ROWS) // n_folds)
+    if test_rows < 1:
+        return []
+    first = n_rows - n_folds * test_rows
+    return [(first + k * test_rows, first + (k + 1) * test_rows) for k in range(n_folds)]
+
+
+def feature_sets(data, settings):
+    """(X, y) per (sma_window, rsi_period), built once per ticker and shared by every fold and candidate.
+
+    Rows are restricted to the dates every setting has, so longer indicator warm-ups don't
+    shift the folds and all settings are scored on the same days.
+    """
+    built = {setting: build_features(data, *setting) for setting in settings}
+    common = None
+    for _, _, dates in built.values():
+        common = dates if common is None else np.intersect1d(common, dates)
+    cache = {}
+    for setting, (X, y, dates) in built.items():
+        keep = np.isin(dates, common)
+        cache[setting] = (X[keep], y[keep])
+    return cache, common
+
+
+def _score_fold(X, y, train_end, test_end, forest, tree_counts=TREE_COUNTS):
+    """Relative MAE (MAE / mean close) of one candidate on one fold at every tree count.
+
+    The forest is warm-started, so each count only grows the trees beyond the previous one,
+    and only the new trees' test predictions are added to the running sum.
+    """
+    model = RandomForestRegressor(warm_start=True, random_state=MODEL_PARAMS['random_state'], **forest)
+    X_test, y_test = X[train_end:test_end], y[train_end:test_end]
+    total = np.zeros(len(y_test))
+    errors = []
+    for n_trees in tree_counts:
+        grown = len(getattr(model, 'estimators_', ()))
+        model.set_params(n_estimators=n_trees)
+        model.fit(X[:train_end], y[:train_end])
+        for tree in model.estimators_[grown:]:
+            total += tree.predict(X_test)
+        errors.append(np.mean(np.abs(total / n_trees - y_test)) / np.mean(y_test))
+    return errors
+
+
+def load(ticker, days=TUNE_DAYS):
+    """Refresh and backfill the ticker's store, then return its columns."""
+    price_store.refresh(ticker)
+    price_store.backfill([ticker], date.today() - timedelta(days=days))
+    return price_store.load_columns(ticker, days=days, refresh_first=False)
+
+
+def cross_validate(tickers, forest_grid=FOREST_GRID, feature_grid=FEATURE_GRID, tree_counts=TREE_COUNTS,
+                   days=TUNE_DAYS, n_folds=N_FOLDS, n_jobs=N_JOBS):
+    """Relative MAE for every ticker x setting x candidate x fold x tree count.
+
+    Returns ({ticker: array of shape (settings, candidates, folds, tree counts)}, settings, candidates).
+    Every (ticker, setting, candidate, fold) is one task; all of them run in one pool.
+    """
+    settings = [(s['sma_window'], s['rsi_period']) for s in grid(feature_grid)]
+    candidates = grid(forest_grid)
+    tasks, shapes = [], {}
+    for ticker in tickers:
+        try:
+            cache, dates = feature_sets(load(ticker, days), settings)
+        except Exception as e:
+            logger.error(f"Error loading {ticker}: {str(e)}")
+            continue
+        bounds = folds(len(dates), n_folds)
+        if not bounds:
+            logger.warning(f"Not enough history to tune {ticker} ({len(dates)} rows)")
+            continue
+        shapes[ticker] = len(bounds)
+        for (s, setting), (c, forest), (f, (train_end, test_end)) in itertools.product(
+                enumerate(settings), enumerate(candidates), enumerate(bounds)):
+            tasks.append(((ticker, s, c, f), (*cache[setting], train_end, test_end, forest, tree_counts)))
+
+    logger.info(f"Cross-validating {len(tasks)} fits over {len(shapes)} ticker(s) with {n_jobs} job(s)")
+    scores = Parallel(n_jobs=n_jobs)(delayed(_score_fold)(*args) for _, args in tasks)
+
+    results = {ticker: np.full((len(settings), len(candidates), n_folds, len(tree_counts)), np.nan)
+               for ticker in shapes}
+    for ((ticker, s, c, f), _), errors in zip(tasks, scores):
+        results[ticker][s, c, f] = errors
+    return results, settings, candidates
+
+
+def best_config(errors, settings, candidates, tree_counts=TREE_COUNTS):
+    """Config with the lowest mean relative MAE over the folds (and tickers) stacked in `errors`."""
+    mean = np.nanmean(errors, axis=-2)  # (..., settings, candidates, tree counts) after the folds
+    mean = mean.reshape(-1, *mean.shape[-3:]).mean(axis=0)
+    s, c, t = np.unravel_index(np.argmin(mean), mean.shape)
+    setting, forest, n_trees = settings[s], candidates[c], tree_counts[t]
+    entry = {
+        'params': dict(forest, n_estimators=n_trees, random_state=MODEL_PARAMS['random_state']),
+        'sma_window': setting[0],
+        'rsi_period': setting[1],
+        'cv_relative_mae': float(mean[s, c, t]),
+        'cv_confidence': max(0.1, 1.0 - float(mean[s, c, t])),  # Same form as the live confidence score
+        'tuned_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+    }
+    base_setting, base_forest, base_trees = BASELINE
+    if base_setting in settings and base_forest in candidates and base_trees in tree_counts:
+        entry['baseline_relative_mae'] = float(mean[settings.index(base_setting), candidates.index(base_forest),
+                                                    tree_counts.index(base_trees)])
+    return entry
+
+
+def save(kind, entries, path=MODEL_CONFIG_PATH):
+    """Merge {name: config} into the 'tickers' or 'sectors' section of the config file."""
+    try:
+        with open(path) as f:
+            configs = json.load(f)
+    except FileNotFoundError:
+        configs = {}
+    configs.setdefault(kind, {}).update(entries)
+    # Write-then-rename, so a predictor reading the file never sees half of it
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp, 'w') as f:
+        json.dump(configs, f, indent=2, sort_keys=True)
+    os.replace(tmp, path)
+
+
+def sector_tickers(sector, limit, path='static/companies.csv'):
+    """The sector's largest companies by market cap."""
+    with open(path, newline='', encoding='utf-8') as f:
+        rows = [row for row in csv.DictReader(f) if row.get('ticker') and row.get('sector') == sector]
+    rows.sort(key=lambda row: float(row.get('market_cap') or 0), reverse=True)
+    return [row['ticker'] for row in rows[:limit]]
+
+
+def tune(tickers, sector=None, days=TUNE_DAYS, n_folds=N_FOLDS, n_jobs=N_JOBS, path=MODEL_CONFIG_PATH, dry_run=False):
+    """Cross-validate and save the best config per ticker, or one pooled config for `sector`."""
+    results, settings, candidates = cross_validate(tickers, days=days, n_folds=n_folds, n_jobs=n_jobs)
+    if not results:
+        return {}
+    if sector:
+        entry = best_config(np.stack(list(results.values())), settings, candidates)
+        entries = {sector: dict(entry, tickers=sorted(results))}
+    else:
+        entries = {ticker: best_config(errors, settings, candidates) for ticker, errors in results.items()}
+    if not dry_run:
+        save('sectors' if sector else 'tickers', entries, path)
+    return entries
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Tune the predictor with expanding-window time-series CV.')
+    parser.add_argument('tickers', nargs='*', help='Tickers to tune one config each for (or the sector members)')
+    parser.add_argument('--sector', help='Tune one config for a sector, shared by every ticker in it')
+    parser.add_argument('--top', type=int, default=10, help='Largest sector members to tune on when no tickers are given')
+    parser.add_argument('--days', type=int, default=TUNE_DAYS)
+    parser.add_argument('--folds', type=int, default=N_FOLDS)
+    parser.add_argument('--jobs', type=int, default=N_JOBS)
+    parser.add_argument('--output', default=MODEL_CONFIG_PATH, help='Config file the predictor reads')
+    parser.add_argument('--dry-run', action='store_true', help='Print the results without saving them')
+    args = parser.parse_args(argv)
+
+    tickers = [t.strip().upper() for t in args.tickers]
+    if args.sector and not tickers:
+        tickers = sector_tickers(args.sector, args.top)
+    if not tickers:
+        parser.error('give tickers or --sector')
+
+    started = time.perf_counter()
+    entries = tune(tickers, sector=args.sector, days=args.days, n_folds=args.folds, n_jobs=args.jobs,
+                   path=args.output, dry_run=args.dry_run)
+    print(json.dumps(entries, indent=2))
+    print(f"Tuned {len(entries)} config(s) in {time.perf_counter() - started:.1f}s")
+    if entries and not args.dry_run:
+        print(f"Saved to {args.output}")
+    return 0 if entries else 1
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    sys.exit(main())